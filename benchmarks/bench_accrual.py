@@ -0,0 +1,43 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+from amounts import to_units
+from blockchain import Ledger
+from contracts import SECONDS_PER_YEAR, LendingPool
+
+
+def build_pool(n_positions):
+    pool = LendingPool(Ledger())
+    debt = to_units(10, "USDC")
+    pool.total_liquidity = debt * n_positions
+    for i in range(n_positions):
+        pool.user_positions[f"user{i}"] = {"collateral": to_units(1, "ETH"), "borrowed": debt, "interest_index": pool.borrow_index}
+    pool.total_borrowed = debt * n_positions
+    return pool
+
+
+def catch_up_us(pool, seconds, runs=2_000):
+    # Each run starts from the same index so the integers stay the same size.
+    state = (pool.borrow_index, pool.total_borrowed, pool.total_liquidity)
+    total = 0
+    for _ in range(runs):
+        pool.borrow_index, pool.total_borrowed, pool.total_liquidity = state
+        pool.clock.advance(seconds)
+        start = time.perf_counter_ns()
+        pool.accrue_interest()
+        total += time.perf_counter_ns() - start
+    return total / runs / 1e3
+
+
+def main():
+    spans = (("1 s", 1), ("1 day", 86_400), ("1 year", SECONDS_PER_YEAR), ("100 years", 100 * SECONDS_PER_YEAR))
+    print(f"{'positions':>10}" + "".join(f"{label + ' (us)':>16}" for label, _ in spans))
+    for n in (10, 1_000, 100_000, 1_000_000):
+        pool = build_pool(n)
+        print(f"{n:>10}" + "".join(f"{catch_up_us(pool, seconds):>16.3f}" for _, seconds in spans))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+from crypto import Wallet
+from blockchain import Ledger, Transaction
+
+
+def build_block(n_txs, n_senders=16):
+    wallets = [Wallet() for _ in range(n_senders)]
+    ledger = Ledger()
+    txs = []
+    for i in range(n_txs):
+        wallet = wallets[i % n_senders]
+        sender = wallet.get_public_key_hex()
+        ledger.update_balance(sender, 1)
+        tx = Transaction(sender, "RECEIVER", 1)
+        tx.sign(wallet)
+        txs.append(tx)
+    return ledger, txs
+
+
+def main(n_txs=2000):
+    ledger, txs = build_block(n_txs)
+    start = time.perf_counter()
+    for tx in txs:
+        tx.is_valid()
+    serial = time.perf_counter() - start
+    print(f"serial verify: {n_txs / serial:,.0f} tx/s")
+
+    for workers in sorted({1, 2, 4, os.cpu_count() or 1}):
+        # the ledger's pool is started once, outside the timed batches
+        executor = ledger.verify_pool(workers)
+        ledger._verify_signatures(txs[:workers], executor=executor)
+        start = time.perf_counter()
+        for _ in range(3):
+            ledger._verify_signatures(txs, workers=workers)
+        elapsed = (time.perf_counter() - start) / 3
+        print(f"process_batch verify, {workers} workers: {n_txs / elapsed:,.0f} tx/s")
+    ledger.close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
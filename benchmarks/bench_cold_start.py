@@ -0,0 +1,69 @@
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+from blockchain import Ledger, Transaction
+from contracts import LendingPool
+from storage import Store
+
+N_ACCOUNTS = 10_000
+
+
+def write_history(directory, n_txs, snapshot_interval):
+    # Transactions go straight to the log: signing 10M txs would dominate the
+    # run, and replay does not re-verify signatures anyway.
+    ledger = Ledger()
+    pool = LendingPool(ledger)
+    store = Store(directory, snapshot_interval=snapshot_interval)
+    store.open(ledger, [pool])
+    fund(ledger, n_txs)
+
+    start = time.perf_counter()
+    for i in range(n_txs):
+        tx = Transaction(f"acct{i % N_ACCOUNTS}", f"acct{(i * 7 + 1) % N_ACCOUNTS}", 1, signature="00", nonce=i // N_ACCOUNTS)
+        ledger._apply(tx)
+    ledger.chain.clear()
+    store.close()
+    elapsed = time.perf_counter() - start
+    print(f"wrote {n_txs:,} txs in {elapsed:.1f}s")
+    return ledger.state
+
+
+def fund(ledger, n_txs):
+    for i in range(N_ACCOUNTS):
+        ledger.update_balance(f"acct{i}", n_txs)
+
+
+def cold_start(directory, genesis=None):
+    ledger = Ledger()
+    if genesis is not None:
+        fund(ledger, genesis)
+    start = time.perf_counter()
+    store = Store(directory)
+    store.open(ledger, [LendingPool(ledger)])
+    elapsed = time.perf_counter() - start
+    store.log.close()
+    return ledger, elapsed
+
+
+def main(n_txs=1_000_000):
+    with tempfile.TemporaryDirectory() as directory:
+        expected = write_history(directory, n_txs, snapshot_interval=max(1, n_txs // 10))
+
+        ledger, elapsed = cold_start(directory)
+        assert ledger.state == expected
+        print(f"cold start from latest snapshot: {elapsed * 1e3:,.1f} ms")
+
+        for name in os.listdir(directory):
+            if name.startswith("snapshot-"):
+                os.remove(os.path.join(directory, name))
+        ledger, elapsed = cold_start(directory, genesis=n_txs)
+        assert ledger.state == expected
+        print(f"cold start replaying full log:   {elapsed * 1e3:,.1f} ms ({n_txs / elapsed:,.0f} tx/s)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
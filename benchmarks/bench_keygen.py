@@ -0,0 +1,31 @@
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+from crypto import KeyCache, Wallet
+
+
+def timed(label, n, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed:>8.2f}s {n / elapsed:>12,.0f} wallets/s")
+
+
+def main(n=10_000):
+    timed("Wallet() loop", n, lambda: [Wallet() for _ in range(n)])
+    timed("generate_many, 1 process", n, lambda: Wallet.generate_many(n, seed="bench", workers=1))
+    workers = os.cpu_count() or 1
+    timed(f"generate_many, {workers} processes", n, lambda: Wallet.generate_many(n, seed="bench", workers=workers))
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = KeyCache(directory)
+        timed("generate_many, cold cache", n, lambda: Wallet.generate_many(n, seed="bench", cache=cache))
+        timed("generate_many, warm cache", n, lambda: Wallet.generate_many(n, seed="bench", cache=cache))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
@@ -0,0 +1,50 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+from amounts import to_units
+from blockchain import Ledger
+from contracts import LendingPool
+
+N_AT_RISK = 100
+
+
+def build_pool(n_positions):
+    # Healthy positions borrow 1000 against 1 ETH; the first N_AT_RISK borrow
+    # 1500 and cross the threshold once ETH drops below 1875.
+    ledger = Ledger()
+    pool = LendingPool(ledger)
+    for i in range(n_positions):
+        address = f"user{i}"
+        debt = to_units(1500 if i < N_AT_RISK else 1000, "USDC")
+        position = {"collateral": to_units(1, "ETH"), "borrowed": debt, "interest_index": pool.borrow_index}
+        pool.user_positions[address] = position
+        pool._sync_risk(address, position)
+        pool.total_borrowed += debt
+    pool.total_liquidity = pool.total_borrowed
+    ledger.update_balance(pool.pool_address, to_units(n_positions, "ETH"), "ETH")
+    ledger.update_balance("liquidator", to_units(10 ** 12, "USDC"), "USDC")
+    return pool
+
+
+def main():
+    print(f"{'positions':>10} {'scan (ms)':>10} {'sweep (ms)':>11} {'liquidated':>11}")
+    for n in (10_000, 100_000, 1_000_000):
+        pool = build_pool(n)
+        pool.price_feed.set_price("ETH", 1800.0)
+
+        start = time.perf_counter()
+        crossed = pool.liquidatable_positions()
+        scan = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = pool.liquidate_all("liquidator")
+        sweep = time.perf_counter() - start
+        assert len(crossed) == len(results) == N_AT_RISK
+        print(f"{n:>10} {scan * 1e3:>10.3f} {sweep * 1e3:>11.3f} {len(results):>11}")
+
+
+if __name__ == "__main__":
+    main()
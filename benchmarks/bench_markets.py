@@ -0,0 +1,63 @@
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+from amounts import RAY, mul_div, ray_mul, to_ray
+from blockchain import Ledger
+from markets import MarketRegistry
+from risk import StaticPriceFeed
+
+
+def build(n_markets, n_accounts, markets_per_account=3, seed=0):
+    # Positions are written directly: funding and moving tokens through the
+    # ledger would dominate setup and is not what is measured.
+    rng = random.Random(seed)
+    assets = [f"TKN{i}" for i in range(n_markets)]
+    registry = MarketRegistry(Ledger(), StaticPriceFeed({asset: rng.uniform(0.5, 100.0) for asset in assets}))
+    for asset in assets:
+        registry.add_market(asset)
+    for a in range(n_accounts):
+        address = f"acct{a}"
+        for asset in rng.sample(assets, markets_per_account):
+            registry._index(address, asset)
+            registry.markets[asset].user_positions[address] = {"collateral": 10 ** 18, "borrowed": 10 ** 17, "interest_index": RAY}
+    return registry
+
+
+def health_by_scanning_markets(registry, address):
+    # The layout this replaces: positions keyed per market, so an account's
+    # health has to look in every market.
+    liquidation_value = debt_value = 0
+    for asset, market in registry.markets.items():
+        position = market.user_positions.get(address)
+        if position is None:
+            continue
+        price = to_ray(registry.price_feed.get_price(asset))
+        liquidation_value += ray_mul(position["collateral"] * price // market.scale, market.liquidation_threshold)
+        debt_value += mul_div(position["borrowed"], market.borrow_index, position["interest_index"]) * price // market.scale
+    return liquidation_value / debt_value if debt_value else float('inf')
+
+
+def main(n_accounts=20_000):
+    print(f"{'markets':>8} {'indexed (us)':>13} {'scan all (us)':>14}")
+    for n_markets in (5, 50, 500):
+        registry = build(n_markets, n_accounts)
+        addresses = [f"acct{a}" for a in range(0, n_accounts, 10)]
+
+        start = time.perf_counter()
+        for address in addresses:
+            registry.health_factor(address)
+        indexed = (time.perf_counter() - start) / len(addresses)
+
+        start = time.perf_counter()
+        for address in addresses:
+            health_by_scanning_markets(registry, address)
+        scanned = (time.perf_counter() - start) / len(addresses)
+        print(f"{n_markets:>8} {indexed * 1e6:>13.1f} {scanned * 1e6:>14.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20_000)
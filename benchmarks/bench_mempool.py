@@ -0,0 +1,65 @@
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+from crypto import Wallet
+from amounts import to_units
+from blockchain import Ledger, Transaction
+from mempool import BlockProducer, Mempool
+
+
+def build_txs(n_txs, n_senders, seed=0):
+    rng = random.Random(seed)
+    ledger = Ledger()
+    wallets = Wallet.generate_many(n_senders, seed="bench_mempool")
+    nonces = [0] * n_senders
+    txs = []
+    for wallet in wallets:
+        ledger.update_balance(wallet.address, to_units(n_txs, "ETH"))
+    for _ in range(n_txs):
+        i = rng.randrange(n_senders)
+        fee = to_units(rng.choice((0, "0.001", "0.01")), "ETH")
+        tx = Transaction(wallets[i].address, "RECEIVER", to_units("0.5", "ETH"), fee=fee, nonce=nonces[i])
+        nonces[i] += 1
+        tx.sign(wallets[i])
+        txs.append(tx)
+    return ledger, txs
+
+
+async def load(ledger, txs, submitters, max_size, block_size):
+    mempool = Mempool(max_size=max_size)
+    producer = BlockProducer(ledger, mempool, block_size=block_size, interval=0.01)
+    producer_task = asyncio.create_task(producer.run())
+
+    async def submitter(chunk):
+        futures = [await mempool.submit(tx) for tx in chunk]
+        await asyncio.gather(*futures)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(submitter(txs[i::submitters]) for i in range(submitters)))
+    elapsed = time.perf_counter() - start
+    producer.stop()
+    await producer_task
+    return elapsed, producer.metrics()
+
+
+def main(n_txs=2000, n_senders=50, submitters=100):
+    print(f"signing {n_txs:,} transactions...")
+    for max_size in (n_txs, n_txs // 10):
+        ledger, txs = build_txs(n_txs, n_senders)
+        elapsed, metrics = asyncio.run(load(ledger, txs, submitters, max_size=max_size, block_size=500))
+        ledger.close()
+        latency = metrics["latency_ms"]
+        print(
+            f"max_size={max_size:>6}: {n_txs / elapsed:,.0f} tx/s confirmed, "
+            f"blocks {metrics['blocks']}, max depth {metrics['max_queue_depth']}, "
+            f"latency p50 {latency['p50']:.0f} ms p99 {latency['p99']:.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,37 @@
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+from blockchain import Ledger
+from merkle import SparseMerkleTree
+
+
+def main(n_accounts=100_000, block_size=500, blocks=20):
+    rng = random.Random(0)
+    ledger = Ledger()
+    for i in range(n_accounts):
+        ledger.update_balance("acct-%d" % i, rng.randint(1, 1000), "USDC")
+
+    start = time.perf_counter()
+    ledger.state_root()
+    build = time.perf_counter() - start
+    print(f"initial build, {n_accounts:,} leaves: {build:.2f}s")
+
+    start = time.perf_counter()
+    for _ in range(blocks):
+        for _ in range(block_size):
+            ledger.update_balance("acct-%d" % rng.randrange(n_accounts), rng.choice((-1, 1)), "USDC")
+        ledger.state_root()
+    incremental = (time.perf_counter() - start) / blocks
+    print(f"incremental root per {block_size}-write block: {incremental * 1e3:.1f} ms")
+
+    start = time.perf_counter()
+    SparseMerkleTree.from_state(ledger.state).root()
+    print(f"full rebuild per block: {(time.perf_counter() - start) * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
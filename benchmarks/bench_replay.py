@@ -0,0 +1,87 @@
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+from blockchain import Ledger, Transaction
+from contracts import LendingPool
+from history import TransactionHistory
+from replay import ChainReplayer
+from storage import BlockLog, Store
+
+N_ACCOUNTS = 1_000
+# pool actions cycle per account: deposit, add_collateral, borrow, repay, transfer
+CYCLE = 5
+
+
+def write_history(directory, n_txs):
+    # Unsigned transfers and direct pool calls, a minute apart; every pool
+    # touch also logs its interest accrual. Pool calls go to the log only;
+    # the transfers' in-memory chain and history are dropped as it goes.
+    ledger = Ledger()
+    pool = LendingPool(ledger)
+    store = Store(directory, snapshot_interval=n_txs + 1)
+    store.open(ledger, [pool])
+    for i in range(N_ACCOUNTS):
+        ledger.mint(f"acct{i}", 10 ** 15, "USDC")
+        ledger.mint(f"acct{i}", 10 ** 24, "ETH")
+
+    start = time.perf_counter()
+    i = 0
+    while store.log.height < n_txs:
+        address = f"acct{i // CYCLE % N_ACCOUNTS}"
+        step = i % CYCLE
+        pool.clock.advance(60)
+        if step == 0:
+            pool.deposit(address, 10 ** 8)
+        elif step == 1:
+            pool.add_collateral(address, 10 ** 16)
+        elif step == 2:
+            pool.borrow(address, 10 ** 6)
+        elif step == 3:
+            pool.repay(address, 10 ** 6)
+        else:
+            ledger._apply(Transaction(address, f"acct{(i * 7 + 1) % N_ACCOUNTS}", 1, signature="00", nonce=i // CYCLE // N_ACCOUNTS))
+        i += 1
+        if len(ledger.chain) >= 100_000:
+            ledger.chain.clear()
+            ledger.history = TransactionHistory()
+    store.log.close()
+    elapsed = time.perf_counter() - start
+    print(f"wrote {store.log.height:,} txs in {elapsed:.1f}s")
+
+
+def replay(directory, interval):
+    # Runs in its own process so peak RSS covers the replay alone.
+    log = BlockLog(os.path.join(directory, "log"))
+    replayer = ChainReplayer(log, os.path.join(directory, "checkpoints"), interval=interval)
+    stats = replayer.build_checkpoints()
+    print(f"replayed {stats['transactions']:,} txs: {stats['tx_per_sec']:,.0f} tx/s, {stats['checkpoints']} checkpoints")
+
+    middle = log.height // 2 + interval // 2
+    start = time.perf_counter()
+    replayer.state_at(middle)
+    print(f"state at height {middle:,} from nearest checkpoint: {(time.perf_counter() - start) * 1e3:,.1f} ms")
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"peak RSS: {peak_mb:,.0f} MB")
+    log.close()
+
+
+def main(n_txs=1_000_000):
+    interval = max(1, n_txs // 20)
+    with tempfile.TemporaryDirectory() as directory:
+        write_history(directory, n_txs)
+        # peak RSS levels off as n_txs grows: replay holds the state and one
+        # mapped log segment at a time, never the chain
+        subprocess.run([sys.executable, __file__, "--replay", directory, str(interval)], check=True)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--replay"]:
+        replay(sys.argv[2], int(sys.argv[3]))
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
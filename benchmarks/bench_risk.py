@@ -0,0 +1,61 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+from blockchain import Ledger
+from contracts import LendingPool
+
+
+def build_pool(n_positions, seed=0):
+    rng = np.random.default_rng(seed)
+    pool = LendingPool(Ledger())
+    collateral = rng.uniform(0.5, 10.0, n_positions)
+    debt = collateral * 2000.0 * rng.uniform(0.0, 0.75, n_positions)
+    for i in range(n_positions):
+        pool.risk.update(f"user{i}", collateral[i], debt[i])
+    return pool
+
+
+def timed(fn, runs=5, warmup=True):
+    if warmup:
+        fn()
+    start = time.perf_counter()
+    for _ in range(runs):
+        result = fn()
+    return (time.perf_counter() - start) / runs * 1e3, result
+
+
+def main(n_positions=1_000_000):
+    pool = build_pool(n_positions)
+    shocked = 2000.0 * 0.7
+
+    ms, _ = timed(lambda: pool.health_factors(price=shocked))
+    print(f"health factors for {n_positions:,} positions: {ms:8.2f} ms")
+    ms, _ = timed(lambda: pool.borrow_headroom(price=shocked))
+    print(f"borrow headroom:                         {ms:8.2f} ms")
+
+    ms, result = timed(lambda: pool.liquidatable_positions(price=shocked))
+    print(f"liquidatable set after 30% shock:        {ms:8.2f} ms ({len(result):,} positions)")
+    ms, _ = timed(lambda: pool.riskiest_positions(10))
+    print(f"10 riskiest:                             {ms:8.4f} ms")
+
+    def update_then_query():
+        pool.risk.update("user0", 1.0, 1.0)
+        return pool.riskiest_positions(10)
+    ms, _ = timed(update_then_query)
+    print(f"one update, then 10 riskiest:            {ms:8.4f} ms")
+
+    start = time.perf_counter()
+    [
+        c * shocked * 0.8 / d if d else float("inf")
+        for c, d in zip(pool.risk.collateral[:n_positions].tolist(), pool.risk.scaled_debt[:n_positions].tolist())
+    ]
+    print(f"pure-Python loop over all positions:     {(time.perf_counter() - start) * 1e3:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,61 @@
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+from amounts import to_units
+from blockchain import Ledger
+from state import ColumnarLedger
+
+USDC_10 = to_units(10, "USDC")
+ETH_1 = to_units(1, "ETH")
+
+
+def fund(ledger, addresses, bulk):
+    if bulk:
+        ledger.bulk_credit(addresses, USDC_10, "USDC")
+        ledger.bulk_credit(addresses, ETH_1, "ETH")
+    else:
+        for address in addresses:
+            ledger.update_balance(address, USDC_10, "USDC")
+            ledger.update_balance(address, ETH_1, "ETH")
+
+
+def measure(ledger_cls, addresses, bulk):
+    start = time.perf_counter()
+    fund(ledger_cls(), addresses, bulk)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    ledger = ledger_cls()
+    fund(ledger, addresses, bulk)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, current
+
+
+def main(n_accounts=1_000_000):
+    # address strings are shared by both ledgers, so they are not counted
+    addresses = [f"{i:064x}" for i in range(n_accounts)]
+    runs = (
+        ("dict, update_balance loop", Ledger, False),
+        ("columnar, update_balance loop", ColumnarLedger, False),
+        ("columnar, bulk_credit", ColumnarLedger, True),
+    )
+    for name, ledger_cls, bulk in runs:
+        elapsed, memory = measure(ledger_cls, addresses, bulk)
+        print(f"{name:<30} {memory / n_accounts:8.1f} B/account  {2 * n_accounts / elapsed:>14,.0f} credits/s")
+
+    ledger = ColumnarLedger()
+    ledger.bulk_credit(addresses, USDC_10, "USDC")
+    start = time.perf_counter()
+    ledger.bulk_debit(addresses, USDC_10 // 10, "USDC")
+    ledger.bulk_credit(addresses, USDC_10 // 10, "USDC")
+    elapsed = time.perf_counter() - start
+    print(f"{'columnar, bulk debit+credit':<30} {'':>19}  {2 * n_accounts / elapsed:>14,.0f} updates/s (existing accounts)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,42 @@
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+from amounts import RAY, to_units
+from blockchain import Ledger
+from contracts import LendingPool
+
+
+def build_pool(n_suppliers):
+    pool = LendingPool(Ledger())
+    deposit = to_units(100, "USDC")
+    pool.supplier_shares = {f"supplier{i}": deposit for i in range(n_suppliers)}
+    pool.total_shares = deposit * n_suppliers
+    pool.total_liquidity = pool.total_shares
+    pool.total_borrowed = pool.total_liquidity // 2
+    pool.ledger.update_balance(pool.pool_address, pool.total_liquidity - pool.total_borrowed, "USDC")
+    return pool
+
+
+def main():
+    print(f"{'suppliers':>10} {'accrue 1 day (us)':>18} {'withdraw (us)':>14} {'index':>10}")
+    for n in (10, 1_000, 100_000, 1_000_000):
+        pool = build_pool(n)
+        runs = 1_000
+        start = time.perf_counter()
+        for _ in range(runs):
+            pool.clock.advance(86_400)
+            pool.accrue_interest()
+        accrue = (time.perf_counter() - start) / runs
+        
+        start = time.perf_counter()
+        for i in range(runs):
+            pool.withdraw(f"supplier{i % n}", to_units("0.01", "USDC"))
+        withdraw = (time.perf_counter() - start) / runs
+        print(f"{n:>10} {accrue * 1e6:>18.3f} {withdraw * 1e6:>14.3f} {pool.supply_index / RAY:>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
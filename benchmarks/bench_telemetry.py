@@ -0,0 +1,69 @@
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+import telemetry
+from blockchain import Ledger, Transaction
+from contracts import LendingPool
+from telemetry import MetricsSink, Profiler, RingBufferSink
+
+
+class BareLedger(Ledger):
+    # update_balance as it was before events, for the disabled-overhead
+    # baseline; pool and transaction paths still run their own event checks
+    def update_balance(self, address, amount, token="ETH"):
+        if address not in self.state:
+            self.state[address] = {}
+        current = self.state[address].get(token, 0)
+        self.state[address][token] = current + amount
+        if self.merkle is not None:
+            self.merkle.update(address, token, current + amount)
+
+
+def setup(ledger_cls=Ledger):
+    ledger = ledger_cls()
+    pool = LendingPool(ledger)
+    ledger.update_balance("alice", 10 ** 30, "USDC")
+    ledger.update_balance("alice", 10 ** 30, "ETH")
+    return ledger, pool
+
+
+def per_op(fn, number=200_000):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e9
+
+
+def measure(ledger_cls=Ledger):
+    ledger, pool = setup(ledger_cls)
+    tx = Transaction("alice", "bob", 1)
+    return {
+        "update_balance": per_op(lambda: ledger.update_balance("alice", 1, "USDC")),
+        "apply transfer": per_op(lambda: ledger._apply(tx), number=50_000),
+        "pool deposit": per_op(lambda: pool.deposit("alice", 1), number=100_000),
+    }
+
+
+def main():
+    # The pool logs at INFO; keep logging at its default WARNING level so
+    # only event emission is compared.
+    rows = [("no sinks, pre-events baseline", measure(BareLedger)), ("no sinks", measure())]
+
+    for name, sinks in (("ring buffer", [RingBufferSink()]), ("ring buffer + metrics", [RingBufferSink(), MetricsSink()])):
+        for sink in sinks:
+            telemetry.bus.subscribe(sink)
+        rows.append((name, measure()))
+        for sink in sinks:
+            telemetry.bus.unsubscribe(sink)
+
+    with Profiler():
+        rows.append(("profiler on, no sinks", measure()))
+
+    ops = list(rows[0][1])
+    print(f"{'configuration':<32}" + "".join(f"{op + ' (ns)':>22}" for op in ops))
+    for name, result in rows:
+        print(f"{name:<32}" + "".join(f"{result[op]:>22.0f}" for op in ops))
+
+
+if __name__ == "__main__":
+    main()
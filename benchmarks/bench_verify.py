@@ -0,0 +1,40 @@
+import os
+import sys
+import timeit
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+import crypto
+from crypto import Wallet
+
+
+def main(runs=200):
+    wallet = Wallet()
+    message = "benchmark message"
+    signature = wallet.sign(message)
+    public_key = wallet.get_public_key_hex()
+
+    def cold():
+        Wallet._verifying_keys.clear()
+        Wallet.verify(message, signature, public_key)
+
+    def warm():
+        Wallet.verify(message, signature, public_key)
+
+    cold_s = timeit.timeit(cold, number=runs) / runs
+
+    Wallet._verifying_keys.clear()
+    Wallet.verify(message, signature, public_key)
+    warm_s = timeit.timeit(warm, number=crypto.PRECOMPUTE_AFTER_HITS - 2) / (crypto.PRECOMPUTE_AFTER_HITS - 2)
+
+    for _ in range(crypto.PRECOMPUTE_AFTER_HITS):
+        warm()
+    hot_s = timeit.timeit(warm, number=runs) / runs
+
+    print(f"cold verify (key rebuilt):       {cold_s * 1e3:8.3f} ms")
+    print(f"warm verify (cached key):        {warm_s * 1e3:8.3f} ms")
+    print(f"hot verify (precomputed tables): {hot_s * 1e3:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
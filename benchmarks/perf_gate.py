@@ -0,0 +1,55 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINES = os.path.join(HERE, "baselines")
+# One baseline per machine id (platform, interpreter, word size). --save
+# overwrites it rather than adding a newer run, so the reference only moves
+# in a commit that changes this file and says which numbers moved and why.
+BASELINE_NAME = "0001_baseline"
+# A benchmark fails when its fastest round is this much slower than the
+# baseline's; the minimum is the least noisy statistic for sub-microsecond calls.
+REGRESSION_LIMIT = "min:50%"
+
+
+def run(storage, extra):
+    return pytest.main([
+        os.path.join(HERE, "perf_hot_paths.py"),
+        "-q",
+        "-p", "no:cacheprovider",
+        f"--benchmark-storage=file://{storage}",
+        "--benchmark-columns=min,median,mean,ops,rounds",
+        "--benchmark-sort=name",
+        "--benchmark-disable-gc",
+        "--benchmark-warmup=on",
+    ] + extra)
+
+
+def save(extra):
+    # pytest-benchmark numbers every saved run; record into a scratch
+    # storage and move the run over this machine's baseline.
+    with tempfile.TemporaryDirectory() as scratch:
+        status = run(scratch, ["--benchmark-save=baseline"] + extra)
+        if status == 0:
+            for machine in os.listdir(scratch):
+                os.makedirs(os.path.join(BASELINES, machine), exist_ok=True)
+                shutil.move(
+                    os.path.join(scratch, machine, f"{BASELINE_NAME}.json"),
+                    os.path.join(BASELINES, machine, f"{BASELINE_NAME}.json"),
+                )
+    return status
+
+
+def main():
+    extra = [arg for arg in sys.argv[1:] if arg != "--save"]
+    if "--save" in sys.argv[1:]:
+        return save(extra)
+    return run(BASELINES, [f"--benchmark-compare={BASELINE_NAME}", f"--benchmark-compare-fail={REGRESSION_LIMIT}"] + extra)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
+
+from amounts import to_units
+from blockchain import Ledger, Transaction
+from contracts import LendingPool
+from crypto import Wallet
+
+# pytest-benchmark suite for the crypto, ledger and pool hot paths. The file
+# name keeps it out of the default test run; run it through perf_gate.py,
+# which compares against the stored baseline, or directly with
+#   python -m pytest benchmarks/perf_hot_paths.py
+pytest.importorskip("pytest_benchmark")
+
+SCALES = (10 ** 2, 10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6)
+BENCH_USER = "BENCH_USER"
+# large enough that no benchmark round runs out of balance, collateral or liquidity
+ENDLESS = 10 ** 40
+
+
+@pytest.fixture(scope="module")
+def wallet():
+    return Wallet()
+
+
+@pytest.fixture(scope="module")
+def signed_tx(wallet):
+    tx = Transaction(wallet.address, "receiver", to_units(1, "ETH"), nonce=1)
+    tx.sign(wallet)
+    return tx
+
+
+@pytest.fixture(scope="module", params=SCALES, ids=lambda n: f"{n:.0e}")
+def ledger(request):
+    ledger = Ledger()
+    balance = to_units(1, "ETH")
+    ledger.state = {f"user{i}": {"ETH": balance} for i in range(request.param)}
+    return ledger
+
+
+@pytest.fixture(scope="module", params=SCALES, ids=lambda n: f"{n:.0e}")
+def pool(request):
+    # One position per account, mirrored in the risk engine, plus a bench
+    # account whose balances and collateral never run out.
+    pool = LendingPool(Ledger())
+    collateral = to_units(1, "ETH")
+    debt = to_units(10, "USDC")
+    pool.ledger.state = {f"user{i}": {"USDC": debt, "ETH": 0} for i in range(request.param)}
+    positions = pool.user_positions
+    for i in range(request.param):
+        address = f"user{i}"
+        positions[address] = {"collateral": collateral, "borrowed": debt, "interest_index": pool.borrow_index}
+        pool._sync_risk(address, positions[address])
+    pool.total_borrowed = pool.total_liquidity = debt * request.param
+    pool.ledger.update_balance(BENCH_USER, 2 * ENDLESS, "USDC")
+    pool.ledger.update_balance(BENCH_USER, ENDLESS, "ETH")
+    pool.deposit(BENCH_USER, ENDLESS)
+    pool.add_collateral(BENCH_USER, ENDLESS)
+    pool.borrow(BENCH_USER, ENDLESS // 10 ** 9)
+    return pool
+
+
+@pytest.mark.benchmark(group="crypto")
+def test_wallet_keygen(benchmark):
+    benchmark(Wallet)
+
+
+@pytest.mark.benchmark(group="crypto")
+def test_wallet_sign(benchmark, wallet, signed_tx):
+    benchmark(wallet.sign, signed_tx.encode())
+
+
+@pytest.mark.benchmark(group="crypto")
+def test_wallet_verify(benchmark, wallet, signed_tx):
+    assert benchmark(Wallet.verify, signed_tx.encode(), signed_tx.signature, wallet.get_public_key_hex())
+
+
+@pytest.mark.benchmark(group="crypto")
+def test_hashable_string(benchmark, signed_tx):
+    def encode():
+        signed_tx._encoded = None
+        return signed_tx.get_hashable_string()
+    benchmark(encode)
+
+
+@pytest.mark.benchmark(group="crypto")
+def test_hashable_string_cached(benchmark, signed_tx):
+    benchmark(signed_tx.get_hashable_string)
+
+
+@pytest.mark.benchmark(group="ledger.process_transaction")
+def test_process_transaction(benchmark, ledger, wallet, signed_tx):
+    ledger.update_balance(wallet.address, ENDLESS)
+    def process():
+        # the same tx every round, so its nonce is handed back first
+        ledger.next_nonce[wallet.address] = signed_tx.nonce
+        return ledger.process_transaction(signed_tx)
+    assert benchmark(process)
+
+
+@pytest.mark.benchmark(group="ledger.update_balance")
+def test_update_balance(benchmark, ledger):
+    benchmark(ledger.update_balance, "user0", 1)
+
+
+@pytest.mark.benchmark(group="pool.deposit")
+def test_pool_deposit(benchmark, pool):
+    benchmark(pool.deposit, BENCH_USER, 1)
+
+
+@pytest.mark.benchmark(group="pool.withdraw")
+def test_pool_withdraw(benchmark, pool):
+    benchmark(pool.withdraw, BENCH_USER, 1)
+
+
+@pytest.mark.benchmark(group="pool.borrow")
+def test_pool_borrow(benchmark, pool):
+    benchmark(pool.borrow, BENCH_USER, 1)
+
+
+@pytest.mark.benchmark(group="pool.repay")
+def test_pool_repay(benchmark, pool):
+    benchmark(pool.repay, BENCH_USER, 1)
+
+
+@pytest.mark.benchmark(group="pool.accrue_interest")
+def test_pool_accrue(benchmark, pool):
+    # Each round catches up on an hour of interest from the same starting
+    # index, which keeps the integers at their usual size however many
+    # rounds run.
+    state = (pool.borrow_index, pool.supply_index, pool.total_borrowed, pool.total_liquidity)
+
+    def reset():
+        pool.borrow_index, pool.supply_index, pool.total_borrowed, pool.total_liquidity = state
+        pool.clock.advance(3600)
+
+    benchmark.pedantic(pool.accrue_interest, setup=reset, rounds=20_000, warmup_rounds=100)
+    reset()
@@ -0,0 +1,53 @@
+from decimal import Decimal, ROUND_DOWN
+
+# Amounts are integers in each token's smallest unit; rates, indexes and
+# ratios are integers scaled by RAY. Human-readable numbers only appear at
+# the edges (scenario files, the app, reports).
+TOKEN_DECIMALS = {"USDC": 6, "ETH": 18, "WBTC": 8}
+DEFAULT_DECIMALS = 18
+RAY = 10 ** 27
+HALF_RAY = RAY // 2
+
+def decimals(token):
+    return TOKEN_DECIMALS.get(token, DEFAULT_DECIMALS)
+
+def _decimal(value):
+    # repr() keeps floats at their shortest round-tripping digits, so 0.1
+    # becomes Decimal("0.1") rather than its binary expansion.
+    return value if isinstance(value, Decimal) else Decimal(repr(value) if isinstance(value, float) else str(value))
+
+def to_units(amount, token):
+    # Whole tokens -> base units; digits beyond the token's precision are dropped.
+    return int(_decimal(amount).scaleb(decimals(token)).to_integral_value(ROUND_DOWN))
+
+def from_units(units, token):
+    return units / 10 ** decimals(token)
+
+def format_units(units, token):
+    return format(Decimal(units).scaleb(-decimals(token)).normalize(), "f")
+
+def to_ray(value):
+    return int(_decimal(value).scaleb(27).to_integral_value())
+
+def from_ray(value):
+    return value / RAY
+
+# Multiplications and divisions by ray quantities round half up.
+def ray_mul(a, b):
+    return (a * b + HALF_RAY) // RAY
+
+def ray_div(a, b):
+    return (a * RAY + b // 2) // b
+
+def mul_div(a, b, c):
+    return (a * b + c // 2) // c
+
+def ray_pow(x, n):
+    # x ** n for ray-scaled x and integer n >= 0, by repeated squaring.
+    result = RAY
+    while n:
+        if n & 1:
+            result = ray_mul(result, x)
+        x = ray_mul(x, x)
+        n >>= 1
+    return result
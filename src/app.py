@@ -1,23 +1,34 @@
 import streamlit as st
-from crypto import Wallet
-from blockchain import Ledger
-from contracts import LendingPool
+from amounts import from_ray, from_units, to_units
+from service import ProtocolService
 import time
 import pandas as pd
 
                           
-if 'ledger' not in st.session_state:
-    st.session_state.ledger = Ledger()
-    st.session_state.alice = Wallet()
-    st.session_state.bob = Wallet()
-    st.session_state.pool = LendingPool(st.session_state.ledger)
-    
-                     
-    st.session_state.ledger.update_balance(st.session_state.alice.address, 10000, "USDC")
-    st.session_state.ledger.update_balance(st.session_state.bob.address, 10, "ETH")
-
 st.set_page_config(page_title="DeFi Simulator", layout="wide", page_icon="🏦")
 
+@st.cache_resource
+def get_service():
+    # Shared by every session in this server process.
+    service = ProtocolService()
+    service.add_wallet("Alice", balances={"USDC": to_units(10000, "USDC")})
+    service.add_wallet("Bob", balances={"ETH": to_units(10, "ETH")})
+    return service
+
+# token an action's amount is denominated in, for the history table; None
+# where it varies (mints)
+ACTION_TOKENS = {"add_collateral": "ETH", "transfer": "ETH", "mint": None}
+
+def action_token(action):
+    return ACTION_TOKENS.get(action, "USDC")
+
+def action_amount(amount, action):
+    token = action_token(action)
+    return None if token is None else from_units(amount, token)
+
+service = get_service()
+snapshot = service.snapshot()
+
             
 st.markdown("""
     <style>
@@ -66,20 +77,20 @@ with st.sidebar:
     st.header("🔐 Wallet Selector")
     user_option = st.selectbox("Select User", ["Alice", "Bob"])
     
+    account = snapshot["accounts"][user_option]
+    current_address = account["address"]
     if user_option == "Alice":
-        current_user = st.session_state.alice
         st.success(f"Logged in as **Alice**")
     else:
-        current_user = st.session_state.bob
         st.info(f"Logged in as **Bob**")
 
-    st.code(f"{current_user.address}", language="text")
+    st.code(f"{current_address}", language="text")
     st.caption("Wallet Address")
     
     st.markdown("---")
     st.subheader("💰 Current Balance")
-    usdc_bal = st.session_state.ledger.get_balance(current_user.address, "USDC")
-    eth_bal = st.session_state.ledger.get_balance(current_user.address, "ETH")
+    usdc_bal = from_units(account["balances"]["USDC"], "USDC")
+    eth_bal = from_units(account["balances"]["ETH"], "ETH")
     
     st.metric("USDC", f"{usdc_bal:,.2f}")
     st.metric("ETH", f"{eth_bal:,.4f}")
@@ -89,37 +100,47 @@ st.subheader("📊 Protocol Overview")
 col1, col2, col3 = st.columns(3)
 
 with col1:
-    st.metric("Pool Liquidity", f"{st.session_state.pool.total_liquidity:,.2f} USDC", delta="Available to Borrow")
+    st.metric("Pool Liquidity", f"{from_units(snapshot['total_liquidity'], 'USDC'):,.2f} USDC", delta="Available to Borrow")
 
 with col2:
-    st.metric("Total Borrowed", f"{st.session_state.pool.total_borrowed:,.2f} USDC", delta_color="inverse")
+    st.metric("Total Borrowed", f"{from_units(snapshot['total_borrowed'], 'USDC'):,.2f} USDC", delta_color="inverse")
 
 with col3:
-    st.metric("APY (Borrow Rate)", f"{st.session_state.pool.get_borrow_rate() * 100:.2f}%", delta="Variable Rate")
+    st.metric("APY (Borrow Rate)", f"{from_ray(snapshot['borrow_rate']) * 100:.2f}%", delta="Variable Rate")
 
 st.markdown("---")
 
                        
 st.subheader("👤 Your Position")
-if current_user.address in st.session_state.pool.user_positions:
-    pos = st.session_state.pool.user_positions[current_user.address]
+if account["position"] is not None:
+    pos = account["position"]
     p_col1, p_col2, p_col3 = st.columns(3)
-    p_col1.metric("Collateral Locked", f"{pos['collateral']:.4f} ETH")
-    p_col2.metric("Borrowed Amount", f"{pos['borrowed']:.2f} USDC")
+    p_col1.metric("Collateral Locked", f"{from_units(pos['collateral'], 'ETH'):.4f} ETH")
+    debt = from_units(pos['debt'], 'USDC')
+    p_col2.metric("Borrowed Amount", f"{debt:.2f} USDC")
     
                                                 
-    collateral_value_usdc = pos['collateral'] * 2000                                                       
-    health_factor = collateral_value_usdc / pos['borrowed'] if pos['borrowed'] > 0 else float('inf')
+    health_factor = pos['health_factor']
     
     p_col3.metric("Health Factor", f"{health_factor:.2f}", delta="> 1.5 Safe" if health_factor > 1.5 else "Risk", delta_color="normal" if health_factor > 1.5 else "inverse")
 else:
     st.info("You have no active position in the lending pool.")
 
+st.subheader("🌱 Your Supply")
+if account["supply"] is not None:
+    supply = account["supply"]
+    s_col1, s_col2, s_col3 = st.columns(3)
+    s_col1.metric("Supplied Balance", f"{from_units(supply['balance'], 'USDC'):,.6f} USDC", delta="Earning interest")
+    s_col2.metric("Pool Shares", f"{from_units(supply['shares'], 'USDC'):,.6f}", delta=f"1 share = {from_ray(snapshot['supply_index']):.6f} USDC", delta_color="off")
+    s_col3.metric("Supply APY", f"{from_ray(snapshot['supply_rate']) * 100:.2f}%", delta="Variable Rate")
+else:
+    st.info("You have not supplied any USDC to the pool.")
+
 st.markdown("---")
 
          
 st.subheader("⚡ Actions")
-tab1, tab2, tab3, tab4 = st.tabs(["📥 Deposit", "🔒 Add Collateral", "💸 Borrow", "💳 Repay"])
+tab1, tab_w, tab2, tab3, tab4 = st.tabs(["📥 Deposit", "📤 Withdraw", "🔒 Add Collateral", "💸 Borrow", "💳 Repay"])
 
 with tab1:
     c1, c2 = st.columns([2, 1])
@@ -132,9 +153,25 @@ with tab1:
         st.write("")
         if st.button("Confirm Deposit", key="btn_dep"):
             try:
-                st.session_state.pool.deposit(current_user.address, deposit_amount)
+                service.deposit(current_address, to_units(deposit_amount, "USDC"))
                 st.toast(f"✅ Successfully deposited {deposit_amount} USDC")
-                time.sleep(1)
+                st.rerun()
+            except Exception as e:
+                st.error(f"Error: {e}")
+
+with tab_w:
+    c1, c2 = st.columns([2, 1])
+    with c1:
+        st.write("### Withdraw USDC")
+        st.write("Withdraw supplied USDC, including the interest it has earned.")
+        withdraw_amount = st.number_input("Amount to Withdraw (USDC)", min_value=0.0, step=100.0, key="wd")
+    with c2:
+        st.write("")
+        st.write("")
+        if st.button("Confirm Withdrawal", key="btn_wd"):
+            try:
+                service.withdraw(current_address, to_units(withdraw_amount, "USDC"))
+                st.toast(f"✅ Withdrew {withdraw_amount} USDC")
                 st.rerun()
             except Exception as e:
                 st.error(f"Error: {e}")
@@ -150,9 +187,8 @@ with tab2:
         st.write("")
         if st.button("Confirm Collateral", key="btn_col"):
             try:
-                st.session_state.pool.add_collateral(current_user.address, collat_amount)
+                service.add_collateral(current_address, to_units(collat_amount, "ETH"))
                 st.toast(f"✅ Added {collat_amount} ETH Collateral")
-                time.sleep(1)
                 st.rerun()
             except Exception as e:
                 st.error(f"Error: {e}")
@@ -168,9 +204,8 @@ with tab3:
         st.write("")
         if st.button("Confirm Borrow", key="btn_bor"):
             try:
-                st.session_state.pool.borrow(current_user.address, borrow_amount)
+                service.borrow(current_address, to_units(borrow_amount, "USDC"))
                 st.toast(f"✅ Borrowed {borrow_amount} USDC")
-                time.sleep(1)
                 st.rerun()
             except Exception as e:
                 st.error(f"Error: {e}")
@@ -186,9 +221,8 @@ with tab4:
         st.write("")
         if st.button("Confirm Repayment", key="btn_rep"):
             try:
-                st.session_state.pool.repay(current_user.address, repay_amount)
+                service.repay(current_address, to_units(repay_amount, "USDC"))
                 st.toast(f"✅ Repaid {repay_amount} USDC")
-                time.sleep(1)
                 st.rerun()
             except Exception as e:
                 st.error(f"Error: {e}")
@@ -197,29 +231,53 @@ st.markdown("---")
 
                      
 with st.expander("⚙️ Simulation Controls", expanded=True):
+    days = st.number_input("Days to fast-forward", min_value=1, value=30, step=1)
     if st.button("⏳ Simulate Time Passage (Accrue Interest)"):
-        st.session_state.pool.accrue_interest()
-        st.toast("✅ Time passed, interest accrued!")
-        time.sleep(1)
+        service.advance_time(int(days) * 86400)
+        st.toast(f"✅ {int(days)} days passed, interest accrued!")
         st.rerun()
 
                      
 st.markdown("---")
 st.subheader("📜 Transaction History")
 
-if st.session_state.ledger.chain:
-                                                            
-    tx_data = []
-    for tx in reversed(st.session_state.ledger.chain):                    
-        tx_data.append({
-            "Time": time.strftime('%H:%M:%S', time.localtime(tx.timestamp)),
-            "Action": tx.action.upper(),
-            "Amount": tx.amount,
-            "Sender": f"{tx.sender[:6]}...",
-            "Receiver": f"{tx.receiver[:6]}..."
-        })
+HISTORY_PAGE_SIZE = 25
+
+@st.cache_data(max_entries=4)
+def history_aggregates(height, _history):
+    # Keyed by chain height; _history is not hashed by Streamlit.
+    return _history.aggregates()
+
+history = service.ledger.history
+history_height = snapshot["history_height"]
+if history_height:
+    aggregates = service.read(history_aggregates, history_height, history)
+    agg_cols = st.columns(len(aggregates))
+    for col, ((action, token), totals) in zip(agg_cols, aggregates.items()):
+        token = token or action_token(action)
+        label = action.upper() if token is None else f"{action.upper()} ({token})"
+        volume = "mixed tokens" if token is None else f"{from_units(totals['amount'], token):,.2f} volume"
+        col.metric(label, f"{totals['count']:,} txs", delta=volume, delta_color="off")
+    
+    f_col1, f_col2, f_col3 = st.columns(3)
+    only_mine = f_col1.checkbox("Only my transactions")
+    action_filter = f_col2.selectbox("Action", ["All"] + history.action_names)
+    address_filter = current_address if only_mine else None
+    action_filter = None if action_filter == "All" else action_filter
+    
+    total = service.read(history.count, address_filter, action_filter)
+    pages = max(1, -(-total // HISTORY_PAGE_SIZE))
+    page = f_col3.number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1)
     
-    df = pd.DataFrame(tx_data)
+    rows = service.read(history.page, page - 1, HISTORY_PAGE_SIZE, address_filter, action_filter)
+    df = pd.DataFrame({
+        "Time": [time.strftime('%H:%M:%S', time.localtime(r["timestamp"])) for r in rows],
+        "Action": [r["action"].upper() for r in rows],
+        "Amount": [action_amount(r["amount"], r["action"]) for r in rows],
+        "Sender": [f"{r['sender'][:6]}..." for r in rows],
+        "Receiver": [f"{r['receiver'][:6]}..." for r in rows],
+    })
     st.dataframe(df, use_container_width=True)
+    st.caption(f"{total:,} matching transactions")
 else:
     st.info("No transactions yet.")
@@ -1,16 +1,59 @@
 import time
 import json
+import os
+import struct
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 from crypto import Wallet
+from history import TransactionHistory
+from merkle import SparseMerkleTree
+from telemetry import BalanceUpdated, TransactionApplied, bus
+
+PARALLEL_VERIFY_MIN_BATCH = 64
+
+def _verify_payload(payload):
+    message, signature, public_key_hex = payload
+    return Wallet.verify(message, signature, public_key_hex)
+
+TX_ENCODING_VERSION = 3
+_ENCODED_FIELDS = frozenset(("sender", "receiver", "amount", "action", "data", "timestamp_ns", "fee", "nonce"))
+FEE_TOKEN = "ETH"
+FEE_COLLECTOR = "FEE_COLLECTOR"
+# sender of "mint" records; it has no key, so no signed transaction can use it
+MINT_AUTHORITY = "MINT_AUTHORITY"
+
+def _pack_amount(value):
+    if not isinstance(value, int):
+        raise ValueError(f"Amounts must be integer base units, got {value!r}")
+    return value.to_bytes(16, "big", signed=True)
+
+def _pack_str(value):
+    raw = value.encode()
+    return struct.pack(">H", len(raw)) + raw
 
 class Transaction:
-    def __init__(self, sender_pubkey, receiver_pubkey, amount, action="transfer", data=None, signature=None):
-        self.sender = sender_pubkey
-        self.receiver = receiver_pubkey
-        self.amount = amount
-        self.action = action                                   
-        self.data = data                       
-        self.timestamp = time.time()
-        self.signature = signature
+    def __init__(self, sender_pubkey, receiver_pubkey, amount, action="transfer", data=None, signature=None, fee=0, nonce=0):
+        # filled in directly: __setattr__'s cache invalidation is only needed
+        # once the encoding may have been cached
+        self.__dict__.update(
+            sender=sender_pubkey, receiver=receiver_pubkey, amount=amount, action=action, data=data,
+            timestamp_ns=time.time_ns(), signature=signature, fee=fee, nonce=nonce,
+            _encoded=None, _tx_id=None,
+        )
+
+    def __setattr__(self, name, value):
+        if name in _ENCODED_FIELDS:
+            self.__dict__["_encoded"] = None
+            self.__dict__["_tx_id"] = None
+        object.__setattr__(self, name, value)
+
+    @property
+    def timestamp(self):
+        return self.timestamp_ns / 1e9
+
+    @timestamp.setter
+    def timestamp(self, value):
+        self.timestamp_ns = int(round(value * 1e9))
 
     def to_dict(self):
         return {
@@ -19,54 +62,259 @@ class Transaction:
             "amount": self.amount,
             "action": self.action,
             "data": self.data,
-            "timestamp": self.timestamp
+            "timestamp": self.timestamp,
+            "fee": self.fee,
+            "nonce": self.nonce,
         }
 
+    def encode(self):
+        # Canonical layout (big endian):
+        #   version u8 | action, sender, receiver as u16-length-prefixed utf-8 |
+        #   amount and fee as signed 128-bit integers in the token's base units | timestamp_ns u64 |
+        #   nonce u64 | data as u32-length-prefixed canonical JSON
+        if self._encoded is None:
+            data = json.dumps(self.data, sort_keys=True, separators=(",", ":")).encode()
+            self._encoded = b"".join((
+                struct.pack(">B", TX_ENCODING_VERSION),
+                _pack_str(self.action),
+                _pack_str(self.sender),
+                _pack_str(self.receiver),
+                _pack_amount(self.amount),
+                _pack_amount(self.fee),
+                struct.pack(">QQI", self.timestamp_ns, self.nonce, len(data)),
+                data,
+            ))
+        return self._encoded
+
+    @classmethod
+    def decode(cls, blob, signature=None):
+        version = blob[0]
+        if version != TX_ENCODING_VERSION:
+            raise ValueError(f"Unsupported transaction encoding version {version}")
+        
+        offset = 1
+        fields = []
+        for _ in range(3):
+            (length,) = struct.unpack_from(">H", blob, offset)
+            offset += 2
+            fields.append(bytes(blob[offset:offset + length]).decode())
+            offset += length
+        action, sender, receiver = fields
+        amount = int.from_bytes(blob[offset:offset + 16], "big", signed=True)
+        fee = int.from_bytes(blob[offset + 16:offset + 32], "big", signed=True)
+        timestamp_ns, nonce, data_length = struct.unpack_from(">QQI", blob, offset + 32)
+        offset += 52
+        data = json.loads(bytes(blob[offset:offset + data_length]))
+        
+        tx = cls(
+            sender, receiver, amount, action=action, data=data,
+            signature=signature, fee=fee, nonce=nonce,
+        )
+        tx.timestamp_ns = timestamp_ns
+        return tx
+
+    @property
+    def tx_id(self):
+        if self._tx_id is None:
+            self._tx_id = hashlib.sha256(self.encode()).hexdigest()
+        return self._tx_id
+
     def get_hashable_string(self):
-                                                                          
-                                    
-        data = self.to_dict()
-        return json.dumps(data, sort_keys=True)
+        return self.encode().hex()
 
     def sign(self, wallet):
-        message = self.get_hashable_string()
-        self.signature = wallet.sign(message)
+        self.signature = wallet.sign(self.encode())
+
+    def verification_payload(self):
+        public_key_hex = Wallet.resolve_public_key(self.sender)
+        return (self.encode(), self.signature, public_key_hex)
 
     def is_valid(self):
         if not self.signature:
             return False
-        message = self.get_hashable_string()
-        return Wallet.verify(message, self.signature, self.sender)
+        return _verify_payload(self.verification_payload())
 
 class Ledger:
     def __init__(self):
         self.chain = []                                                     
         self.state = {}                                          
+        self.storage = None
+        self.history = TransactionHistory()
+        # contract address -> object whose execute(tx) applies actions sent to it
+        self.contracts = {}
+        # built on the first state_root() call, then kept current per write
+        self.merkle = None
+        # set while a log is replayed: contracts then neither log their
+        # actions again nor accrue interest beyond the logged accruals
+        self.replaying = False
+        # sender -> nonce its next signed transaction must carry
+        self.next_nonce = {}
+        # worker processes for signature checks, started by the first large
+        # batch and kept until close()
+        self._verify_pool = None
+        self._verify_workers = None
                                                                 
                                                 
 
+    def verify_pool(self, workers):
+        if self._verify_pool is None or self._verify_workers != workers:
+            self.close()
+            self._verify_pool = ProcessPoolExecutor(max_workers=workers)
+            self._verify_workers = workers
+        return self._verify_pool
+
+    def close(self):
+        if self._verify_pool is not None:
+            self._verify_pool.shutdown()
+            self._verify_pool = None
+            self._verify_workers = None
+
+    def register_contract(self, address, contract):
+        self.contracts[address] = contract
+
+    def export_state(self):
+        return {"state": self.state, "next_nonce": self.next_nonce}
+
+    def load_state(self, snapshot):
+        self.state = snapshot["state"]
+        self.next_nonce = dict(snapshot.get("next_nonce", {}))
+        self.merkle = None
+
+    def state_root(self):
+        if self.merkle is None:
+            self.merkle = SparseMerkleTree.from_state(self.state)
+        return self.merkle.root().hex()
+
+    def prove_balance(self, address, token="ETH"):
+        self.state_root()
+        return self.merkle.prove(address, token)
+
     def get_balance(self, address, token="ETH"):
         user_state = self.state.get(address, {})
-        return user_state.get(token, 0.0)
+        return user_state.get(token, 0)
 
     def update_balance(self, address, amount, token="ETH"):
         if address not in self.state:
             self.state[address] = {}
-        current = self.state[address].get(token, 0.0)
+        current = self.state[address].get(token, 0)
         self.state[address][token] = current + amount
+        if self.merkle is not None:
+            self.merkle.update(address, token, current + amount)
+        if bus.sinks:
+            bus.emit(BalanceUpdated(address, token, amount, current + amount))
+
+    def mint(self, address, amount, token="ETH"):
+        # Credits new funds through the chain, so balances can be rebuilt from it.
+        self._apply(Transaction(MINT_AUTHORITY, address, amount, action="mint", data={"token": token}))
+
+    def mint_many(self, addresses, amount, token="ETH"):
+        # One record for the whole batch, credited through bulk_credit.
+        self._apply(Transaction(MINT_AUTHORITY, MINT_AUTHORITY, amount, action="mint", data={"token": token, "addresses": list(addresses)}))
+
+    def bulk_credit(self, addresses, amount, token="ETH"):
+        for address in addresses:
+            self.update_balance(address, amount, token)
+
+    def record_call(self, tx):
+        # Contracts log actions called directly, and the outside inputs their
+        # state changes used, as unsigned transactions. These go to the
+        # attached store's log only, which is what replay reads; the
+        # in-memory chain and history hold what went through the ledger.
+        if self.storage is not None and not self.replaying:
+            self.storage.record(tx)
+
+    def is_logged_call(self, tx):
+        # record_call's records are the unsigned transactions sent to a
+        # contract; the ledger only applies contract transactions that are signed.
+        return not tx.signature and tx.receiver in self.contracts
 
     def process_transaction(self, tx):
         if not tx.is_valid():
             raise ValueError("Invalid signature")
         
+        self._apply(tx)
+        return True
+
+    def process_batch(self, txs, executor=None, workers=None):
+        # Signatures are checked up front (in parallel for large batches, on
+        # `executor` or else the ledger's own pool); state changes are then
+        # applied strictly in block order.
+        verified = self._verify_signatures(txs, executor, workers)
+        
+        results = []
+        for tx, valid in zip(txs, verified):
+            if not valid:
+                results.append({"tx": tx, "accepted": False, "error": "Invalid signature"})
+                continue
+            try:
+                self._apply(tx)
+            except ValueError as e:
+                results.append({"tx": tx, "accepted": False, "error": str(e)})
+            else:
+                results.append({"tx": tx, "accepted": True, "error": None})
+        return results
+
+    def _verify_signatures(self, txs, executor=None, workers=None):
+        verified = [False] * len(txs)
+        indices = [i for i, tx in enumerate(txs) if tx.signature]
+        payloads = [txs[i].verification_payload() for i in indices]
+        
+        workers = workers or os.cpu_count() or 1
+        if executor is None and (workers == 1 or len(payloads) < PARALLEL_VERIFY_MIN_BATCH):
+            outcomes = map(_verify_payload, payloads)
+        else:
+            chunksize = max(1, len(payloads) // (workers * 4))
+            executor = executor or self.verify_pool(workers)
+            outcomes = executor.map(_verify_payload, payloads, chunksize=chunksize)
+        
+        for i, ok in zip(indices, outcomes):
+            verified[i] = ok
+        return verified
+
+    def _apply(self, tx):
+        self._execute(tx)
+        self._record(tx)
+        return True
+
+    def _execute(self, tx):
+        # State changes only; _record() then appends the tx to the chain.
+        # Signed transactions must carry their sender's next nonce, which
+        # they use up only once applied, so none can be applied twice.
+        if tx.signature:
+            expected = self.next_nonce.get(tx.sender, 0)
+            if tx.nonce != expected:
+                raise ValueError(f"Invalid nonce {tx.nonce}, expected {expected}")
+        if tx.fee and self.get_balance(tx.sender, FEE_TOKEN) < tx.fee:
+            raise ValueError("Insufficient funds for fee")
                               
         if tx.action == "transfer":
             sender_bal = self.get_balance(tx.sender)
-            if sender_bal < tx.amount:
+            if sender_bal < tx.amount + tx.fee:
                 raise ValueError("Insufficient funds")
             
             self.update_balance(tx.sender, -tx.amount)
             self.update_balance(tx.receiver, tx.amount)
-            
+        elif tx.action == "mint":
+            if tx.sender != MINT_AUTHORITY:
+                raise ValueError("Only the mint authority can mint")
+            data = tx.data or {}
+            if "addresses" in data:
+                self.bulk_credit(data["addresses"], tx.amount, data["token"])
+            else:
+                self.update_balance(tx.receiver, tx.amount, data["token"])
+        elif tx.receiver in self.contracts:
+            self.contracts[tx.receiver].execute(tx)
+        
+        if tx.fee:
+            self.update_balance(tx.sender, -tx.fee, FEE_TOKEN)
+            self.update_balance(FEE_COLLECTOR, tx.fee, FEE_TOKEN)
+        if tx.signature:
+            self.next_nonce[tx.sender] = tx.nonce + 1
+
+    def _record(self, tx):
         self.chain.append(tx)
-        return True
+        self.history.append(tx)
+        if self.storage is not None:
+            self.storage.record(tx)
+        if bus.sinks:
+            bus.emit(TransactionApplied(tx.tx_id, tx.action, tx.sender, tx.receiver, tx.amount, tx.fee))
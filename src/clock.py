@@ -0,0 +1,20 @@
+import time
+
+class SimulatedClock:
+    # Whole seconds since an arbitrary epoch; time only moves when told to,
+    # so a simulation can skip ahead by years in one call.
+    def __init__(self, start=0):
+        self.current = start
+
+    def now(self):
+        return self.current
+
+    def advance(self, seconds):
+        if seconds < 0:
+            raise ValueError("Cannot move the clock backwards")
+        self.current += seconds
+        return self.current
+
+class SystemClock:
+    def now(self):
+        return int(time.time())
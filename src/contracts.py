@@ -1,49 +1,226 @@
-from blockchain import Ledger
+import logging
+from amounts import RAY, decimals, mul_div, ray_div, ray_mul, ray_pow, to_ray
+from blockchain import Ledger, Transaction
+from clock import SimulatedClock
+from risk import RiskEngine, StaticPriceFeed
+from telemetry import InterestAccrued, Liquidation, PoolAction, bus
+
+DEFAULT_PRICES = {"ETH": 2000.0, "USDC": 1.0}
+
+# Arguments are passed unformatted so a disabled level costs only the level check.
+logger = logging.getLogger(__name__)
+
+# Pool parameters held as ray-scaled integers; configure() takes them as fractions.
+RAY_PARAMETERS = ("ltv", "liquidation_threshold", "close_factor", "liquidation_bonus", "base_rate", "utilization_slope", "reserve_factor")
+SECONDS_PER_YEAR = 365 * 24 * 60 * 60
 
 class LendingPool:
-    def __init__(self, ledger, token_name="USDC", collateral_token="ETH"):
+    def __init__(self, ledger, token_name="USDC", collateral_token="ETH", price_feed=None, clock=None, address="LENDING_POOL_ADDRESS"):
         self.ledger = ledger
         self.token_name = token_name
         self.collateral_token = collateral_token
+        self.price_feed = price_feed or StaticPriceFeed(DEFAULT_PRICES)
+        self.ltv = to_ray("0.75")
+        self.liquidation_threshold = to_ray("0.8")
+        self.close_factor = to_ray("0.5")
+        self.liquidation_bonus = to_ray("0.05")
         
-                    
-        self.total_liquidity = 0.0
-        self.total_borrowed = 0.0
-        self.base_rate = 0.05               
+        # amounts in base units of token_name / collateral_token
+        self.total_liquidity = 0
+        self.total_borrowed = 0
+        self.base_rate = to_ray("0.05")
+        self.utilization_slope = to_ray("0.1")
+        self.borrow_index = RAY
+        # the share of interest kept by the pool instead of paid to suppliers
+        self.reserve_factor = 0
+        self.reserves = 0
+        # Suppliers hold shares worth supply_index / RAY tokens each; accrued
+        # interest raises the index, so yield reaches every depositor at once.
+        self.supply_index = RAY
+        self.total_shares = 0
+        self.supplier_shares = {}
+        # interest is brought up to clock.now() whenever the pool is touched
+        self.clock = clock or SimulatedClock()
+        self.last_accrual = self.clock.now()
+        self._token_scale = 10 ** decimals(token_name)
+        self._collateral_scale = 10 ** decimals(collateral_token)
         
                                                                                              
         self.user_positions = {}
+        self.risk = RiskEngine()
         
                                                 
-        self.pool_address = "LENDING_POOL_ADDRESS"
+        self.pool_address = address
+        self.ledger.register_contract(self.pool_address, self)
+        self._executing = False
+        self._recorded_price = None
+
+    def export_state(self):
+        return {
+            "total_liquidity": self.total_liquidity,
+            "total_borrowed": self.total_borrowed,
+            "borrow_index": self.borrow_index,
+            "reserves": self.reserves,
+            "last_accrual": self.last_accrual,
+            "supply_index": self.supply_index,
+            "total_shares": self.total_shares,
+            "supplier_shares": self.supplier_shares,
+            "user_positions": self.user_positions,
+            "observed_price": self._recorded_price,
+        }
+
+    def load_state(self, snapshot):
+        self.total_liquidity = snapshot["total_liquidity"]
+        self.total_borrowed = snapshot["total_borrowed"]
+        self.borrow_index = snapshot["borrow_index"]
+        self.reserves = snapshot["reserves"]
+        self.last_accrual = snapshot["last_accrual"]
+        self.supply_index = snapshot["supply_index"]
+        self.total_shares = snapshot["total_shares"]
+        self.supplier_shares = snapshot["supplier_shares"]
+        self.user_positions = snapshot["user_positions"]
+        # the last price logged to the store, which a replayed tail reads in place of the feed
+        self._recorded_price = snapshot["observed_price"]
+        self.risk.clear()
+        for address, position in self.user_positions.items():
+            self._sync_risk(address, position)
+
+    def configure(self, **params):
+        for name, value in params.items():
+            if not hasattr(self, name):
+                raise ValueError(f"Unknown pool parameter {name!r}")
+            setattr(self, name, to_ray(value) if name in RAY_PARAMETERS else value)
+
+    def transaction(self, wallet, action, amount, data=None, fee=0, nonce=0):
+        # Signed transaction that performs `action` when the ledger applies it.
+        tx = Transaction(wallet.address, self.pool_address, amount, action=action, data=data, fee=fee, nonce=nonce)
+        tx.sign(wallet)
+        return tx
+
+    def execute(self, tx):
+        data = tx.data or {}
+        self._executing = True
+        try:
+            if tx.action in ("deposit", "withdraw", "add_collateral", "borrow", "repay"):
+                getattr(self, tx.action)(tx.sender, tx.amount)
+            elif tx.action == "liquidate":
+                self.liquidate(tx.sender, data["borrower"], data.get("requested", tx.amount))
+            elif tx.sender == self.pool_address and tx.action in ("accrue_interest", "observe_price"):
+                self._replay_input(tx.action, data)
+            elif tx.action == "accrue_interest":
+                self.accrue_interest()
+            else:
+                raise ValueError(f"Unsupported pool action {tx.action!r}")
+        finally:
+            self._executing = False
+
+    def _log(self, action, user_address, amount, data=None):
+        # Only with a store attached. Actions called directly are logged
+        # here; ones arriving through execute() are recorded by the ledger
+        # as the transaction itself.
+        if self.ledger.storage is not None and not self._executing:
+            self.ledger.record_call(Transaction(user_address, self.pool_address, amount, action=action, data=data))
+
+    def _log_input(self, action, data):
+        # Outside inputs a state change depended on (the clock for accrual,
+        # the oracle for borrow and liquidation limits) are logged as the
+        # pool's own transactions, so replay sees exactly what it saw.
+        if self.ledger.storage is not None:
+            self.ledger.record_call(Transaction(self.pool_address, self.pool_address, 0, action=action, data=data))
+
+    def _replay_input(self, action, data):
+        if action == "accrue_interest":
+            self._accrue(data["time"])
+        else:
+            self._recorded_price = data["price"]
+
+    def _observe_price(self):
+        if self.ledger.storage is None:
+            return
+        price = self.get_collateral_price()
+        if price != self._recorded_price:
+            self._recorded_price = price
+            self._log_input("observe_price", {"price": price})
 
     def get_utilization_rate(self):
+        # ray-scaled, like get_borrow_rate
+        self._accrue()
+        return self._utilization()
+
+    def get_borrow_rate(self):
+        self._accrue()
+        return self._borrow_rate()
+
+    def get_supply_rate(self):
+        # Suppliers earn the interest paid less reserves, spread over
+        # everything supplied.
+        self._accrue()
+        return ray_mul(ray_mul(self._borrow_rate(), self._utilization()), RAY - self.reserve_factor)
+
+    def _utilization(self):
         if self.total_liquidity == 0:
             return 0
-        return self.total_borrowed / self.total_liquidity
+        return ray_div(self.total_borrowed, self.total_liquidity)
 
-    def get_borrow_rate(self):
-                                                                       
-        utilization = self.get_utilization_rate()
-        return self.base_rate + (utilization * 0.1)
+    def _borrow_rate(self):
+        return self.base_rate + ray_mul(self._utilization(), self.utilization_slope)
 
     def deposit(self, user_address, amount):
                                        
                                                           
                                                               
-        
+        if amount <= 0:
+            raise ValueError("Deposit amount must be positive")
+        self._accrue()
         user_bal = self.ledger.get_balance(user_address, self.token_name)
         if user_bal < amount:
             raise ValueError("Insufficient funds to deposit")
             
-                                      
+        # shares are rounded down on the way in, in the pool's favour
+        shares = amount * RAY // self.supply_index
+        if shares == 0:
+            raise ValueError("Deposit too small")
         self.ledger.update_balance(user_address, -amount, self.token_name)
         self.ledger.update_balance(self.pool_address, amount, self.token_name)
         
+        self.supplier_shares[user_address] = self.supplier_shares.get(user_address, 0) + shares
+        self.total_shares += shares
         self.total_liquidity += amount
-        print(f"User {user_address[:8]} deposited {amount} {self.token_name}")
+        logger.info("User %.8s deposited %s %s", user_address, amount, self.token_name)
+        if bus.sinks:
+            bus.emit(PoolAction(self.pool_address, "deposit", user_address, amount, self.token_name))
+        self._log("deposit", user_address, amount)
+
+    def withdraw(self, user_address, amount):
+        if amount <= 0:
+            raise ValueError("Withdrawal amount must be positive")
+        self._accrue()
+        shares = self.supplier_shares.get(user_address, 0)
+        if amount > shares * self.supply_index // RAY:
+            raise ValueError("Insufficient supplied balance")
+        if amount > self.total_liquidity - self.total_borrowed:
+            raise ValueError("Not enough liquidity in pool")
+        
+        # and rounded up on the way out
+        burned = min(-(-amount * RAY // self.supply_index), shares)
+        self.ledger.update_balance(self.pool_address, -amount, self.token_name)
+        self.ledger.update_balance(user_address, amount, self.token_name)
+        
+        if burned < shares:
+            self.supplier_shares[user_address] = shares - burned
+        else:
+            self.supplier_shares.pop(user_address, None)
+        self.total_shares -= burned
+        self.total_liquidity = max(self.total_liquidity - amount, 0)
+        logger.info("User %.8s withdrew %s %s", user_address, amount, self.token_name)
+        if bus.sinks:
+            bus.emit(PoolAction(self.pool_address, "withdraw", user_address, amount, self.token_name))
+        self._log("withdraw", user_address, amount)
 
     def add_collateral(self, user_address, amount):
+        if amount <= 0:
+            raise ValueError("Collateral amount must be positive")
+        self._accrue()
         user_bal = self.ledger.get_balance(user_address, self.collateral_token)
         if user_bal < amount:
             raise ValueError("Insufficient collateral funds")
@@ -51,68 +228,258 @@ class LendingPool:
         self.ledger.update_balance(user_address, -amount, self.collateral_token)
         self.ledger.update_balance(self.pool_address, amount, self.collateral_token)
         
-        if user_address not in self.user_positions:
-            self.user_positions[user_address] = {"collateral": 0.0, "borrowed": 0.0, "interest_index": 1.0}
-            
-        self.user_positions[user_address]["collateral"] += amount
-        print(f"User {user_address[:8]} added {amount} {self.collateral_token} collateral")
+        position = self._position(user_address)
+        position["collateral"] += amount
+        self._sync_risk(user_address, position)
+        logger.info("User %.8s added %s %s collateral", user_address, amount, self.collateral_token)
+        if bus.sinks:
+            bus.emit(PoolAction(self.pool_address, "add_collateral", user_address, amount, self.collateral_token))
+        self._log("add_collateral", user_address, amount)
 
     def borrow(self, user_address, amount):
-                                                
-                                                 
-        ETH_PRICE = 2000.0 
-        
-        if user_address not in self.user_positions:
-             raise ValueError("No collateral deposited")
-             
-        position = self.user_positions[user_address]
-        collateral_value = position["collateral"] * ETH_PRICE
-        max_borrow = collateral_value * 0.75
+        if amount <= 0:
+            raise ValueError("Borrow amount must be positive")
+        self._accrue()
+        self._observe_price()
         
-        if position["borrowed"] + amount > max_borrow:
-            raise ValueError("Insufficient collateral for this borrow amount")
+        position = self.user_positions.get(user_address)
+        debt = self._current_debt(position) if position is not None else 0
+        self._check_borrow_limit(user_address, position, debt, amount)
             
         if amount > (self.total_liquidity - self.total_borrowed):
             raise ValueError("Not enough liquidity in pool")
             
-                                         
+        if position is None:
+            position = self._position(user_address)
         self.ledger.update_balance(self.pool_address, -amount, self.token_name)
         self.ledger.update_balance(user_address, amount, self.token_name)
         
-        position["borrowed"] += amount
+        self._set_debt(user_address, position, debt + amount)
         self.total_borrowed += amount
-        print(f"User {user_address[:8]} borrowed {amount} {self.token_name}")
+        logger.info("User %.8s borrowed %s %s", user_address, amount, self.token_name)
+        if bus.sinks:
+            bus.emit(PoolAction(self.pool_address, "borrow", user_address, amount, self.token_name))
+        self._log("borrow", user_address, amount)
 
     def repay(self, user_address, amount):
+        if amount <= 0:
+            raise ValueError("Repay amount must be positive")
         if user_address not in self.user_positions:
             raise ValueError("No loan found")
+        self._accrue()
             
         position = self.user_positions[user_address]
+        debt = self._current_debt(position)
         
-        if amount > position["borrowed"]:
-            amount = position["borrowed"]                    
+        if amount > debt:
+            amount = debt                    
             
         user_bal = self.ledger.get_balance(user_address, self.token_name)
         if user_bal < amount:
             raise ValueError("Insufficient funds to repay")
             
-                                    
-        self.ledger.update_balance(user_address, -amount, self.token_name)
-        self.ledger.update_balance(self.pool_address, amount, self.token_name)
+        self._take_repayment(user_address, user_address, position, debt, amount)
+        logger.info("User %.8s repaid %s %s", user_address, amount, self.token_name)
+        if bus.sinks:
+            bus.emit(PoolAction(self.pool_address, "repay", user_address, amount, self.token_name))
+        self._log("repay", user_address, amount)
+
+    def liquidate(self, liquidator_address, user_address, repay_amount):
+        if repay_amount <= 0:
+            raise ValueError("Repay amount must be positive")
+        self._accrue()
+        self._observe_price()
+        if self.health_factor(user_address) >= 1:
+            raise ValueError("Position is not liquidatable")
+        
+        requested = repay_amount
+        position = self.user_positions[user_address]
+        debt = self._current_debt(position)
+        price = self._price_ray()
+        bonus = RAY + self.liquidation_bonus
+        repay_amount = min(repay_amount, ray_mul(debt, self.close_factor))
+        seized = repay_amount * bonus * self._collateral_scale // (price * self._token_scale)
+        if seized > position["collateral"]:
+            seized = position["collateral"]
+            repay_amount = ray_div(self.collateral_value(seized, price), bonus)
+        if repay_amount == 0 or seized == 0:
+            raise ValueError("Nothing to liquidate")
         
-        position["borrowed"] -= amount
-        self.total_borrowed -= amount
-        print(f"User {user_address[:8]} repaid {amount} {self.token_name}")
+        if self.ledger.get_balance(liquidator_address, self.token_name) < repay_amount:
+            raise ValueError("Insufficient funds to liquidate")
+        
+        self._release_collateral(user_address, position, liquidator_address, seized)
+        self._take_repayment(liquidator_address, user_address, position, debt, repay_amount)
+        logger.info(
+            "User %.8s liquidated %.8s: repaid %s %s, seized %s %s",
+            liquidator_address, user_address, repay_amount, self.token_name, seized, self.collateral_token,
+        )
+        if bus.sinks:
+            bus.emit(Liquidation(
+                self.pool_address, liquidator_address, user_address,
+                repay_amount, self.token_name, seized, self.collateral_token,
+            ))
+        self._log("liquidate", liquidator_address, repay_amount, {"borrower": user_address, "requested": requested})
+        return repay_amount, seized
+
+    def liquidate_all(self, liquidator_address):
+        # Liquidates every position below health factor 1 up to the close
+        # factor. Positions that cannot be liquidated are skipped; the sweep
+        # ends early only once the liquidator has nothing left to repay with.
+        results = {}
+        self._accrue()
+        crossed = self.risk.crossed(self.get_collateral_price(), self.borrow_index / RAY, self.liquidation_threshold / RAY)
+        for user_address in crossed:
+            try:
+                results[user_address] = self.liquidate(liquidator_address, user_address, self.get_debt(user_address))
+            except ValueError:
+                if self.ledger.get_balance(liquidator_address, self.token_name) == 0:
+                    break
+        return results
+
+    def get_debt(self, user_address):
+        self._accrue()
+        position = self.user_positions.get(user_address)
+        if position is None:
+            return 0
+        return self._current_debt(position)
+
+    def supplied_balance(self, user_address):
+        self._accrue()
+        return self.supplier_shares.get(user_address, 0) * self.supply_index // RAY
+
+    def available_to_borrow(self, user_address):
+        self._accrue()
+        position = self.user_positions.get(user_address)
+        if position is None:
+            return 0
+        headroom = ray_mul(self.collateral_value(position["collateral"]), self.ltv) - self._current_debt(position)
+        return max(min(headroom, self.total_liquidity - self.total_borrowed), 0)
+
+    def _current_debt(self, position):
+        # "borrowed" is the debt as of the index snapshot in "interest_index"
+        if position["borrowed"] == 0:
+            return 0
+        return mul_div(position["borrowed"], self.borrow_index, position["interest_index"])
+
+    def _position(self, user_address):
+        position = self.user_positions.get(user_address)
+        if position is None:
+            position = self.user_positions[user_address] = {"collateral": 0, "borrowed": 0, "interest_index": self.borrow_index}
+        return position
+
+    def _check_borrow_limit(self, user_address, position, debt, amount):
+        # A position borrows against its own collateral; `debt` is what it
+        # owes before this borrow.
+        if position is None:
+            raise ValueError("No collateral deposited")
+        if debt + amount > ray_mul(self.collateral_value(position["collateral"]), self.ltv):
+            raise ValueError("Insufficient collateral for this borrow amount")
+
+    def _take_repayment(self, payer_address, user_address, position, debt, amount):
+        self.ledger.update_balance(payer_address, -amount, self.token_name)
+        self.ledger.update_balance(self.pool_address, amount, self.token_name)
+        self._set_debt(user_address, position, debt - amount)
+        # per-position rounding can leave the total a few units below the sum of debts
+        self.total_borrowed = max(self.total_borrowed - amount, 0)
+
+    def _release_collateral(self, user_address, position, receiver_address, amount):
+        self.ledger.update_balance(self.pool_address, -amount, self.collateral_token)
+        self.ledger.update_balance(receiver_address, amount, self.collateral_token)
+        position["collateral"] -= amount
+        self._sync_risk(user_address, position)
+
+    def _set_debt(self, user_address, position, debt):
+        position["borrowed"] = debt
+        position["interest_index"] = self.borrow_index
+        self._sync_risk(user_address, position)
+
+    def _sync_risk(self, user_address, position):
+        # The risk engine screens in float64 whole tokens; every decision
+        # that moves funds is made on the integer amounts here.
+        scaled_debt = position["borrowed"] * RAY / position["interest_index"]
+        self.risk.update(user_address, position["collateral"] / self._collateral_scale, scaled_debt / self._token_scale)
+
+    def get_collateral_price(self, price=None):
+        # Collateral price in whole borrowed tokens per whole collateral token.
+        if price is not None:
+            return price
+        if self.ledger.replaying and self._recorded_price is not None:
+            return self._recorded_price
+        return self.price_feed.get_price(self.collateral_token) / self.price_feed.get_price(self.token_name)
+
+    def _price_ray(self, price=None):
+        return to_ray(self.get_collateral_price(price))
+
+    def collateral_value(self, collateral, price_ray=None):
+        # Value of `collateral` base units in base units of the borrowed token, rounded down.
+        if price_ray is None:
+            price_ray = self._price_ray()
+        return collateral * price_ray * self._token_scale // (self._collateral_scale * RAY)
+
+    def health_factor(self, user_address, price=None):
+        position = self.user_positions.get(user_address)
+        debt = self.get_debt(user_address)
+        if position is None or debt == 0:
+            return float('inf')
+        value = self.collateral_value(position["collateral"], self._price_ray(price))
+        return ray_mul(value, self.liquidation_threshold) / debt
+
+    def health_factors(self, price=None):
+        # Health factor of every position, aligned with self.risk.addresses.
+        self._accrue()
+        return self.risk.health_factors(self.get_collateral_price(price), self.borrow_index / RAY, self.liquidation_threshold / RAY)
+
+    def borrow_headroom(self, price=None):
+        self._accrue()
+        return self.risk.borrow_headroom(self.get_collateral_price(price), self.borrow_index / RAY, self.ltv / RAY)
+
+    def liquidatable_positions(self, price=None):
+        # Accrual only moves borrow_index, which the threshold divides by, so
+        # the risk columns need no per-position work when interest accrues.
+        self._accrue()
+        return self.risk.unhealthy(self.get_collateral_price(price), self.borrow_index / RAY, self.liquidation_threshold / RAY)
+
+    def bad_debt(self, price=None):
+        # Debt not covered by the value of its collateral, in whole tokens.
+        self._accrue()
+        return self.risk.bad_debt(self.get_collateral_price(price), self.borrow_index / RAY)
+
+    def riskiest_positions(self, n, price=None):
+        self._accrue()
+        return self.risk.riskiest(n, self.get_collateral_price(price), self.borrow_index / RAY, self.liquidation_threshold / RAY)
 
     def accrue_interest(self):
-                                     
-        rate = self.get_borrow_rate()
-                                                       
-                                                             
-        for user, pos in self.user_positions.items():
-            if pos["borrowed"] > 0:
-                interest = pos["borrowed"] * 0.01 
-                pos["borrowed"] += interest
-                                                                                                 
-                                                                   
-                print(f"Interest accrued for {user[:8]}: {interest}")
+        # Interest already accrues whenever the pool is touched; this only
+        # brings an idle pool up to the clock.
+        self._accrue()
+
+    def _accrue(self, now=None):
+        # The borrow rate, held constant since the last accrual, compounds
+        # per second: one pool-level index update however much time has
+        # passed (ray_pow is O(log seconds)), and positions pick it up
+        # lazily on read. Interest owed, less reserves, goes to suppliers
+        # through one supply_index update, however many of them there are.
+        if now is None:
+            if self.ledger.replaying:
+                return
+            now = self.clock.now()
+        elapsed = now - self.last_accrual
+        if elapsed <= 0:
+            return
+        self.last_accrual = now
+        growth = ray_pow(RAY + self._borrow_rate() // SECONDS_PER_YEAR, elapsed)
+        self.borrow_index = ray_mul(self.borrow_index, growth)
+        borrowed = ray_mul(self.total_borrowed, growth)
+        interest = borrowed - self.total_borrowed
+        if self.reserve_factor:
+            reserve_share = ray_mul(interest, self.reserve_factor)
+            self.reserves += reserve_share
+            interest -= reserve_share
+        if self.total_shares:
+            self.supply_index += interest * RAY // self.total_shares
+        self.total_liquidity += interest
+        self.total_borrowed = borrowed
+        if bus.sinks:
+            bus.emit(InterestAccrued(self.pool_address, self.token_name, self.borrow_index, self.total_borrowed))
+        self._log_input("accrue_interest", {"time": now})
@@ -1,13 +1,162 @@
 import hashlib
+import hmac
+import os
 import ecdsa
 import binascii
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+VERIFYING_KEY_CACHE_SIZE = 4096
+# address -> public key entries kept; a wallet re-registers whenever it signs
+PUBLIC_KEY_CACHE_SIZE = 100_000
+PRECOMPUTE_AFTER_HITS = 8
+CURVE = ecdsa.SECP256k1
+# BIP32 master-key salt; Wallet.derive(seed, i) is the hardened child m/i'
+# of that master key, so the same seed always yields the same wallets.
+HD_MASTER_SALT = b"Bitcoin seed"
+HARDENED_OFFSET = 0x80000000
+# generate_many() below this many keys derives them in-process
+PARALLEL_KEYGEN_MIN_BATCH = 256
+# a cached key: 32-byte secret exponent followed by the 64-byte public key
+KEY_RECORD_SIZE = 96
+
+def _seed_bytes(seed):
+    return seed.encode() if isinstance(seed, str) else bytes(seed)
+
+def master_key(seed):
+    digest = hmac.new(HD_MASTER_SALT, _seed_bytes(seed), hashlib.sha512).digest()
+    secret = int.from_bytes(digest[:32], "big")
+    if not 0 < secret < CURVE.order:
+        raise ValueError("Seed yields an invalid master key")
+    return secret, digest[32:]
+
+def derive_secret(master, index):
+    # Hardened derivation only needs the parent's secret and chain code,
+    # so no elliptic-curve work is done until the public key is wanted.
+    secret, chain_code = master
+    if not 0 <= index < HARDENED_OFFSET:
+        raise ValueError(f"Key index {index} out of range")
+    data = b"\x00" + secret.to_bytes(32, "big") + (index + HARDENED_OFFSET).to_bytes(4, "big")
+    digest = hmac.new(chain_code, data, hashlib.sha512).digest()
+    tweak = int.from_bytes(digest[:32], "big")
+    child = (tweak + secret) % CURVE.order
+    if tweak >= CURVE.order or child == 0:
+        raise ValueError(f"Key index {index} yields an invalid key; use another index")
+    return child
+
+def _derive_keys(job):
+    # Process-pool worker: (secret, public key bytes) for a range of indices.
+    master, start, stop = job
+    keys = []
+    for index in range(start, stop):
+        secret = derive_secret(master, index)
+        public_key = ecdsa.SigningKey.from_secret_exponent(secret, curve=CURVE).get_verifying_key()
+        keys.append((secret, public_key.to_string()))
+    return keys
+
+class KeyCache:
+    # Derived keys stored per seed as fixed-size records in index order, so
+    # loading n wallets is one read and no curve arithmetic. Secrets are
+    # written unencrypted: meant for simulation and test wallets only.
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, seed):
+        return os.path.join(self.directory, hashlib.sha256(_seed_bytes(seed)).hexdigest()[:32] + ".keys")
+
+    def load(self, seed, count):
+        try:
+            with open(self.path(seed), "rb") as f:
+                blob = f.read(count * KEY_RECORD_SIZE)
+        except FileNotFoundError:
+            return []
+        keys = []
+        for offset in range(0, len(blob) - KEY_RECORD_SIZE + 1, KEY_RECORD_SIZE):
+            record = blob[offset:offset + KEY_RECORD_SIZE]
+            keys.append((int.from_bytes(record[:32], "big"), record[32:]))
+        return keys
+
+    def extend(self, seed, keys):
+        # `keys` must continue from the last cached index.
+        with open(self.path(seed), "ab") as f:
+            f.write(b"".join(secret.to_bytes(32, "big") + public_key for secret, public_key in keys))
 
 class Wallet:
-    def __init__(self):
-                                                                    
-        self.private_key = ecdsa.SigningKey.generate(curve=ecdsa.SECP256k1)
-        self.public_key = self.private_key.get_verifying_key()
+    # public key hex -> [VerifyingKey, hits], least recently used first
+    _verifying_keys = OrderedDict()
+    _verifying_keys_lock = threading.Lock()
+    # address -> public key hex, least recently used first
+    _public_keys = OrderedDict()
+    _public_keys_lock = threading.Lock()
+
+    def __init__(self, secret=None, public_key_bytes=None):
+        # With no arguments a fresh random key is generated. A wallet loaded
+        # with its public key (from a KeyCache) builds the signing key on
+        # first use and checks it against that public key then.
+        if secret is None:
+            self._private_key = ecdsa.SigningKey.generate(curve=CURVE)
+            self.public_key = self._private_key.get_verifying_key()
+        elif public_key_bytes is None:
+            self._private_key = ecdsa.SigningKey.from_secret_exponent(secret, curve=CURVE)
+            self.public_key = self._private_key.get_verifying_key()
+        else:
+            self._private_key = None
+            self._secret = secret
+            self.public_key = ecdsa.VerifyingKey.from_string(public_key_bytes, curve=CURVE, validate_point=False)
         self.address = self.generate_address()
+        self._public_key_hex = self.get_public_key_hex()
+        Wallet._remember_public_key(self.address, self._public_key_hex)
+
+    @property
+    def private_key(self):
+        if self._private_key is None:
+            private_key = ecdsa.SigningKey.from_secret_exponent(self._secret, curve=CURVE)
+            if private_key.get_verifying_key().to_string() != self.public_key.to_string():
+                raise ValueError("Cached public key does not match the secret key")
+            self._private_key = private_key
+        return self._private_key
+
+    @classmethod
+    def derive(cls, seed, index):
+        return cls(derive_secret(master_key(seed), index))
+
+    @classmethod
+    def generate_many(cls, n, seed=None, start=0, executor=None, workers=None, cache=None):
+        # Wallets for indices start .. start+n-1 of `seed` (a random seed if
+        # None). Keys missing from `cache` are derived, in worker processes
+        # for large batches, and appended to it.
+        if seed is None:
+            if cache is not None:
+                raise ValueError("A key cache needs a seed")
+            seed = os.urandom(32)
+        master = master_key(seed)
+        stop = start + n
+        # cached keys are indices 0 .. first-1; the rest are derived
+        cached = cache.load(seed, stop) if cache is not None else []
+        first = len(cached) if cache is not None else start
+        
+        workers = workers or os.cpu_count() or 1
+        missing = stop - first
+        if missing <= 0:
+            derived = []
+        elif executor is None and (workers == 1 or missing < PARALLEL_KEYGEN_MIN_BATCH):
+            derived = _derive_keys((master, first, stop))
+        else:
+            chunk = -(-missing // (workers * 4))
+            jobs = [(master, lo, min(lo + chunk, stop)) for lo in range(first, stop, chunk)]
+            if executor is None:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    chunks = list(pool.map(_derive_keys, jobs))
+            else:
+                chunks = executor.map(_derive_keys, jobs)
+            derived = [key for keys in chunks for key in keys]
+        
+        if cache is not None and derived:
+            cache.extend(seed, derived)
+        keys = (cached + derived)[start:] if cache is not None else derived
+        return [cls(secret, public_key) for secret, public_key in keys]
 
     def generate_address(self):
                                                          
@@ -19,6 +168,8 @@ class Wallet:
                                 
         if isinstance(message, str):
             message = message.encode()
+        # keeps the address resolvable for verification after eviction
+        Wallet._remember_public_key(self.address, self._public_key_hex)
         signature = self.private_key.sign(message)
         return binascii.hexlify(signature).decode()
 
@@ -33,11 +184,68 @@ class Wallet:
                                                                                                                  
                                                                                                     
                                                                
-            pub_key_bytes = binascii.unhexlify(public_key_hex)
-            vk = ecdsa.VerifyingKey.from_string(pub_key_bytes, curve=ecdsa.SECP256k1)
+            vk = Wallet._get_verifying_key(public_key_hex)
             return vk.verify(signature, message)
-        except (ecdsa.BadSignatureError, ValueError):
+        except (ecdsa.BadSignatureError, ecdsa.MalformedPointError, ValueError):
             return False
 
+    @staticmethod
+    def _get_verifying_key(public_key_hex):
+        cache = Wallet._verifying_keys
+        with Wallet._verifying_keys_lock:
+            entry = cache.get(public_key_hex)
+            if entry is not None:
+                cache.move_to_end(public_key_hex)
+                entry[1] += 1
+        if entry is not None:
+            if entry[1] == PRECOMPUTE_AFTER_HITS:
+                Wallet._precompute(entry[0])
+            return entry[0]
+        
+        pub_key_bytes = binascii.unhexlify(public_key_hex)
+        vk = ecdsa.VerifyingKey.from_string(pub_key_bytes, curve=CURVE)
+        with Wallet._verifying_keys_lock:
+            cache[public_key_hex] = [vk, 0]
+            if len(cache) > VERIFYING_KEY_CACHE_SIZE:
+                cache.popitem(last=False)
+        return vk
+
+    @staticmethod
+    def _precompute(vk):
+        # VerifyingKey.precompute() needs the point's order, which keys decoded
+        # with from_string() do not carry; rebuild the point with it instead.
+        point = vk.pubkey.point
+        vk.pubkey.point = ecdsa.ellipticcurve.PointJacobi(
+            point.curve(), point.x(), point.y(), 1, CURVE.order, generator=True
+        )
+        # Build the doubling table now; ecdsa otherwise builds it lazily in
+        # the first multiplication, which would be the next signature check.
+        vk.pubkey.point._maybe_precompute()
+
+    @staticmethod
+    def _remember_public_key(address, public_key_hex):
+        keys = Wallet._public_keys
+        with Wallet._public_keys_lock:
+            keys[address] = public_key_hex
+            keys.move_to_end(address)
+            if len(keys) > PUBLIC_KEY_CACHE_SIZE:
+                keys.popitem(last=False)
+
+    @staticmethod
+    def register_public_key(public_key_hex):
+        address = hashlib.sha256(binascii.unhexlify(public_key_hex)).hexdigest()
+        Wallet._remember_public_key(address, public_key_hex)
+        return address
+
+    @staticmethod
+    def resolve_public_key(address_or_key):
+        keys = Wallet._public_keys
+        with Wallet._public_keys_lock:
+            public_key_hex = keys.get(address_or_key)
+            if public_key_hex is None:
+                return address_or_key
+            keys.move_to_end(address_or_key)
+        return public_key_hex
+
     def get_public_key_hex(self):
         return binascii.hexlify(self.public_key.to_string()).decode()
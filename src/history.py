@@ -0,0 +1,127 @@
+from array import array
+
+class TransactionHistory:
+    # Append-only columnar record of applied transactions. Addresses and
+    # actions are interned to small integer ids, and row numbers are indexed
+    # per address, per action and per (address, action), so a filtered page
+    # costs O(page size) however long the chain grows. Amounts are integer
+    # base units; 18-decimal tokens exceed int64, so they stay a list.
+    # Running totals are kept per (action, token), token being None where
+    # the transaction does not name it (pool actions).
+    def __init__(self):
+        self.timestamps = array("d")
+        self.actions = array("B")
+        self.amounts = []
+        self.senders = array("I")
+        self.receivers = array("I")
+
+        self.action_names = []
+        self.action_codes = {}
+        self.addresses = []
+        self.address_ids = {}
+
+        self._rows = {}
+        self.totals = {}
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def _address_id(self, address):
+        i = self.address_ids.get(address)
+        if i is None:
+            i = len(self.addresses)
+            self.address_ids[address] = i
+            self.addresses.append(address)
+        return i
+
+    def _action_code(self, action):
+        code = self.action_codes.get(action)
+        if code is None:
+            code = len(self.action_names)
+            self.action_codes[action] = code
+            self.action_names.append(action)
+        return code
+
+    def _index(self, key, row):
+        rows = self._rows.get(key)
+        if rows is None:
+            rows = self._rows[key] = array("I")
+        rows.append(row)
+
+    def append(self, tx):
+        row = len(self.timestamps)
+        code = self._action_code(tx.action)
+        sender = self._address_id(tx.sender)
+        receiver = self._address_id(tx.receiver)
+
+        self.timestamps.append(tx.timestamp)
+        self.actions.append(code)
+        self.amounts.append(tx.amount)
+        self.senders.append(sender)
+        self.receivers.append(receiver)
+
+        self._index(("action", code), row)
+        for address in {sender, receiver}:
+            self._index(("address", address), row)
+            self._index(("address_action", address, code), row)
+
+        data = tx.data or {}
+        token = data.get("token", data.get("asset"))
+        if token is None and tx.action == "transfer":
+            # ledger transfers move ETH
+            token = "ETH"
+        amount = tx.amount
+        if "addresses" in data:
+            # mint_many credits the amount to each address
+            amount *= len(data["addresses"])
+        totals = self.totals.get((tx.action, token))
+        if totals is None:
+            totals = self.totals[tx.action, token] = [0, 0]
+        totals[0] += 1
+        totals[1] += amount
+
+    def _key(self, address=None, action=None):
+        if address is None and action is None:
+            return None
+        address_id = self.address_ids.get(address) if address is not None else None
+        code = self.action_codes.get(action) if action is not None else None
+        if (address is not None and address_id is None) or (action is not None and code is None):
+            return False
+        if address is None:
+            return ("action", code)
+        if action is None:
+            return ("address", address_id)
+        return ("address_action", address_id, code)
+
+    def count(self, address=None, action=None):
+        key = self._key(address, action)
+        if key is None:
+            return len(self)
+        if key is False:
+            return 0
+        return len(self._rows.get(key, ()))
+
+    def row(self, i):
+        return {
+            "timestamp": self.timestamps[i],
+            "action": self.action_names[self.actions[i]],
+            "amount": self.amounts[i],
+            "sender": self.addresses[self.senders[i]],
+            "receiver": self.addresses[self.receivers[i]],
+        }
+
+    def page(self, page=0, page_size=25, address=None, action=None):
+        # Newest first. Returns the rows of the requested page.
+        key = self._key(address, action)
+        if key is False:
+            return []
+        rows = range(len(self)) if key is None else self._rows.get(key, ())
+        end = len(rows) - page * page_size
+        start = max(end - page_size, 0)
+        if end <= 0:
+            return []
+        return [self.row(rows[i]) for i in range(end - 1, start - 1, -1)]
+
+    def aggregates(self):
+        # (action, token) -> {"count", "amount"}
+        return {key: {"count": count, "amount": amount} for key, (count, amount) in self.totals.items()}
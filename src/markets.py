@@ -0,0 +1,223 @@
+import logging
+from amounts import RAY, ray_div, ray_mul, to_ray
+from blockchain import Transaction
+from clock import SimulatedClock
+from contracts import DEFAULT_PRICES, LendingPool
+from risk import StaticPriceFeed
+from telemetry import Liquidation, bus
+
+logger = logging.getLogger(__name__)
+
+class Market(LendingPool):
+    # One asset's market: a LendingPool that lends `asset` and holds it as
+    # collateral, with its own address, rate model, parameters and reserves.
+    # Supply shares, accrual on the registry's clock, withdrawals and input
+    # checks are the pool's; borrow limits and health span every market the
+    # account is in, so they are asked of the registry.
+    def __init__(self, registry, asset):
+        self.registry = registry
+        self.asset = asset
+        super().__init__(
+            registry.ledger, token_name=asset, collateral_token=asset, price_feed=registry.price_feed,
+            clock=registry.clock, address=f"{registry.address}:{asset}",
+        )
+        self.scale = self._token_scale
+
+    def _position(self, user_address):
+        if user_address not in self.user_positions:
+            self.registry._index(user_address, self.asset)
+        return super()._position(user_address)
+
+    def _check_borrow_limit(self, user_address, position, debt, amount):
+        health = self.registry.account_health(user_address)
+        if health["debt_value"] + self.registry.value(self.asset, amount) > health["borrow_limit"]:
+            raise ValueError("Insufficient collateral for this borrow amount")
+
+    def _observe_price(self):
+        self.registry._observe_prices()
+
+    def health_factor(self, user_address, price=None):
+        return self.registry.health_factor(user_address)
+
+class MarketRegistry:
+    # Every market shares one ledger, clock and price feed. Each account's
+    # markets are indexed in self.accounts: address -> [asset], so health is
+    # one pass over the account's own positions however many markets are
+    # listed.
+    def __init__(self, ledger, price_feed=None, address="MARKET_REGISTRY", clock=None):
+        self.ledger = ledger
+        self.price_feed = price_feed or StaticPriceFeed(DEFAULT_PRICES)
+        self.clock = clock or SimulatedClock()
+        self.markets = {}
+        self.accounts = {}
+        self.address = address
+        self.ledger.register_contract(address, self)
+        self._executing = False
+        self._recorded_prices = None
+
+    def add_market(self, asset, **params):
+        if asset in self.markets:
+            raise ValueError(f"Market {asset!r} already exists")
+        market = self.markets[asset] = Market(self, asset)
+        market.configure(**params)
+        return market
+
+    def market(self, asset):
+        market = self.markets.get(asset)
+        if market is None:
+            raise ValueError(f"Unknown market {asset!r}")
+        return market
+
+    def markets_of(self, address):
+        return list(self.accounts.get(address, ()))
+
+    def _index(self, address, asset):
+        self.accounts.setdefault(address, []).append(asset)
+
+    def export_state(self):
+        return {
+            "markets": {asset: market.export_state() for asset, market in self.markets.items()},
+            "accounts": self.accounts,
+            "observed_prices": self._recorded_prices,
+        }
+
+    def load_state(self, snapshot):
+        for asset, market_state in snapshot["markets"].items():
+            self.market(asset).load_state(market_state)
+        self.accounts = snapshot["accounts"]
+        self._recorded_prices = snapshot["observed_prices"]
+
+    def transaction(self, wallet, action, asset, amount, data=None, fee=0, nonce=0):
+        tx = Transaction(wallet.address, self.address, amount, action=action, data={**(data or {}), "asset": asset}, fee=fee, nonce=nonce)
+        tx.sign(wallet)
+        return tx
+
+    def execute(self, tx):
+        # Single-market actions are executed by the market itself.
+        data = tx.data or {}
+        if tx.action == "liquidate":
+            self._executing = True
+            try:
+                self.liquidate(tx.sender, data["borrower"], data["asset"], data["collateral_asset"], data.get("requested", tx.amount))
+            finally:
+                self._executing = False
+        elif tx.action == "observe_prices" and tx.sender == self.address:
+            self._recorded_prices = data["prices"]
+        elif tx.action == "accrue_interest" and data.get("asset") is None:
+            self.accrue_interest()
+        else:
+            self.market(data.get("asset")).execute(tx)
+
+    def _log(self, action, user_address, amount, data):
+        if self.ledger.storage is not None and not self._executing:
+            self.ledger.record_call(Transaction(user_address, self.address, amount, action=action, data=data))
+
+    def _observe_prices(self):
+        if self.ledger.storage is None:
+            return
+        prices = {asset: self.price_feed.get_price(asset) for asset in self.markets}
+        if prices != self._recorded_prices:
+            self._recorded_prices = prices
+            self.ledger.record_call(Transaction(self.address, self.address, 0, action="observe_prices", data={"prices": prices}))
+
+    def _price(self, asset):
+        if self.ledger.replaying and self._recorded_prices is not None:
+            return to_ray(self._recorded_prices[asset])
+        return to_ray(self.price_feed.get_price(asset))
+
+    def value(self, asset, amount, price=None):
+        # Amount of `asset` in ray-scaled units of the price feed's quote currency.
+        return amount * (self._price(asset) if price is None else price) // self.markets[asset].scale
+
+    def deposit(self, user_address, asset, amount):
+        self.market(asset).deposit(user_address, amount)
+
+    def withdraw(self, user_address, asset, amount):
+        self.market(asset).withdraw(user_address, amount)
+
+    def add_collateral(self, user_address, asset, amount):
+        self.market(asset).add_collateral(user_address, amount)
+
+    def borrow(self, user_address, asset, amount):
+        self.market(asset).borrow(user_address, amount)
+
+    def repay(self, user_address, asset, amount):
+        self.market(asset).repay(user_address, amount)
+
+    def supplied_balance(self, user_address, asset):
+        return self.market(asset).supplied_balance(user_address)
+
+    def account_health(self, user_address, prices=None):
+        # One pass over the account's own markets. Values are ray-scaled in
+        # the quote currency; `prices` optionally overrides asset -> price.
+        collateral_value = borrow_limit = liquidation_value = debt_value = 0
+        for asset in self.accounts.get(user_address, ()):
+            market = self.markets[asset]
+            price = to_ray(prices[asset]) if prices and asset in prices else self._price(asset)
+            collateral = market.user_positions[user_address]["collateral"]
+            if collateral:
+                value = collateral * price // market.scale
+                collateral_value += value
+                borrow_limit += ray_mul(value, market.ltv)
+                liquidation_value += ray_mul(value, market.liquidation_threshold)
+            debt = market.get_debt(user_address)
+            if debt:
+                debt_value += debt * price // market.scale
+        return {
+            "collateral_value": collateral_value,
+            "borrow_limit": borrow_limit,
+            "liquidation_value": liquidation_value,
+            "debt_value": debt_value,
+            "health_factor": liquidation_value / debt_value if debt_value else float('inf'),
+        }
+
+    def health_factor(self, user_address, prices=None):
+        return self.account_health(user_address, prices)["health_factor"]
+
+    def liquidate(self, liquidator_address, user_address, debt_asset, collateral_asset, repay_amount):
+        # Repays debt in one market and seizes collateral, plus the
+        # collateral market's bonus, in another.
+        if repay_amount <= 0:
+            raise ValueError("Repay amount must be positive")
+        debt_market = self.market(debt_asset)
+        collateral_market = self.market(collateral_asset)
+        self._observe_prices()
+        if self.health_factor(user_address) >= 1:
+            raise ValueError("Position is not liquidatable")
+        debt_position = debt_market.user_positions.get(user_address)
+        collateral_position = collateral_market.user_positions.get(user_address)
+        debt = debt_market.get_debt(user_address)
+        if debt == 0 or collateral_position is None or collateral_position["collateral"] == 0:
+            raise ValueError("Nothing to liquidate in these markets")
+
+        requested = repay_amount
+        repay_amount = min(repay_amount, ray_mul(debt, debt_market.close_factor))
+        debt_price = self._price(debt_asset)
+        collateral_price = self._price(collateral_asset)
+        bonus = RAY + collateral_market.liquidation_bonus
+        seized = ray_mul(repay_amount * debt_price, bonus) * collateral_market.scale // (collateral_price * debt_market.scale)
+        if seized > collateral_position["collateral"]:
+            seized = collateral_position["collateral"]
+            repay_amount = ray_div(seized * collateral_price, bonus) * debt_market.scale // (debt_price * collateral_market.scale)
+        if repay_amount == 0 or seized == 0:
+            raise ValueError("Nothing to liquidate")
+        if self.ledger.get_balance(liquidator_address, debt_asset) < repay_amount:
+            raise ValueError("Insufficient funds to liquidate")
+
+        collateral_market._release_collateral(user_address, collateral_position, liquidator_address, seized)
+        debt_market._take_repayment(liquidator_address, user_address, debt_position, debt, repay_amount)
+        logger.info(
+            "User %.8s liquidated %.8s: repaid %s %s, seized %s %s",
+            liquidator_address, user_address, repay_amount, debt_asset, seized, collateral_asset,
+        )
+        if bus.sinks:
+            bus.emit(Liquidation(self.address, liquidator_address, user_address, repay_amount, debt_asset, seized, collateral_asset))
+        self._log("liquidate", liquidator_address, repay_amount, {
+            "asset": debt_asset, "collateral_asset": collateral_asset, "borrower": user_address, "requested": requested,
+        })
+        return repay_amount, seized
+
+    def accrue_interest(self, asset=None):
+        markets = self.markets.values() if asset is None else (self.market(asset),)
+        for market in markets:
+            market.accrue_interest()
@@ -0,0 +1,178 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from telemetry import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+MEMPOOL_MAX_SIZE = 10_000
+RECENTLY_CONFIRMED = 100_000
+
+class Mempool:
+    # Pending signed transactions, deduplicated by tx_id. Each sender's
+    # transactions wait in nonce order; across senders the head with the
+    # highest fee goes first (ties by arrival). Submitters block once
+    # max_size transactions are pending, which is the back-pressure seen by
+    # load generators.
+    def __init__(self, max_size=MEMPOOL_MAX_SIZE):
+        self.max_size = max_size
+        self._slots = asyncio.Semaphore(max_size)
+        self._pending = {}
+        self._by_sender = {}
+        self._ready = []
+        self._seq = itertools.count()
+        self._confirmed = OrderedDict()
+        self.max_depth = 0
+        self.submitted = 0
+        self.duplicates = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def submit(self, tx):
+        # Returns a future resolved with the tx's process_batch result once a
+        # block containing it has been applied.
+        tx_id = tx.tx_id
+        entry = self._pending.get(tx_id)
+        if entry is not None:
+            self.duplicates += 1
+            return entry["future"]
+        if tx_id in self._confirmed:
+            self.duplicates += 1
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(self._confirmed[tx_id])
+            return future
+
+        await self._slots.acquire()
+        entry = self._pending.get(tx_id)
+        if entry is not None:
+            self._slots.release()
+            return entry["future"]
+
+        entry = {
+            "tx": tx,
+            "future": asyncio.get_running_loop().create_future(),
+            "submitted_at": time.perf_counter_ns(),
+            "seq": next(self._seq),
+        }
+        self._pending[tx_id] = entry
+        self.submitted += 1
+        self.max_depth = max(self.max_depth, len(self._pending))
+
+        queue = self._by_sender.get(tx.sender)
+        if queue is None:
+            queue = self._by_sender[tx.sender] = []
+            heapq.heappush(queue, (tx.nonce, entry["seq"], tx_id))
+            self._push_head(tx.sender)
+        else:
+            head = queue[0]
+            heapq.heappush(queue, (tx.nonce, entry["seq"], tx_id))
+            if queue[0] is not head:
+                # a lower nonce replaced this sender's head; the old ready
+                # entry goes stale and is skipped in drain()
+                self._push_head(tx.sender)
+        return entry["future"]
+
+    def _push_head(self, sender):
+        nonce, seq, tx_id = self._by_sender[sender][0]
+        fee = self._pending[tx_id]["tx"].fee
+        heapq.heappush(self._ready, (-fee, seq, sender, tx_id))
+
+    def drain(self, max_txs):
+        entries = []
+        while self._ready and len(entries) < max_txs:
+            _, _, sender, tx_id = heapq.heappop(self._ready)
+            queue = self._by_sender.get(sender)
+            if not queue or queue[0][2] != tx_id:
+                continue
+            heapq.heappop(queue)
+            entries.append(self._pending.pop(tx_id))
+            self._slots.release()
+            if queue:
+                self._push_head(sender)
+            else:
+                del self._by_sender[sender]
+        return entries
+
+    def mark_confirmed(self, tx_id, result):
+        # Answers resubmissions of an applied tx without another round trip;
+        # the ledger's nonce check rejects it anyway once evicted from here.
+        self._confirmed[tx_id] = result
+        if len(self._confirmed) > RECENTLY_CONFIRMED:
+            self._confirmed.popitem(last=False)
+
+class BlockProducer:
+    def __init__(self, ledger, mempool, block_size=500, interval=0.05, executor=None):
+        self.ledger = ledger
+        self.mempool = mempool
+        self.block_size = block_size
+        self.interval = interval
+        self.executor = executor
+        self.blocks = 0
+        self.confirmed = 0
+        self.rejected = 0
+        # submit-to-confirm times and queue depth per block, kept as running
+        # aggregates so a long-lived producer does not grow with its traffic
+        self.latencies = LatencyHistogram()
+        self.depth_samples = 0
+        self.depth_total = 0
+        self._stopping = False
+
+    async def run(self):
+        while not self._stopping:
+            await asyncio.sleep(self.interval)
+            await self.produce_block()
+        while len(self.mempool):
+            await self.produce_block()
+
+    def stop(self):
+        # The run loop finishes after draining what is already pending.
+        self._stopping = True
+
+    async def produce_block(self):
+        self.depth_samples += 1
+        self.depth_total += len(self.mempool)
+        entries = self.mempool.drain(self.block_size)
+        if not entries:
+            return []
+        txs = [entry["tx"] for entry in entries]
+        # Verification and application run off the event loop so submitters
+        # keep being served while a block is processed.
+        results = await asyncio.to_thread(self.ledger.process_batch, txs, self.executor)
+
+        confirmed_at = time.perf_counter_ns()
+        for entry, result in zip(entries, results):
+            self.latencies.record(confirmed_at - entry["submitted_at"])
+            if result["accepted"]:
+                # Only applied transactions are remembered; a rejected one
+                # may succeed when resubmitted (e.g. once its sender is funded).
+                self.mempool.mark_confirmed(entry["tx"].tx_id, result)
+                self.confirmed += 1
+            else:
+                self.rejected += 1
+            if not entry["future"].done():
+                entry["future"].set_result(result)
+        self.blocks += 1
+        logger.debug("Block %d: %d txs, %d pending", self.blocks, len(entries), len(self.mempool))
+        return results
+
+    def metrics(self):
+        latencies = self.latencies
+        return {
+            "blocks": self.blocks,
+            "confirmed": self.confirmed,
+            "rejected": self.rejected,
+            "queue_depth": len(self.mempool),
+            "max_queue_depth": self.mempool.max_depth,
+            "mean_queue_depth": self.depth_total / self.depth_samples if self.depth_samples else 0.0,
+            "duplicates": self.mempool.duplicates,
+            "latency_ms": {
+                "p50": latencies.quantile(0.5) / 1e6,
+                "p90": latencies.quantile(0.9) / 1e6,
+                "p99": latencies.quantile(0.99) / 1e6,
+                "max": latencies.max_ns / 1e6,
+            },
+        }
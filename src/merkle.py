@@ -0,0 +1,163 @@
+import hashlib
+
+EMPTY = bytes(32)
+
+def leaf_key(address, token):
+    return hashlib.sha256(address.encode() + b"\x00" + token.encode()).digest()
+
+def value_hash(balance):
+    # Commits to the exact numeric value: integral balances hash the same
+    # whether stored as int or float, anything else by its exact float bits.
+    if isinstance(balance, float) and not balance.is_integer():
+        encoded = balance.hex()
+    else:
+        encoded = str(int(balance))
+    return hashlib.sha256(encoded.encode()).digest()
+
+def _leaf_hash(key, value):
+    return hashlib.sha256(b"\x00" + key + value).digest()
+
+def _branch_hash(left, right):
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+def _bit(key, depth):
+    return (key[depth >> 3] >> (7 - (depth & 7))) & 1
+
+class _Leaf:
+    __slots__ = ("key", "value", "hash")
+
+    def __init__(self, key, value):
+        self.key = key
+        self.value = value
+        self.hash = _leaf_hash(key, value)
+
+class _Branch:
+    __slots__ = ("children", "hash")
+
+    def __init__(self):
+        self.children = [None, None]
+        self.hash = None
+
+class SparseMerkleTree:
+    # Sparse Merkle tree over sha256(address, token) -> balance. An empty
+    # subtree hashes to EMPTY and a subtree holding a single leaf hashes to
+    # that leaf, so paths are only as deep as needed to separate keys
+    # (~log2 n) and the root depends only on the set of entries, never on
+    # the order they were written. Zero balances are absent.
+    #
+    # update() only marks the path dirty; root() rehashes dirty branches
+    # once, so a block of k writes costs at most k * log n hashes and shared
+    # ancestors are hashed once.
+    def __init__(self):
+        self._root = None
+        self.size = 0
+
+    @classmethod
+    def from_state(cls, state):
+        tree = cls()
+        for address, balances in state.items():
+            for token, balance in balances.items():
+                tree.update(address, token, balance)
+        return tree
+
+    def update(self, address, token, balance):
+        key = leaf_key(address, token)
+        if balance:
+            self._root = self._insert(self._root, _Leaf(key, value_hash(balance)), 0)
+        else:
+            self._root = self._remove(self._root, key, 0)
+
+    def _insert(self, node, leaf, depth):
+        if node is None:
+            self.size += 1
+            return leaf
+        if isinstance(node, _Leaf):
+            if node.key == leaf.key:
+                return leaf
+            # split until the two keys diverge
+            self.size += 1
+            top = branch = _Branch()
+            while _bit(node.key, depth) == _bit(leaf.key, depth):
+                child = _Branch()
+                branch.children[_bit(leaf.key, depth)] = child
+                branch = child
+                depth += 1
+            branch.children[_bit(leaf.key, depth)] = leaf
+            branch.children[_bit(node.key, depth)] = node
+            return top
+        side = _bit(leaf.key, depth)
+        node.children[side] = self._insert(node.children[side], leaf, depth + 1)
+        node.hash = None
+        return node
+
+    def _remove(self, node, key, depth):
+        if node is None:
+            return None
+        if isinstance(node, _Leaf):
+            if node.key == key:
+                self.size -= 1
+                return None
+            return node
+        side = _bit(key, depth)
+        node.children[side] = self._remove(node.children[side], key, depth + 1)
+        left, right = node.children
+        # a branch left holding a single leaf collapses into it
+        if left is None and (right is None or isinstance(right, _Leaf)):
+            return right
+        if right is None and isinstance(left, _Leaf):
+            return left
+        node.hash = None
+        return node
+
+    def _hash(self, node):
+        if node is None:
+            return EMPTY
+        if node.hash is None:
+            left, right = node.children
+            node.hash = _branch_hash(self._hash(left), self._hash(right))
+        return node.hash
+
+    def root(self):
+        return self._hash(self._root)
+
+    def prove(self, address, token):
+        # Sibling hashes from the root down to where the key's path ends,
+        # plus the leaf found there, if any. Proves the balance stored for
+        # (address, token), or that it is zero.
+        key = leaf_key(address, token)
+        siblings = []
+        node = self._root
+        depth = 0
+        while isinstance(node, _Branch):
+            side = _bit(key, depth)
+            siblings.append(self._hash(node.children[1 - side]).hex())
+            node = node.children[side]
+            depth += 1
+        leaf = None if node is None else [node.key.hex(), node.value.hex()]
+        return {"siblings": siblings, "leaf": leaf}
+
+def verify_proof(root, address, token, balance, proof):
+    key = leaf_key(address, token)
+    leaf = proof["leaf"]
+    if balance:
+        if leaf is None or bytes.fromhex(leaf[0]) != key or bytes.fromhex(leaf[1]) != value_hash(balance):
+            return False
+    elif leaf is not None and bytes.fromhex(leaf[0]) == key:
+        return False
+
+    siblings = proof["siblings"]
+    if leaf is None:
+        node = EMPTY
+    else:
+        leaf_key_bytes = bytes.fromhex(leaf[0])
+        # the leaf must sit on the path being proven
+        if any(_bit(leaf_key_bytes, d) != _bit(key, d) for d in range(len(siblings))):
+            return False
+        node = _leaf_hash(leaf_key_bytes, bytes.fromhex(leaf[1]))
+    for depth in range(len(siblings) - 1, -1, -1):
+        sibling = bytes.fromhex(siblings[depth])
+        if _bit(key, depth):
+            node = _branch_hash(sibling, node)
+        else:
+            node = _branch_hash(node, sibling)
+    return node == root
@@ -0,0 +1,115 @@
+import os
+import json
+import time
+from itertools import islice
+from blockchain import Ledger
+from contracts import LendingPool
+from storage import BlockLog, write_snapshot
+
+CHECKPOINT_INTERVAL = 100_000
+
+def default_build():
+    ledger = Ledger()
+    return ledger, [LendingPool(ledger)]
+
+class ChainReplayer:
+    # Rebuilds ledger and contract state from a Store's BlockLog, streamed
+    # from disk. Only the log holds the direct contract calls and the clock
+    # and price inputs logged by Ledger.record_call, so an in-memory
+    # Ledger.chain is refused: replaying it would drop all interest.
+    # `build` returns a fresh (ledger, contracts) pair configured like the
+    # original; everything after configuration comes from the log.
+    #
+    # Transactions are executed without being recorded, so replay keeps only
+    # the state itself in memory however long the history is. Checkpoints
+    # of that state are written every `interval` transactions, and a query
+    # for the state at some height replays from the nearest one below it.
+    def __init__(self, log, directory, build=default_build, interval=CHECKPOINT_INTERVAL):
+        if not isinstance(log, BlockLog):
+            raise ValueError("ChainReplayer replays a Store's BlockLog, not an in-memory chain")
+        self.log = log
+        self.directory = directory
+        self.build = build
+        self.interval = interval
+        os.makedirs(directory, exist_ok=True)
+
+    @property
+    def height(self):
+        return self.log.height
+
+    def checkpoint_heights(self):
+        return sorted(
+            int(name[11:-5]) for name in os.listdir(self.directory)
+            if name.startswith("checkpoint-") and name.endswith(".json")
+        )
+
+    def _checkpoint_path(self, height):
+        return os.path.join(self.directory, f"checkpoint-{height:020d}.json")
+
+    def _iter_from(self, height):
+        return self.log.iter_from(height)
+
+    def _restore(self, height):
+        # Fresh state at the nearest checkpoint at or below `height`.
+        ledger, contracts = self.build()
+        heights = [h for h in self.checkpoint_heights() if h <= height]
+        if not heights:
+            return ledger, contracts, 0
+        with open(self._checkpoint_path(heights[-1])) as f:
+            checkpoint = json.load(f)
+        ledger.load_state(checkpoint["ledger"])
+        for contract, contract_state in zip(contracts, checkpoint["contracts"]):
+            contract.load_state(contract_state)
+        return ledger, contracts, checkpoint["height"]
+
+    def _checkpoint(self, height, ledger, contracts):
+        write_snapshot(self._checkpoint_path(height), {
+            "height": height,
+            "ledger": ledger.export_state(),
+            "contracts": [contract.export_state() for contract in contracts],
+        })
+
+    def _replay(self, ledger, contracts, start, stop, checkpoint=False):
+        # Applies transactions [start, stop) and returns how many it applied.
+        count = 0
+        height = start
+        ledger.replaying = True
+        try:
+            for tx in islice(self._iter_from(start), stop - start):
+                try:
+                    ledger._execute(tx)
+                except ValueError as e:
+                    raise ValueError(f"Replay failed at height {height}: {e}") from e
+                height += 1
+                count += 1
+                if checkpoint and height % self.interval == 0:
+                    self._checkpoint(height, ledger, contracts)
+        finally:
+            ledger.replaying = False
+        return count
+
+    def build_checkpoints(self):
+        # Extends the checkpoints to the head of the chain, resuming from the
+        # latest one already written.
+        height = self.height
+        ledger, contracts, start = self._restore(height)
+        started = time.perf_counter()
+        count = self._replay(ledger, contracts, start, height, checkpoint=True)
+        elapsed = time.perf_counter() - started
+        return {
+            "transactions": count,
+            "elapsed_s": elapsed,
+            "tx_per_sec": count / elapsed if elapsed else 0.0,
+            "height": start + count,
+            "checkpoints": len(self.checkpoint_heights()),
+        }
+
+    def state_at(self, height=None):
+        # (ledger, contracts) as they were after the first `height` transactions.
+        if height is None:
+            height = self.height
+        if not 0 <= height <= self.height:
+            raise ValueError(f"Height {height} is outside the chain (0..{self.height})")
+        ledger, contracts, start = self._restore(height)
+        self._replay(ledger, contracts, start, height)
+        return ledger, contracts
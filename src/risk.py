@@ -0,0 +1,124 @@
+import heapq
+import numpy as np
+
+class StaticPriceFeed:
+    def __init__(self, prices):
+        self.prices = dict(prices)
+
+    def get_price(self, token):
+        return self.prices[token]
+
+    def set_price(self, token, price):
+        self.prices[token] = price
+
+class RiskEngine:
+    # Column mirror of LendingPool positions: collateral amount and debt scaled
+    # by the borrow index, so accrual never touches it. Health factor is
+    #   collateral * price * threshold / (scaled_debt * borrow_index)
+    # and its ordering only depends on collateral / scaled_debt, which lets a
+    # single ordering serve every price and index level.
+    #
+    # That ordering is the at-risk heap, by scaled_debt / collateral
+    # (liquidation price divided by the borrow index), largest first. Entries
+    # are never updated in place: a change pushes a new entry and bumps the
+    # position's version, and stale entries are dropped when they surface.
+    # An update is therefore O(log n) and queries never re-sort.
+    def __init__(self, capacity=1024):
+        self.ids = {}
+        self.addresses = []
+        self.collateral = np.zeros(capacity)
+        self.scaled_debt = np.zeros(capacity)
+        self._heap = []
+        self._versions = {}
+
+    def __len__(self):
+        return len(self.addresses)
+
+    def update(self, address, collateral, scaled_debt):
+        i = self.ids.get(address)
+        if i is None:
+            i = len(self.addresses)
+            if i == len(self.collateral):
+                self.collateral = np.concatenate((self.collateral, np.zeros(i)))
+                self.scaled_debt = np.concatenate((self.scaled_debt, np.zeros(i)))
+            self.ids[address] = i
+            self.addresses.append(address)
+        self.collateral[i] = collateral
+        self.scaled_debt[i] = scaled_debt
+        
+        version = self._versions.get(address, 0) + 1
+        self._versions[address] = version
+        if scaled_debt > 0:
+            key = scaled_debt / collateral if collateral > 0 else float("inf")
+            heapq.heappush(self._heap, (-key, version, address))
+        if len(self._heap) > 2 * len(self.addresses) + 1024:
+            self._compact()
+
+    def clear(self):
+        self.ids = {}
+        self.addresses = []
+        self._heap = []
+        self._versions = {}
+
+    def _compact(self):
+        self._heap = [entry for entry in self._heap if self._versions[entry[2]] == entry[1]]
+        heapq.heapify(self._heap)
+
+    def _head(self, limit=None, threshold=None):
+        # Current entries from the top of the heap, riskiest first: at most
+        # `limit` of them, and only those with key above `threshold`. They
+        # are pushed back afterwards; stale entries met on the way are dropped.
+        heap = self._heap
+        found = []
+        while heap and (limit is None or len(found) < limit) and (threshold is None or -heap[0][0] > threshold):
+            entry = heapq.heappop(heap)
+            if self._versions[entry[2]] == entry[1]:
+                found.append(entry)
+        for entry in found:
+            heapq.heappush(heap, entry)
+        return found
+
+    def crossed(self, price, borrow_index, liquidation_threshold):
+        # Positions whose health factor is below 1, riskiest first, from the
+        # heap. Only entries past the threshold are popped, so a sweep that
+        # expects few of them pays only for those.
+        return [entry[2] for entry in self._head(threshold=price * liquidation_threshold / borrow_index)]
+
+    def _ratios(self):
+        n = len(self.addresses)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = self.collateral[:n] / self.scaled_debt[:n]
+        ratio[self.scaled_debt[:n] == 0] = np.inf
+        return ratio
+
+    def health_factors(self, price, borrow_index, liquidation_threshold):
+        return self._ratios() * (price * liquidation_threshold / borrow_index)
+
+    def borrow_headroom(self, price, borrow_index, ltv):
+        n = len(self.addresses)
+        headroom = self.collateral[:n] * (price * ltv) - self.scaled_debt[:n] * borrow_index
+        return np.maximum(headroom, 0.0)
+
+    def bad_debt(self, price, borrow_index):
+        n = len(self.addresses)
+        shortfall = self.scaled_debt[:n] * borrow_index - self.collateral[:n] * price
+        return float(np.maximum(shortfall, 0.0).sum())
+
+    def unhealthy(self, price, borrow_index, liquidation_threshold):
+        # Same set as crossed(), found with one vectorised pass; only the
+        # positions below 1 are sorted, riskiest first.
+        health = self.health_factors(price, borrow_index, liquidation_threshold)
+        below = np.flatnonzero(health < 1)
+        below = below[np.argsort(health[below], kind="stable")]
+        addresses = self.addresses
+        return [addresses[i] for i in below.tolist()]
+
+    def riskiest(self, n, price, borrow_index, liquidation_threshold):
+        # The n lowest health factors among positions with debt, from the
+        # top of the at-risk heap.
+        scale = price * liquidation_threshold / borrow_index
+        riskiest = []
+        for _, _, address in self._head(limit=n):
+            i = self.ids[address]
+            riskiest.append((address, self.collateral[i] / self.scaled_debt[i] * scale))
+        return riskiest
@@ -0,0 +1,124 @@
+import threading
+from crypto import Wallet
+from blockchain import Ledger
+from contracts import LendingPool
+
+class ProtocolService:
+    # One Ledger/LendingPool shared by every dashboard session. Mutations run
+    # under a single lock and bump a version counter; readers get
+    # a read-only snapshot rebuilt at most once per version, so a
+    # rerun that changed nothing does no protocol work at all.
+    #
+    # Pool actions are signed with the session's wallet and applied through
+    # the ledger, so they land in Ledger.chain and the history like any
+    # other transaction.
+    def __init__(self, ledger=None, pool=None):
+        self.ledger = ledger if ledger is not None else Ledger()
+        self.pool = pool if pool is not None else LendingPool(self.ledger)
+        self.lock = threading.RLock()
+        self.wallets = {}
+        self._wallets_by_address = {}
+        self.version = 0
+        self._snapshot = None
+
+    def add_wallet(self, name, wallet=None, balances=None):
+        wallet = wallet or Wallet()
+        with self.lock:
+            self.wallets[name] = wallet
+            self._wallets_by_address[wallet.address] = wallet
+            for token, amount in (balances or {}).items():
+                self.ledger.mint(wallet.address, amount, token)
+            self._bump()
+        return wallet
+
+    def _bump(self):
+        self.version += 1
+        self._snapshot = None
+
+    def execute(self, fn, *args, **kwargs):
+        with self.lock:
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._bump()
+
+    def read(self, fn, *args, **kwargs):
+        with self.lock:
+            return fn(*args, **kwargs)
+
+    def _submit(self, action, user_address, amount):
+        wallet = self._wallets_by_address.get(user_address)
+        if wallet is None:
+            raise ValueError(f"No wallet for address {user_address}")
+        # the nonce is read and used under the lock, so sessions never race for it
+        with self.lock:
+            tx = self.pool.transaction(wallet, action, amount, nonce=self.ledger.next_nonce.get(user_address, 0))
+            return self.execute(self.ledger.process_transaction, tx)
+
+    def deposit(self, user_address, amount):
+        return self._submit("deposit", user_address, amount)
+
+    def withdraw(self, user_address, amount):
+        return self._submit("withdraw", user_address, amount)
+
+    def add_collateral(self, user_address, amount):
+        return self._submit("add_collateral", user_address, amount)
+
+    def borrow(self, user_address, amount):
+        return self._submit("borrow", user_address, amount)
+
+    def repay(self, user_address, amount):
+        return self._submit("repay", user_address, amount)
+
+    def accrue_interest(self):
+        return self.execute(self.pool.accrue_interest)
+
+    def advance_time(self, seconds):
+        # The pool catches up on interest lazily; accruing here keeps the
+        # snapshot's totals current for the new time.
+        with self.lock:
+            self.pool.clock.advance(seconds)
+        return self.accrue_interest()
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+        with self.lock:
+            if self._snapshot is None:
+                self._snapshot = self._build_snapshot()
+            return self._snapshot
+
+    def _build_snapshot(self):
+        pool = self.pool
+        accounts = {}
+        for name, wallet in self.wallets.items():
+            address = wallet.address
+            position = pool.user_positions.get(address)
+            shares = pool.supplier_shares.get(address)
+            accounts[name] = {
+                "address": address,
+                "balances": {
+                    pool.token_name: self.ledger.get_balance(address, pool.token_name),
+                    pool.collateral_token: self.ledger.get_balance(address, pool.collateral_token),
+                },
+                "position": None if position is None else {
+                    "collateral": position["collateral"],
+                    "debt": pool.get_debt(address),
+                    "health_factor": pool.health_factor(address),
+                },
+                "supply": None if shares is None else {
+                    "shares": shares,
+                    "balance": pool.supplied_balance(address),
+                },
+            }
+        return {
+            "version": self.version,
+            "total_liquidity": pool.total_liquidity,
+            "total_borrowed": pool.total_borrowed,
+            "borrow_rate": pool.get_borrow_rate(),
+            "supply_rate": pool.get_supply_rate(),
+            "supply_index": pool.supply_index,
+            "history_height": len(self.ledger.history),
+            "accounts": accounts,
+        }
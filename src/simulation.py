@@ -0,0 +1,201 @@
+import json
+import math
+import random
+import time
+import hashlib
+import logging
+from amounts import from_ray, from_units, ray_mul, to_units
+from blockchain import Ledger
+from clock import SimulatedClock
+from contracts import LendingPool
+from state import ColumnarLedger
+from storage import Store
+
+logger = logging.getLogger(__name__)
+
+ACTIONS = ("deposit", "withdraw", "add_collateral", "borrow", "repay")
+LIQUIDATOR = "SIMULATION_LIQUIDATOR"
+
+DEFAULT_SCENARIO = {
+    "agents": 1000,
+    "steps": 100_000,
+    "seed": 0,
+    "ledger": "dict",
+    # whole tokens; converted to each token's base units
+    "initial_balances": {"USDC": 10_000, "ETH": 10},
+    # any of ACTIONS; "withdraw" is off by default
+    "action_mix": {"deposit": 0.3, "add_collateral": 0.2, "borrow": 0.3, "repay": 0.2},
+    # fraction of the relevant balance, headroom or debt used per action
+    "max_fraction": 0.2,
+    "price_path": {"start": 2000.0, "volatility": 0.01, "every": 100},
+    # simulated seconds between steps; interest compounds over them
+    "seconds_per_step": 60,
+    # steps between explicit accrue_interest() calls (the pool also accrues on every touch)
+    "accrue_every": 1000,
+    # whole USDC
+    "liquidator_balance": 1_000_000_000,
+    # LendingPool parameter overrides, e.g. {"ltv": 0.7, "base_rate": 0.03}
+    "pool": {},
+    # directory for a block log of the run, which ChainReplayer can rebuild it from
+    "store": None,
+}
+
+def load_scenario(path):
+    with open(path) as f:
+        return json.load(f)
+
+def agent_address(seed, index):
+    return hashlib.sha256(f"{seed}:{index}".encode()).hexdigest()
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0
+    rank = max(0, math.ceil(q / 100 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+class Simulation:
+    def __init__(self, scenario=None):
+        self.scenario = {**DEFAULT_SCENARIO, **(scenario or {})}
+        scenario = self.scenario
+        self.rng = random.Random(scenario["seed"])
+
+        self.ledger = ColumnarLedger() if scenario["ledger"] == "columnar" else Ledger()
+        self.clock = SimulatedClock()
+        self.pool = LendingPool(self.ledger, clock=self.clock)
+        self.pool.configure(**scenario["pool"])
+        self.store = None
+        if scenario["store"]:
+            self.store = Store(scenario["store"])
+            self.store.open(self.ledger, [self.pool])
+        self.price = scenario["price_path"]["start"]
+        self.pool.price_feed.set_price(self.pool.collateral_token, self.price)
+
+        self.agents = [agent_address(scenario["seed"], i) for i in range(scenario["agents"])]
+        for token, amount in scenario["initial_balances"].items():
+            self.ledger.mint_many(self.agents, to_units(amount, token), token)
+        self.ledger.mint(LIQUIDATOR, to_units(scenario["liquidator_balance"], self.pool.token_name), self.pool.token_name)
+
+        self.latencies = {action: [] for action in ACTIONS + ("accrue", "liquidate")}
+        self.rejected = {action: 0 for action in self.latencies}
+        self.elapsed = 0.0
+        self.utilization_sum = 0.0
+        self.utilization_samples = 0
+        self.liquidations = 0
+
+    def _amount(self, action, address):
+        pool = self.pool
+        fraction = self.rng.random() * self.scenario["max_fraction"]
+        if action == "deposit":
+            return int(self.ledger.get_balance(address, pool.token_name) * fraction)
+        if action == "withdraw":
+            return int(pool.supplied_balance(address) * fraction)
+        if action == "add_collateral":
+            return int(self.ledger.get_balance(address, pool.collateral_token) * fraction)
+        if action == "borrow":
+            position = pool.user_positions.get(address)
+            if position is None:
+                return to_units(1, pool.token_name)
+            headroom = ray_mul(pool.collateral_value(position["collateral"]), pool.ltv) - pool.get_debt(address)
+            return int(max(headroom, 0) * fraction)
+        return int(pool.get_debt(address) * fraction)
+
+    def _step_price(self):
+        path = self.scenario["price_path"]
+        self.price *= math.exp(path["volatility"] * self.rng.gauss(0.0, 1.0))
+        self.pool.price_feed.set_price(self.pool.collateral_token, self.price)
+        self.utilization_sum += from_ray(self.pool.get_utilization_rate())
+        self.utilization_samples += 1
+
+    def _timed(self, action, fn, *args):
+        start = time.perf_counter_ns()
+        result = None
+        try:
+            result = fn(*args)
+        except ValueError:
+            self.rejected[action] += 1
+        self.latencies[action].append(time.perf_counter_ns() - start)
+        return result
+
+    def run(self):
+        scenario = self.scenario
+        rng = self.rng
+        pool = self.pool
+        mix = scenario["action_mix"]
+        actions = list(mix)
+        methods = {action: getattr(pool, action) for action in actions}
+        cum_weights = []
+        total = 0.0
+        for action in actions:
+            total += mix[action]
+            cum_weights.append(total)
+        price_every = scenario["price_path"]["every"]
+        accrue_every = scenario["accrue_every"]
+        seconds_per_step = scenario["seconds_per_step"]
+
+        start = time.perf_counter()
+        for step in range(1, scenario["steps"] + 1):
+            self.clock.advance(seconds_per_step)
+            action = rng.choices(actions, cum_weights=cum_weights)[0]
+            address = rng.choice(self.agents)
+            self._timed(action, methods[action], address, self._amount(action, address))
+
+            if price_every and step % price_every == 0:
+                self._step_price()
+                self.liquidations += len(self._timed("liquidate", pool.liquidate_all, LIQUIDATOR))
+            if accrue_every and step % accrue_every == 0:
+                self._timed("accrue", pool.accrue_interest)
+        self.elapsed = time.perf_counter() - start
+        if self.store is not None:
+            self.store.log.flush()
+        logger.info("Simulation finished %d steps in %.2fs", scenario["steps"], self.elapsed)
+        return self.report()
+
+    def report(self):
+        operations = {}
+        total_ops = 0
+        for action, samples in self.latencies.items():
+            if not samples:
+                continue
+            samples = sorted(samples)
+            total_ops += len(samples)
+            operations[action] = {
+                "count": len(samples),
+                "rejected": self.rejected[action],
+                "p50_us": percentile(samples, 50) / 1e3,
+                "p90_us": percentile(samples, 90) / 1e3,
+                "p99_us": percentile(samples, 99) / 1e3,
+                "max_us": samples[-1] / 1e3,
+            }
+        return {
+            "steps": self.scenario["steps"],
+            "simulated_days": self.clock.now() / 86400,
+            "elapsed_s": self.elapsed,
+            "ops_per_sec": total_ops / self.elapsed if self.elapsed else 0.0,
+            "operations": operations,
+            "liquidations": self.liquidations,
+            "pool": {
+                "total_liquidity": from_units(self.pool.total_liquidity, self.pool.token_name),
+                "total_borrowed": from_units(self.pool.total_borrowed, self.pool.token_name),
+                "utilization": from_ray(self.pool.get_utilization_rate()),
+                "mean_utilization": self.utilization_sum / self.utilization_samples if self.utilization_samples else 0.0,
+                "bad_debt": self.pool.bad_debt(),
+                "price": self.price,
+            },
+        }
+
+def format_report(report):
+    lines = [
+        f"{report['steps']:,} steps ({report['simulated_days']:,.1f} simulated days) in {report['elapsed_s']:.2f}s ({report['ops_per_sec']:,.0f} ops/sec)",
+        f"{'operation':<16}{'count':>10}{'rejected':>10}{'p50 us':>10}{'p90 us':>10}{'p99 us':>10}{'max us':>12}",
+    ]
+    for action, stats in report["operations"].items():
+        lines.append(
+            f"{action:<16}{stats['count']:>10,}{stats['rejected']:>10,}{stats['p50_us']:>10.1f}"
+            f"{stats['p90_us']:>10.1f}{stats['p99_us']:>10.1f}{stats['max_us']:>12.1f}"
+        )
+    pool = report["pool"]
+    lines.append(
+        f"pool: liquidity {pool['total_liquidity']:,.2f}, borrowed {pool['total_borrowed']:,.2f}, "
+        f"utilization {pool['utilization']:.2%}, price {pool['price']:,.2f}"
+    )
+    return "\n".join(lines)
@@ -0,0 +1,177 @@
+from array import array
+import numpy as np
+from amounts import decimals
+from blockchain import Ledger
+from telemetry import BalanceUpdated, bus
+
+# Tokens with at most this many decimals get a packed int64 column, which
+# holds balances up to ~9.2e9 whole tokens. Higher-precision tokens (ETH has
+# 18) would overflow it and use a list of Python ints instead.
+INT64_MAX_DECIMALS = 9
+INT64_MAX = 2 ** 63 - 1
+
+class ColumnarLedger(Ledger):
+    # Balances live in one contiguous column per token, indexed by an
+    # interned account id, in integer base units. Packed columns are plain
+    # array('q') so single-account reads and writes stay cheap; bulk
+    # operations work on zero-copy NumPy views of the same buffers.
+    def __init__(self):
+        self.address_ids = {}
+        self.addresses = []
+        self.token_ids = {}
+        self.tokens = []
+        self.columns = []
+        super().__init__()
+
+    @property
+    def state(self):
+        # Materialised nested-dict view for compatibility; zero balances are omitted.
+        state = {}
+        for token, column in zip(self.tokens, self.columns):
+            for address, balance in zip(self.addresses, column):
+                if balance:
+                    state.setdefault(address, {})[token] = balance
+        return state
+
+    @state.setter
+    def state(self, value):
+        self.address_ids = {}
+        self.addresses = []
+        for column in self.columns:
+            del column[:]
+        for address, balances in value.items():
+            i = self._intern(address)
+            for token, amount in balances.items():
+                self._column(token)[i] = amount
+
+    def _intern(self, address):
+        i = len(self.addresses)
+        self.address_ids[address] = i
+        self.addresses.append(address)
+        for column in self.columns:
+            column.append(0)
+        return i
+
+    def intern_many(self, addresses):
+        ids = self.address_ids
+        start = len(self.addresses)
+        out = [ids.get(address) for address in addresses]
+        if None in out:
+            for n, i in enumerate(out):
+                if i is None:
+                    address = addresses[n]
+                    i = ids.get(address)
+                    if i is None:
+                        i = len(self.addresses)
+                        ids[address] = i
+                        self.addresses.append(address)
+                    out[n] = i
+            added = len(self.addresses) - start
+            for column in self.columns:
+                if isinstance(column, array):
+                    column.frombytes(bytes(8 * added))
+                else:
+                    column.extend([0] * added)
+        return np.array(out, dtype=np.int64)
+
+    def _column(self, token):
+        t = self.token_ids.get(token)
+        if t is None:
+            t = len(self.tokens)
+            self.token_ids[token] = t
+            self.tokens.append(token)
+            if decimals(token) <= INT64_MAX_DECIMALS:
+                column = array("q", bytes(8 * len(self.addresses)))
+            else:
+                column = [0] * len(self.addresses)
+            self.columns.append(column)
+        return self.columns[t]
+
+    def column_view(self, token):
+        # Zero-copy int64 view of a packed column; drop it before new
+        # accounts are added, as a column cannot grow while a view of its
+        # buffer is alive. Unpacked columns are copied into an object array.
+        column = self._column(token)
+        if isinstance(column, array):
+            return np.frombuffer(column, dtype=np.int64)
+        return np.array(column, dtype=object)
+
+    def get_balance(self, address, token="ETH"):
+        i = self.address_ids.get(address)
+        t = self.token_ids.get(token)
+        if i is None or t is None:
+            return 0
+        return self.columns[t][i]
+
+    def update_balance(self, address, amount, token="ETH"):
+        i = self.address_ids.get(address)
+        if i is None:
+            i = self._intern(address)
+        column = self._column(token)
+        column[i] += amount
+        if self.merkle is not None:
+            self.merkle.update(address, token, column[i])
+        if bus.sinks:
+            bus.emit(BalanceUpdated(address, token, amount, column[i]))
+
+    def _after_bulk(self, ids, amounts, sign, token):
+        # Merkle leaves and events for the accounts a bulk operation touched.
+        if self.merkle is None and not bus.sinks:
+            return
+        column = self._column(token)
+        ids = np.asarray(ids).tolist()
+        if self.merkle is not None:
+            for i in set(ids):
+                self.merkle.update(self.addresses[i], token, int(column[i]))
+        if bus.sinks:
+            amounts = self._amount_list(amounts, len(ids))
+            for i, amount in zip(ids, amounts):
+                bus.emit(BalanceUpdated(self.addresses[i], token, sign * amount, int(column[i])))
+
+    def bulk_credit(self, addresses, amounts, token="ETH"):
+        ids = self.intern_many(addresses)
+        column = self._column(token)
+        if isinstance(column, array):
+            view = np.frombuffer(column, dtype=np.int64)
+            amounts = np.broadcast_to(np.asarray(amounts, dtype=np.int64), ids.shape)
+            # int64 adds wrap silently; refuse anything that could
+            if len(ids) and float(view[ids].max()) + float(np.abs(amounts).sum(dtype=np.float64)) >= INT64_MAX:
+                raise OverflowError("Balance exceeds the int64 column range")
+            np.add.at(view, ids, amounts)
+        else:
+            for i, amount in zip(ids.tolist(), self._amount_list(amounts, len(ids))):
+                column[i] += amount
+        self._after_bulk(ids, amounts, 1, token)
+
+    def _amount_list(self, amounts, n):
+        if isinstance(amounts, int):
+            return [amounts] * n
+        return [int(amount) for amount in amounts]
+
+    def bulk_debit(self, addresses, amounts, token="ETH"):
+        # All-or-nothing: every account must cover its total debit in the batch.
+        ids = np.fromiter((self.address_ids.get(a, -1) for a in addresses), dtype=np.int64, count=len(addresses))
+        if (ids < 0).any():
+            raise ValueError("Insufficient funds")
+
+        column = self._column(token)
+        if isinstance(column, array):
+            view = np.frombuffer(column, dtype=np.int64)
+            amounts = np.broadcast_to(np.asarray(amounts, dtype=np.int64), ids.shape)
+            unique_ids, inverse = np.unique(ids, return_inverse=True)
+            needed = np.zeros(len(unique_ids), dtype=np.int64)
+            np.add.at(needed, inverse, amounts)
+            if (view[unique_ids] < needed).any():
+                raise ValueError("Insufficient funds")
+            np.subtract.at(view, ids, amounts)
+        else:
+            ids = ids.tolist()
+            amounts = self._amount_list(amounts, len(ids))
+            needed = {}
+            for i, amount in zip(ids, amounts):
+                needed[i] = needed.get(i, 0) + amount
+            if any(column[i] < total for i, total in needed.items()):
+                raise ValueError("Insufficient funds")
+            for i, amount in zip(ids, amounts):
+                column[i] -= amount
+        self._after_bulk(ids, amounts, -1, token)
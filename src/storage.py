@@ -0,0 +1,189 @@
+import os
+import json
+import mmap
+import struct
+from blockchain import Transaction
+
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+SNAPSHOT_INTERVAL = 100_000
+SNAPSHOTS_KEPT = 2
+
+# record = u32 encoded tx length | u16 signature length | tx | signature
+_RECORD_HEADER = struct.Struct(">IH")
+
+def write_snapshot(path, snapshot):
+    # written to a temporary file and renamed, so a crash never leaves a torn one
+    with open(path + ".tmp", "w") as f:
+        json.dump(snapshot, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+class BlockLog:
+    def __init__(self, directory, segment_max_bytes=SEGMENT_MAX_BYTES):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        # segments are named after the height of their first record
+        self.segments = sorted(
+            int(name[:-4]) for name in os.listdir(directory) if name.endswith(".log")
+        )
+        if not self.segments:
+            self.segments = [0]
+            open(self._segment_path(0), "wb").close()
+
+        last = self.segments[-1]
+        count, valid_bytes = self._scan(self._segment_path(last))
+        self.height = last + count
+
+        self._active = open(self._segment_path(last), "r+b")
+        # drop a partially written trailing record left by a crash
+        self._active.truncate(valid_bytes)
+        self._active.seek(valid_bytes)
+        self._active_bytes = valid_bytes
+
+    def _segment_path(self, start):
+        return os.path.join(self.directory, f"{start:020d}.log")
+
+    def _scan(self, path):
+        count = 0
+        offset = 0
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return 0, 0
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                while offset + _RECORD_HEADER.size <= size:
+                    tx_len, sig_len = _RECORD_HEADER.unpack_from(view, offset)
+                    end = offset + _RECORD_HEADER.size + tx_len + sig_len
+                    if end > size:
+                        break
+                    offset = end
+                    count += 1
+        return count, offset
+
+    def append(self, tx):
+        encoded = tx.encode()
+        signature = (tx.signature or "").encode()
+        record = _RECORD_HEADER.pack(len(encoded), len(signature)) + encoded + signature
+
+        if self._active_bytes and self._active_bytes + len(record) > self.segment_max_bytes:
+            self._roll()
+        self._active.write(record)
+        self._active_bytes += len(record)
+        self.height += 1
+
+    def _roll(self):
+        self._active.close()
+        self.segments.append(self.height)
+        self._active = open(self._segment_path(self.height), "w+b")
+        self._active_bytes = 0
+
+    def flush(self, sync=False):
+        self._active.flush()
+        if sync:
+            os.fsync(self._active.fileno())
+
+    def close(self):
+        self._active.close()
+
+    def iter_from(self, height=0):
+        self.flush()
+        for i, start in enumerate(self.segments):
+            end = self.segments[i + 1] if i + 1 < len(self.segments) else self.height
+            if end <= height:
+                continue
+            yield from self._iter_segment(start, height)
+
+    def _iter_segment(self, start, height):
+        with open(self._segment_path(start), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                offset = 0
+                position = start
+                size = len(view)
+                header_size = _RECORD_HEADER.size
+                while offset < size:
+                    tx_len, sig_len = _RECORD_HEADER.unpack_from(view, offset)
+                    body = offset + header_size
+                    offset = body + tx_len + sig_len
+                    if position >= height:
+                        signature = view[body + tx_len:offset].decode() or None
+                        yield Transaction.decode(view[body:body + tx_len], signature)
+                    position += 1
+
+class Store:
+    def __init__(self, directory, snapshot_interval=SNAPSHOT_INTERVAL, segment_max_bytes=SEGMENT_MAX_BYTES):
+        self.directory = directory
+        self.snapshot_interval = snapshot_interval
+        self.log = BlockLog(os.path.join(directory, "log"), segment_max_bytes)
+        self.ledger = None
+        self.pools = []
+        self.snapshot_height = 0
+
+    def _snapshot_heights(self):
+        return sorted(
+            int(name[9:-5]) for name in os.listdir(self.directory)
+            if name.startswith("snapshot-") and name.endswith(".json")
+        )
+
+    def _snapshot_path(self, height):
+        return os.path.join(self.directory, f"snapshot-{height:020d}.json")
+
+    def open(self, ledger, pools=()):
+        # Restore from the latest snapshot, then replay only the log tail.
+        # Logged transactions were verified when first accepted, so replay
+        # applies them without re-checking signatures.
+        self.ledger = ledger
+        self.pools = list(pools)
+
+        heights = [h for h in self._snapshot_heights() if h <= self.log.height]
+        if heights:
+            with open(self._snapshot_path(heights[-1])) as f:
+                snapshot = json.load(f)
+            ledger.load_state(snapshot["ledger"])
+            for pool, pool_state in zip(self.pools, snapshot["pools"]):
+                pool.load_state(pool_state)
+            self.snapshot_height = snapshot["height"]
+
+        # Calls and inputs that contracts only logged are executed; the
+        # rest went through the ledger and rejoin its chain and history.
+        ledger.replaying = True
+        try:
+            for tx in self.log.iter_from(self.snapshot_height):
+                if ledger.is_logged_call(tx):
+                    ledger._execute(tx)
+                else:
+                    ledger._apply(tx)
+        finally:
+            ledger.replaying = False
+
+        ledger.storage = self
+        return ledger
+
+    def record(self, tx):
+        self.log.append(tx)
+        if self.log.height - self.snapshot_height >= self.snapshot_interval:
+            self.snapshot()
+
+    def snapshot(self):
+        self.log.flush(sync=True)
+        height = self.log.height
+        snapshot = {
+            "height": height,
+            "ledger": self.ledger.export_state(),
+            "pools": [pool.export_state() for pool in self.pools],
+        }
+        write_snapshot(self._snapshot_path(height), snapshot)
+        self.snapshot_height = height
+
+        for old in self._snapshot_heights()[:-SNAPSHOTS_KEPT]:
+            os.remove(self._snapshot_path(old))
+
+    def close(self):
+        # A closing snapshot lets the next open() skip replaying the tail.
+        if self.ledger is not None:
+            self.snapshot()
+        self.log.close()
@@ -0,0 +1,187 @@
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from simulation import DEFAULT_SCENARIO, Simulation
+
+logger = logging.getLogger(__name__)
+
+HISTOGRAM_BINS = 100
+
+DEFAULT_SWEEP = {
+    "seed": 0,
+    "runs_per_point": 100,
+    # every combination of these LendingPool parameters is one sweep point
+    "grid": {"base_rate": [0.05], "utilization_slope": [0.1], "ltv": [0.65, 0.75, 0.85]},
+    # each run draws its volatility uniformly from this range and its
+    # action mix weights uniformly from [0.5, 1.5] times the base mix
+    "volatility": [0.005, 0.05],
+    "scenario": {"agents": 100, "steps": 5000, "accrue_every": 100},
+}
+
+def run_seed(base_seed, point, run):
+    digest = hashlib.sha256(f"{base_seed}:{point}:{run}".encode()).digest()
+    return int.from_bytes(digest[:8], "big")
+
+def grid_points(grid):
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+def iter_tasks(sweep):
+    for point, params in enumerate(grid_points(sweep["grid"])):
+        for run in range(sweep["runs_per_point"]):
+            yield (point, run, params, run_seed(sweep["seed"], point, run), sweep)
+
+def run_one(task):
+    point, run, params, seed, sweep = task
+    rng = random.Random(seed)
+    scenario = {**DEFAULT_SCENARIO, **sweep["scenario"]}
+    low, high = sweep["volatility"]
+    scenario["seed"] = seed
+    scenario["pool"] = {**scenario.get("pool", {}), **params}
+    scenario["price_path"] = {**scenario["price_path"], "volatility": rng.uniform(low, high)}
+    scenario["action_mix"] = {a: w * rng.uniform(0.5, 1.5) for a, w in scenario["action_mix"].items()}
+
+    report = Simulation(scenario).run()
+    pool = report["pool"]
+    liquidity = pool["total_liquidity"]
+    return {
+        "point": point,
+        "run": run,
+        "seed": seed,
+        "params": params,
+        "volatility": scenario["price_path"]["volatility"],
+        "final_price": pool["price"],
+        "utilization": pool["mean_utilization"],
+        "bad_debt": pool["bad_debt"],
+        "bad_debt_ratio": pool["bad_debt"] / liquidity if liquidity else 0.0,
+        "solvent": pool["bad_debt"] == 0,
+        "liquidations": report["liquidations"],
+    }
+
+class Distribution:
+    # Streaming summary of a value in [0, 1]: exact count/mean/min/max plus a
+    # fixed-width histogram for quantiles, so memory does not grow with runs.
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = float("-inf")
+        self.histogram = [0] * HISTOGRAM_BINS
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        bucket = min(max(int(value * HISTOGRAM_BINS), 0), HISTOGRAM_BINS - 1)
+        self.histogram[bucket] += 1
+
+    def quantile(self, q):
+        target = q * self.count
+        seen = 0
+        for bucket, n in enumerate(self.histogram):
+            seen += n
+            if n and seen >= target:
+                return min(max((bucket + 1) / HISTOGRAM_BINS, self.min), self.max)
+        return self.max
+
+    def summary(self):
+        if not self.count:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": self.total / self.count,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+        }
+
+class PointAggregate:
+    def __init__(self, params):
+        self.params = params
+        self.runs = 0
+        self.insolvent = 0
+        self.utilization = Distribution()
+        self.bad_debt_ratio = Distribution()
+
+    def add(self, result):
+        self.runs += 1
+        self.insolvent += not result["solvent"]
+        self.utilization.add(result["utilization"])
+        self.bad_debt_ratio.add(result["bad_debt_ratio"])
+
+    def summary(self):
+        return {
+            "params": self.params,
+            "runs": self.runs,
+            "solvency_rate": 1 - self.insolvent / self.runs if self.runs else None,
+            "utilization": self.utilization.summary(),
+            "bad_debt_ratio": self.bad_debt_ratio.summary(),
+        }
+
+def run_sweep(sweep=None, out_dir="sweep_results", workers=None):
+    # Tasks are submitted in fixed-size windows and consumed in order, so
+    # only a window of results is ever held in memory and the output file
+    # is identical for a given seed regardless of the worker count.
+    sweep = {**DEFAULT_SWEEP, **(sweep or {})}
+    workers = workers or os.cpu_count() or 1
+    window = workers * 8
+    os.makedirs(out_dir, exist_ok=True)
+
+    points = grid_points(sweep["grid"])
+    aggregates = [PointAggregate(params) for params in points]
+    tasks = iter_tasks(sweep)
+    total = len(points) * sweep["runs_per_point"]
+    done = 0
+
+    with open(os.path.join(out_dir, "runs.jsonl"), "w") as out, ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            batch = list(itertools.islice(tasks, window))
+            if not batch:
+                break
+            for result in executor.map(run_one, batch, chunksize=max(1, len(batch) // (workers * 2))):
+                out.write(json.dumps(result) + "\n")
+                aggregates[result["point"]].add(result)
+            done += len(batch)
+            logger.info("Completed %d/%d runs", done, total)
+
+    summary = {"sweep": sweep, "points": [aggregate.summary() for aggregate in aggregates]}
+    with open(os.path.join(out_dir, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monte Carlo parameter sweep over the lending pool")
+    parser.add_argument("--config", help="JSON sweep file; keys override the defaults")
+    parser.add_argument("--out", default="sweep_results")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--runs", type=int, help="runs per grid point")
+    parser.add_argument("--log-level", default="INFO", help="level for sweep progress; protocol logs stay at WARNING")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+    logger.setLevel(args.log_level.upper())
+    sweep = {}
+    if args.config:
+        with open(args.config) as f:
+            sweep = json.load(f)
+    if args.runs is not None:
+        sweep["runs_per_point"] = args.runs
+
+    summary = run_sweep(sweep, args.out, args.workers)
+    for point in summary["points"]:
+        print(
+            f"{point['params']}: solvency {point['solvency_rate']:.1%}, "
+            f"mean utilization {point['utilization']['mean']:.1%}, "
+            f"p99 bad debt ratio {point['bad_debt_ratio']['p99']:.2%}"
+        )
+
+if __name__ == "__main__":
+    main()
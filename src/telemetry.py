@@ -0,0 +1,177 @@
+import functools
+import importlib
+import json
+import time
+from collections import deque, namedtuple
+
+# Typed events for every ledger and pool mutation. Amounts are integer base
+# units, as everywhere else.
+BalanceUpdated = namedtuple("BalanceUpdated", "address token amount balance")
+TransactionApplied = namedtuple("TransactionApplied", "tx_id action sender receiver amount fee")
+PoolAction = namedtuple("PoolAction", "pool action user amount token")
+Liquidation = namedtuple("Liquidation", "pool liquidator user repaid debt_token seized collateral_token")
+InterestAccrued = namedtuple("InterestAccrued", "pool token borrow_index total_borrowed")
+
+class EventBus:
+    # Emitters check `bus.sinks` before building an event, so with no sink
+    # attached a mutation pays for one attribute test and nothing else.
+    def __init__(self):
+        self.sinks = []
+
+    def subscribe(self, sink):
+        self.sinks.append(sink)
+        return sink
+
+    def unsubscribe(self, sink):
+        self.sinks.remove(sink)
+
+    def emit(self, event):
+        for sink in self.sinks:
+            sink.handle(event)
+
+bus = EventBus()
+
+def event_dict(event):
+    return {"type": type(event).__name__, **event._asdict()}
+
+class RingBufferSink:
+    def __init__(self, capacity=10_000):
+        self.events = deque(maxlen=capacity)
+
+    def handle(self, event):
+        self.events.append(event)
+
+class NDJSONSink:
+    # One JSON object per line, stamped with the wall-clock time in ns.
+    def __init__(self, path):
+        self.file = open(path, "a")
+
+    def handle(self, event):
+        record = event_dict(event)
+        record["time_ns"] = time.time_ns()
+        self.file.write(json.dumps(record) + "\n")
+
+    def close(self):
+        self.file.close()
+
+class MetricsSink:
+    # Running counts per event type and amount totals per (event type, token).
+    # Balance volume sums the credits only: every move is a debit and an
+    # equal credit, so signed deltas would cancel out.
+    def __init__(self):
+        self.counts = {}
+        self.volumes = {}
+
+    def handle(self, event):
+        kind = type(event).__name__
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        if isinstance(event, PoolAction) or (isinstance(event, BalanceUpdated) and event.amount > 0):
+            key = (kind, event.token)
+            self.volumes[key] = self.volumes.get(key, 0) + event.amount
+
+    def summary(self):
+        return {
+            "counts": dict(self.counts),
+            "volumes": {f"{kind}:{token}": amount for (kind, token), amount in self.volumes.items()},
+        }
+
+class LatencyHistogram:
+    # Power-of-two buckets over nanoseconds: bucket b holds durations in
+    # [2**(b-1), 2**b), so recording is a bit_length() and an increment.
+    def __init__(self):
+        self.buckets = [0] * 64
+        self.count = 0
+        self.errors = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, ns):
+        self.buckets[min(ns.bit_length(), 63)] += 1
+        self.count += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def quantile(self, q):
+        # Upper edge of the bucket holding the q-th duration.
+        target = q * self.count
+        seen = 0
+        for bucket, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= target:
+                return min(2 ** bucket, self.max_ns)
+        return self.max_ns
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean_us": self.total_ns / self.count / 1e3 if self.count else 0.0,
+            "p50_us": self.quantile(0.5) / 1e3,
+            "p99_us": self.quantile(0.99) / 1e3,
+            "max_us": self.max_ns / 1e3,
+        }
+
+# (module, class, method) timed by Profiler
+PROFILED = (
+    ("blockchain", "Ledger", "process_transaction"),
+    ("crypto", "Wallet", "verify"),
+    ("contracts", "LendingPool", "deposit"),
+    ("contracts", "LendingPool", "withdraw"),
+    ("contracts", "LendingPool", "add_collateral"),
+    ("contracts", "LendingPool", "borrow"),
+    ("contracts", "LendingPool", "repay"),
+    ("contracts", "LendingPool", "liquidate"),
+    ("contracts", "LendingPool", "accrue_interest"),
+)
+
+class Profiler:
+    # Latency histograms for the PROFILED methods. Timing wrappers are
+    # patched onto the classes by start() and removed by stop(), so the
+    # methods run unwrapped whenever no profiler is active. Work done in
+    # process-pool workers (parallel signature checks) is not seen.
+    def __init__(self, targets=PROFILED):
+        self.targets = targets
+        self.histograms = {}
+        self._patched = []
+
+    def start(self):
+        for module_name, class_name, method in self.targets:
+            cls = getattr(importlib.import_module(module_name), class_name)
+            original = cls.__dict__[method]
+            histogram = self.histograms.setdefault(f"{class_name}.{method}", LatencyHistogram())
+            if isinstance(original, staticmethod):
+                setattr(cls, method, staticmethod(self._timed(original.__func__, histogram)))
+            else:
+                setattr(cls, method, self._timed(original, histogram))
+            self._patched.append((cls, method, original))
+        return self
+
+    def stop(self):
+        while self._patched:
+            cls, method, original = self._patched.pop()
+            setattr(cls, method, original)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @staticmethod
+    def _timed(fn, histogram):
+        clock = time.perf_counter_ns
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                histogram.errors += 1
+                raise
+            finally:
+                histogram.record(clock() - start)
+        return wrapper
+
+    def report(self):
+        return {name: histogram.summary() for name, histogram in self.histograms.items() if histogram.count}
@@ -1,13 +1,40 @@
 import unittest
 import sys
 import os
+import asyncio
+import json
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from unittest.mock import patch
 
 # Add src to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '../src'))
 
-from crypto import Wallet
-from blockchain import Ledger, Transaction
-from contracts import LendingPool
+import crypto
+from crypto import KeyCache, Wallet, derive_secret, master_key
+from blockchain import PARALLEL_VERIFY_MIN_BATCH, Ledger, Transaction
+from contracts import SECONDS_PER_YEAR, LendingPool
+from risk import StaticPriceFeed
+from storage import BlockLog, Store
+from state import ColumnarLedger
+from simulation import Simulation
+from sweep import run_sweep
+from service import ProtocolService
+from mempool import BlockProducer, Mempool
+from merkle import SparseMerkleTree, verify_proof
+from replay import ChainReplayer
+from markets import MarketRegistry
+import telemetry
+from telemetry import MetricsSink, NDJSONSink, Profiler, RingBufferSink
+from amounts import RAY, format_units, ray_mul, ray_pow, to_ray, to_units
+
+def usdc(amount):
+    return to_units(amount, "USDC")
+
+def eth(amount):
+    return to_units(amount, "ETH")
 
 class TestDeFi(unittest.TestCase):
     def setUp(self):
@@ -17,8 +44,8 @@ class TestDeFi(unittest.TestCase):
         self.pool = LendingPool(self.ledger)
         
         # Fund accounts
-        self.ledger.update_balance(self.alice.address, 10000, "USDC")
-        self.ledger.update_balance(self.bob.address, 10, "ETH")
+        self.ledger.update_balance(self.alice.address, usdc(10000), "USDC")
+        self.ledger.update_balance(self.bob.address, eth(10), "ETH")
 
     def test_wallet_signing(self):
         msg = "hello"
@@ -26,33 +53,1119 @@ class TestDeFi(unittest.TestCase):
         self.assertTrue(Wallet.verify(msg, sig, self.alice.get_public_key_hex()))
         self.assertFalse(Wallet.verify("wrong", sig, self.alice.get_public_key_hex()))
 
+    def test_transaction_verifies_against_registered_address(self):
+        tx = Transaction(self.alice.address, self.bob.address, 1)
+        tx.sign(self.alice)
+        self.assertTrue(tx.is_valid())
+        
+        tx.sign(self.bob)
+        self.assertFalse(tx.is_valid())
+        
+        unknown = Transaction("0" * 64, self.bob.address, 1)
+        unknown.sign(self.alice)
+        self.assertFalse(unknown.is_valid())
+
+    def test_verifying_key_cache_is_bounded(self):
+        wallets = [self.alice, self.bob, Wallet()]
+        with patch.object(crypto, "VERIFYING_KEY_CACHE_SIZE", 2):
+            Wallet._verifying_keys.clear()
+            for wallet in wallets:
+                self.assertTrue(Wallet.verify("m", wallet.sign("m"), wallet.get_public_key_hex()))
+            self.assertEqual(list(Wallet._verifying_keys), [w.get_public_key_hex() for w in wallets[1:]])
+
+    def test_public_key_cache_is_bounded(self):
+        with patch.object(crypto, "PUBLIC_KEY_CACHE_SIZE", 2), patch.object(Wallet, "_public_keys", OrderedDict()):
+            wallets = [Wallet() for _ in range(3)]
+            self.assertEqual(list(Wallet._public_keys), [w.address for w in wallets[1:]])
+            # an evicted wallet is registered again when it signs
+            tx = Transaction(wallets[0].address, self.bob.address, 1)
+            tx.sign(wallets[0])
+            self.assertTrue(tx.is_valid())
+            self.assertEqual(list(Wallet._public_keys), [wallets[2].address, wallets[0].address])
+
     def test_deposit(self):
-        self.pool.deposit(self.alice.address, 1000)
-        self.assertEqual(self.pool.total_liquidity, 1000)
-        self.assertEqual(self.ledger.get_balance(self.alice.address, "USDC"), 9000)
+        self.pool.deposit(self.alice.address, usdc(1000))
+        self.assertEqual(self.pool.total_liquidity, usdc(1000))
+        self.assertEqual(self.ledger.get_balance(self.alice.address, "USDC"), usdc(9000))
 
     def test_borrow_repay(self):
         # Deposit liquidity
-        self.pool.deposit(self.alice.address, 5000)
+        self.pool.deposit(self.alice.address, usdc(5000))
         
         # Add collateral
-        self.pool.add_collateral(self.bob.address, 2) # 4000 USD value
+        self.pool.add_collateral(self.bob.address, eth(2)) # 4000 USD value
         
         # Borrow
-        self.pool.borrow(self.bob.address, 1000)
-        self.assertEqual(self.ledger.get_balance(self.bob.address, "USDC"), 1000)
-        self.assertEqual(self.pool.total_borrowed, 1000)
+        self.pool.borrow(self.bob.address, usdc(1000))
+        self.assertEqual(self.ledger.get_balance(self.bob.address, "USDC"), usdc(1000))
+        self.assertEqual(self.pool.total_borrowed, usdc(1000))
         
         # Repay
-        self.pool.repay(self.bob.address, 1000)
+        self.pool.repay(self.bob.address, usdc(1000))
         self.assertEqual(self.pool.user_positions[self.bob.address]["borrowed"], 0)
 
+    def test_interest_compounds_per_second_on_touch(self):
+        self.pool.deposit(self.alice.address, usdc(5000))
+        self.pool.add_collateral(self.bob.address, eth(2))
+        self.pool.borrow(self.bob.address, usdc(1000))
+        # no time has passed
+        self.pool.accrue_interest()
+        self.assertEqual(self.pool.borrow_index, RAY)
+        
+        # 20% utilization: 5% base + 0.2 * 10% slope, compounded per second for a year
+        self.pool.clock.advance(SECONDS_PER_YEAR)
+        debt = self.pool.get_debt(self.bob.address)
+        self.assertEqual(self.pool.borrow_index, ray_pow(RAY + to_ray("0.07") // SECONDS_PER_YEAR, SECONDS_PER_YEAR))
+        self.assertAlmostEqual(debt, usdc("1072.508181"), delta=usdc("0.000010"))
+        self.assertEqual(self.pool.total_borrowed, debt)
+        # suppliers are credited the interest as it accrues
+        self.assertEqual(self.pool.total_liquidity, usdc(5000) + debt - usdc(1000))
+        
+        # Snapshot is untouched until the position is next settled
+        self.assertEqual(self.pool.user_positions[self.bob.address]["borrowed"], usdc(1000))
+        
+        self.ledger.update_balance(self.bob.address, usdc(100), "USDC")
+        self.pool.repay(self.bob.address, self.pool.get_debt(self.bob.address))
+        self.assertEqual(self.pool.get_debt(self.bob.address), 0)
+        self.assertEqual(self.pool.total_borrowed, 0)
+        
+        # fast-forwarding a century at the 5% base rate is one catch-up
+        index = self.pool.borrow_index
+        self.pool.clock.advance(100 * SECONDS_PER_YEAR)
+        self.pool.accrue_interest()
+        self.assertGreater(self.pool.borrow_index, 148 * index)
+
     def test_insufficient_collateral(self):
-        self.pool.deposit(self.alice.address, 5000)
-        self.pool.add_collateral(self.bob.address, 0.1) # 200 USD value
+        self.pool.deposit(self.alice.address, usdc(5000))
+        self.pool.add_collateral(self.bob.address, eth("0.1")) # 200 USD value
+        
+        with self.assertRaises(ValueError):
+            self.pool.borrow(self.bob.address, usdc(1000)) # Max borrow is 150
+        self.assertEqual(self.pool.available_to_borrow(self.bob.address), usdc(150))
+
+    def test_amounts_are_exact_integers(self):
+        self.pool.deposit(self.alice.address, usdc("0.1"))
+        self.pool.deposit(self.alice.address, usdc("0.2"))
+        self.assertEqual(self.pool.total_liquidity, usdc("0.3"))
+        self.assertEqual(format_units(self.ledger.get_balance(self.alice.address, "USDC"), "USDC"), "9999.7")
+        self.assertEqual(ray_mul(usdc(3), to_ray("0.5")), usdc("1.5"))
+        self.assertEqual(eth("1.5"), 15 * 10 ** 17)
+        
+        self.pool.configure(ltv=0.7)
+        self.assertEqual(self.pool.ltv, 7 * RAY // 10)
+        with self.assertRaises(ValueError):
+            self.pool.configure(nonexistent=1)
+        with self.assertRaises(ValueError):
+            Transaction("alice", "bob", 1.5).encode()
+
+class TestTransactionEncoding(unittest.TestCase):
+    def test_encoding_round_trips(self):
+        tx = Transaction("alice", "bob", eth("1.25"), action="transfer", data={"b": 1, "a": [2]})
+        decoded = Transaction.decode(tx.encode())
+        
+        self.assertEqual(decoded.encode(), tx.encode())
+        self.assertEqual(decoded.tx_id, tx.tx_id)
+        self.assertEqual(decoded.amount, eth("1.25"))
+        self.assertEqual(decoded.timestamp_ns, tx.timestamp_ns)
+        self.assertEqual(decoded.data, {"a": [2], "b": 1})
+
+    def test_amount_encoding_is_exact_in_base_units(self):
+        a = Transaction("alice", "bob", eth(3))
+        b = Transaction("alice", "bob", eth(3.0))
+        b.timestamp_ns = a.timestamp_ns
+        self.assertEqual(a.encode(), b.encode())
+        self.assertEqual(Transaction.decode(a.encode()).amount, 3 * 10 ** 18)
+
+    def test_encoding_is_memoised_and_invalidated_on_change(self):
+        tx = Transaction("alice", "bob", 1)
+        encoded = tx.encode()
+        self.assertIs(tx.encode(), encoded)
+        
+        tx_id = tx.tx_id
+        tx.amount = 2
+        self.assertNotEqual(tx.encode(), encoded)
+        self.assertNotEqual(tx.tx_id, tx_id)
+
+    def test_signature_covers_encoding(self):
+        wallet = Wallet()
+        tx = Transaction(wallet.address, "bob", 1)
+        tx.sign(wallet)
+        self.assertTrue(tx.is_valid())
+        tx.receiver = "mallory"
+        self.assertFalse(tx.is_valid())
+
+class TestLedgerBatch(unittest.TestCase):
+    def setUp(self):
+        self.ledger = Ledger()
+        self.alice = Wallet()
+        self.bob = Wallet()
+        self.alice_key = self.alice.get_public_key_hex()
+        self.bob_key = self.bob.get_public_key_hex()
+        self.ledger.update_balance(self.alice_key, 10, "ETH")
+
+    def _signed(self, wallet, sender, receiver, amount, nonce=0):
+        tx = Transaction(sender, receiver, amount, nonce=nonce)
+        tx.sign(wallet)
+        return tx
+
+    def test_process_batch_reports_per_tx_outcome(self):
+        forged = self._signed(self.bob, self.alice_key, self.bob_key, 1)
+        txs = [
+            self._signed(self.alice, self.alice_key, self.bob_key, 4),
+            forged,
+            self._signed(self.alice, self.alice_key, self.bob_key, 7, nonce=1),
+            self._signed(self.alice, self.alice_key, self.bob_key, 6, nonce=1),
+        ]
+        results = self.ledger.process_batch(txs, workers=2)
+        
+        self.assertEqual([r["accepted"] for r in results], [True, False, False, True])
+        self.assertEqual(results[1]["error"], "Invalid signature")
+        self.assertEqual(results[2]["error"], "Insufficient funds")
+        self.assertEqual(self.ledger.get_balance(self.alice_key), 0)
+        self.assertEqual(self.ledger.get_balance(self.bob_key), 10)
+        self.assertEqual(self.ledger.chain, [txs[0], txs[3]])
+
+    def test_signed_transactions_apply_once_in_nonce_order(self):
+        first = self._signed(self.alice, self.alice_key, self.bob_key, 1)
+        self.ledger.process_transaction(first)
+        with self.assertRaisesRegex(ValueError, "Invalid nonce 0, expected 1"):
+            self.ledger.process_transaction(first)
+        with self.assertRaisesRegex(ValueError, "Invalid nonce 2, expected 1"):
+            self.ledger.process_transaction(self._signed(self.alice, self.alice_key, self.bob_key, 1, nonce=2))
+        # a rejected transaction leaves the nonce for its resubmission
+        with self.assertRaisesRegex(ValueError, "Insufficient funds"):
+            self.ledger.process_transaction(self._signed(self.alice, self.alice_key, self.bob_key, 50, nonce=1))
+        self.ledger.process_transaction(self._signed(self.alice, self.alice_key, self.bob_key, 2, nonce=1))
+
+        restored = Ledger()
+        restored.load_state(self.ledger.export_state())
+        self.assertEqual(restored.next_nonce, {self.alice_key: 2})
+        with self.assertRaisesRegex(ValueError, "Invalid nonce"):
+            restored.process_transaction(first)
+        self.assertEqual(self.ledger.get_balance(self.bob_key), 3)
+
+    def test_parallel_verification_matches_serial(self):
+        txs = [self._signed(self.alice, self.alice_key, self.bob_key, 0) for _ in range(4)]
+        txs.append(Transaction(self.alice_key, self.bob_key, 0))
+        serial = self.ledger._verify_signatures(txs, workers=1)
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            parallel = self.ledger._verify_signatures(txs, executor=executor)
+        self.assertEqual(serial, [True, True, True, True, False])
+        self.assertEqual(parallel, serial)
+
+    def test_large_batches_reuse_the_ledger_pool(self):
+        txs = [self._signed(self.alice, self.alice_key, self.bob_key, 0) for _ in range(PARALLEL_VERIFY_MIN_BATCH)]
+        self.addCleanup(self.ledger.close)
+        self.assertEqual(self.ledger._verify_signatures(txs, workers=2), [True] * len(txs))
+        pool = self.ledger._verify_pool
+        self.assertIsNotNone(pool)
+        self.ledger._verify_signatures(txs, workers=2)
+        self.assertIs(self.ledger._verify_pool, pool)
+        self.ledger.close()
+        self.assertIsNone(self.ledger._verify_pool)
+
+class TestStorage(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.alice = Wallet()
+
+    def _open(self, **kwargs):
+        ledger = Ledger()
+        pool = LendingPool(ledger)
+        store = Store(self.tmp.name, **kwargs)
+        self.addCleanup(store.log.close)
+        store.open(ledger, [pool])
+        return store, ledger, pool
+
+    def _transfer(self, ledger, amount):
+        tx = Transaction(self.alice.address, "bob", amount, nonce=ledger.next_nonce.get(self.alice.address, 0))
+        tx.sign(self.alice)
+        ledger.process_transaction(tx)
+
+    def test_restart_restores_snapshot_and_replays_tail(self):
+        store, ledger, pool = self._open(snapshot_interval=3, segment_max_bytes=512)
+        ledger.update_balance(self.alice.address, 100)
+        ledger.update_balance(self.alice.address, 1000, "USDC")
+        pool.deposit(self.alice.address, 400)
+        for amount in range(1, 8):
+            self._transfer(ledger, amount)
+        store.log.flush()
+        self.assertGreater(len(store.log.segments), 1)
+        self.assertEqual(store.snapshot_height, 6)
+        
+        # no close(): the last transfer lives only in the log tail
+        _, restored, restored_pool = self._open()
+        self.assertEqual(restored.state, ledger.state)
+        self.assertEqual(restored.next_nonce, {self.alice.address: 7})
+        self.assertEqual(restored_pool.total_liquidity, 400)
+        # the deposit is in the log but not the chain, so the tail is the last two transfers
+        self.assertEqual([tx.tx_id for tx in restored.chain], [tx.tx_id for tx in ledger.chain[-2:]])
+
+    def test_reopened_chain_holds_only_ledger_transactions(self):
+        store, ledger, pool = self._open()
+        ledger.mint(self.alice.address, 1000, "USDC")
+        ledger.mint(self.alice.address, 10)
+        pool.clock.advance(60)
+        pool.deposit(self.alice.address, 400)
+        self._transfer(ledger, 1)
+        store.log.flush()
+        # the log also holds the deposit call and the accrual input it logged
+        self.assertEqual(store.log.height, 5)
+        
+        _, restored, restored_pool = self._open()
+        self.assertEqual([tx.tx_id for tx in restored.chain], [tx.tx_id for tx in ledger.chain])
+        self.assertEqual(len(restored.history), 3)
+        self.assertEqual(restored.state, ledger.state)
+        self.assertEqual(restored_pool.total_liquidity, 400)
+
+    def test_torn_trailing_record_is_discarded(self):
+        store, ledger, _ = self._open()
+        ledger.update_balance(self.alice.address, 10)
+        self._transfer(ledger, 1)
+        self._transfer(ledger, 2)
+        store.close()
+        
+        segment = os.path.join(self.tmp.name, "log", f"{0:020d}.log")
+        with open(segment, "r+b") as f:
+            f.truncate(os.path.getsize(segment) - 5)
+        
+        log = BlockLog(os.path.join(self.tmp.name, "log"))
+        self.assertEqual(log.height, 1)
+        self.assertEqual([tx.amount for tx in log.iter_from(0)], [1])
+        log.close()
+
+class TestColumnarLedger(unittest.TestCase):
+    def setUp(self):
+        self.ledger = ColumnarLedger()
+        self.alice = Wallet()
+
+    def test_balances_match_dict_ledger(self):
+        reference = Ledger()
+        for ledger in (self.ledger, reference):
+            ledger.update_balance("a", usdc(5), "USDC")
+            ledger.update_balance("b", eth(20))
+            ledger.update_balance("a", -usdc("1.5"), "USDC")
+        
+        self.assertEqual(self.ledger.get_balance("a", "USDC"), usdc("3.5"))
+        self.assertEqual(self.ledger.get_balance("b"), 20 * 10 ** 18)
+        self.assertEqual(self.ledger.get_balance("a"), 0)
+        self.assertEqual(self.ledger.get_balance("nobody", "DAI"), 0)
+        self.assertEqual(self.ledger.state, reference.state)
+        with self.assertRaises(OverflowError):
+            self.ledger.update_balance("a", 2 ** 63, "USDC")
+
+    def test_bulk_credit_and_debit(self):
+        for token in ("USDC", "ETH"):
+            self.ledger.bulk_credit(["a", "b", "a"], 10, token)
+            self.ledger.bulk_credit(["c"], [4], token)
+            self.assertEqual(self.ledger.get_balance("a", token), 20)
+            self.assertEqual(self.ledger.get_balance("c", token), 4)
+            
+            self.ledger.bulk_debit(["a", "b"], [5, 10], token)
+            self.assertEqual(self.ledger.get_balance("a", token), 15)
+            self.assertEqual(self.ledger.get_balance("b", token), 0)
+            
+            with self.assertRaises(ValueError):
+                self.ledger.bulk_debit(["c", "c"], 3, token)
+            with self.assertRaises(ValueError):
+                self.ledger.bulk_debit(["nobody"], 1, token)
+            self.assertEqual(self.ledger.get_balance("c", token), 4)
+
+    def test_works_behind_ledger_and_pool(self):
+        pool = LendingPool(self.ledger)
+        self.ledger.update_balance(self.alice.address, usdc(1000), "USDC")
+        self.ledger.update_balance(self.alice.address, eth(1))
+        pool.deposit(self.alice.address, usdc(400))
+        
+        tx = Transaction(self.alice.address, "bob", eth("0.25"))
+        tx.sign(self.alice)
+        self.ledger.process_transaction(tx)
+        
+        restored = ColumnarLedger()
+        restored.load_state(self.ledger.export_state())
+        self.assertEqual(restored.get_balance(self.alice.address, "USDC"), usdc(600))
+        self.assertEqual(restored.get_balance(pool.pool_address, "USDC"), usdc(400))
+        self.assertEqual(restored.get_balance("bob"), eth("0.25"))
+
+    def test_mint_many_is_one_record_replayed_in_bulk(self):
+        addresses = ["acct-%d" % i for i in range(1000)]
+        self.ledger.mint_many(addresses, usdc(5), "USDC")
+        self.assertEqual(len(self.ledger.chain), 1)
+        self.assertEqual(self.ledger.get_balance("acct-999", "USDC"), usdc(5))
+        
+        replayed = ColumnarLedger()
+        with patch.object(replayed, "update_balance", side_effect=AssertionError("per-account credit")):
+            replayed._execute(self.ledger.chain[0])
+        self.assertEqual(replayed.state, self.ledger.state)
+
+class TestRiskEngine(unittest.TestCase):
+    def setUp(self):
+        self.ledger = Ledger()
+        self.pool = LendingPool(self.ledger)
+        self.ledger.update_balance("lender", usdc(100000), "USDC")
+        self.pool.deposit("lender", usdc(100000))
+        # (collateral ETH, borrowed USDC)
+        for name, collateral, debt in (("a", 1, 1000), ("b", 1, 1400), ("c", 2, 1000), ("d", 1, 0)):
+            self.ledger.update_balance(name, eth(collateral), "ETH")
+            self.pool.add_collateral(name, eth(collateral))
+            if debt:
+                self.pool.borrow(name, usdc(debt))
+
+    def test_vectorised_health_factors_match_scalar(self):
+        self.pool.clock.advance(SECONDS_PER_YEAR)
+        for price in (None, 1500.0):
+            factors = self.pool.health_factors(price)
+            for address, hf in zip(self.pool.risk.addresses, factors):
+                self.assertAlmostEqual(hf, self.pool.health_factor(address, price))
+
+    def test_price_shock_liquidatable_set(self):
+        self.assertEqual(self.pool.liquidatable_positions(), [])
+        # b: 1 ETH * 1700 * 0.8 = 1360 < 1400
+        self.assertEqual(self.pool.liquidatable_positions(price=1700.0), ["b"])
+        self.assertEqual(self.pool.liquidatable_positions(price=1000.0), ["b", "a"])
+        
+        self.pool.price_feed.set_price("ETH", 1200.0)
+        self.assertEqual(self.pool.liquidatable_positions(), ["b", "a"])
+
+    def test_riskiest_and_headroom(self):
+        riskiest = self.pool.riskiest_positions(2)
+        self.assertEqual([address for address, _ in riskiest], ["b", "a"])
+        self.assertAlmostEqual(riskiest[0][1], 2000 * 0.8 / 1400)
+        
+        self.pool.repay("b", usdc(1400))
+        self.assertEqual([address for address, _ in self.pool.riskiest_positions(5)], ["a", "c"])
+        
+        headroom = dict(zip(self.pool.risk.addresses, self.pool.borrow_headroom()))
+        self.assertEqual(headroom, {"a": 500, "b": 1500, "c": 2000, "d": 1500})
+
+class TestLiquidation(unittest.TestCase):
+    def setUp(self):
+        self.ledger = Ledger()
+        self.pool = LendingPool(self.ledger)
+        self.ledger.update_balance("lender", usdc(100000), "USDC")
+        self.pool.deposit("lender", usdc(100000))
+        self.ledger.update_balance("liquidator", usdc(10000), "USDC")
+        for name, collateral, debt in (("a", 1, 1000), ("b", 1, 1400), ("c", 2, 1000)):
+            self.ledger.update_balance(name, eth(collateral), "ETH")
+            self.pool.add_collateral(name, eth(collateral))
+            self.pool.borrow(name, usdc(debt))
+
+    def test_liquidate_applies_close_factor_and_bonus(self):
+        with self.assertRaises(ValueError):
+            self.pool.liquidate("liquidator", "b", usdc(700))
+        
+        self.pool.price_feed.set_price("ETH", 1600.0)
+        health_before = self.pool.health_factor("b")
+        repaid, seized = self.pool.liquidate("liquidator", "b", usdc(5000))
+        self.assertEqual(repaid, usdc(700))
+        # 700 * 1.05 / 1600 ETH, rounded down to wei
+        self.assertEqual(seized, 459375000000000000)
+        self.assertEqual(self.pool.get_debt("b"), usdc(700))
+        self.assertEqual(self.pool.user_positions["b"]["collateral"], eth(1) - seized)
+        self.assertEqual(self.pool.total_borrowed, usdc(3400 - 700))
+        self.assertEqual(self.ledger.get_balance("liquidator", "USDC"), usdc(9300))
+        self.assertEqual(self.ledger.get_balance("liquidator", "ETH"), seized)
+        self.assertGreater(self.pool.health_factor("b"), health_before)
+
+    def test_queue_tracks_updates_and_accrual(self):
+        self.assertEqual(self.pool.liquidatable_positions(), [])
+        self.assertEqual(self.pool.liquidatable_positions(price=1000.0), ["b", "a"])
+        
+        self.ledger.update_balance("b", usdc(1400), "USDC")
+        self.pool.repay("b", usdc(1400))
+        self.assertEqual(self.pool.liquidatable_positions(price=1000.0), ["a"])
+        
+        # at ~5.3% a year, a's 1000 debt crosses 1 ETH * 1300 * 0.8 = 1040 after ~270 days
+        self.pool.clock.advance(180 * 86400)
+        self.assertEqual(self.pool.liquidatable_positions(price=1300.0), [])
+        self.pool.clock.advance(180 * 86400)
+        self.assertEqual(self.pool.liquidatable_positions(price=1300.0), ["a"])
+
+    def test_non_positive_amounts_are_rejected(self):
+        self.pool.price_feed.set_price("ETH", 1600.0)
+        before = (dict(self.ledger.state["liquidator"]), self.pool.get_debt("b"), self.pool.user_positions["b"]["collateral"])
+        for amount in (0, -usdc(1000)):
+            with self.assertRaises(ValueError):
+                self.pool.liquidate("liquidator", "b", amount)
+            for action in (self.pool.add_collateral, self.pool.borrow, self.pool.repay):
+                with self.assertRaises(ValueError):
+                    action("b", amount)
+        self.assertEqual((dict(self.ledger.state["liquidator"]), self.pool.get_debt("b"), self.pool.user_positions["b"]["collateral"]), before)
+
+    def test_position_without_collateral_is_not_liquidated(self):
+        self.pool.price_feed.set_price("ETH", 100.0)
+        _, seized = self.pool.liquidate("liquidator", "b", usdc(5000))
+        self.assertEqual(seized, eth(1))
+        self.assertGreater(self.pool.get_debt("b"), 0)
+        balance = self.ledger.get_balance("liquidator", "USDC")
+        with self.assertRaisesRegex(ValueError, "Nothing to liquidate"):
+            self.pool.liquidate("liquidator", "b", usdc(5000))
+        self.assertEqual(self.ledger.get_balance("liquidator", "USDC"), balance)
+
+    def test_liquidate_all_sweeps_crossed_positions(self):
+        self.pool.price_feed.set_price("ETH", 1200.0)
+        results = self.pool.liquidate_all("liquidator")
+        self.assertEqual(sorted(results), ["a", "b"])
+        self.assertNotIn("c", results)
+
+    def test_liquidate_all_skips_positions_that_fail(self):
+        self.pool.price_feed.set_price("ETH", 100.0)
+        self.pool.liquidate("liquidator", "b", usdc(5000))
+        # b has debt but no collateral and is the riskiest; the sweep goes on past it
+        results = self.pool.liquidate_all("liquidator")
+        self.assertEqual(sorted(results), ["a", "c"])
+
+class TestSimulation(unittest.TestCase):
+    SCENARIO = {"agents": 20, "steps": 2000, "seed": 7, "accrue_every": 50, "price_path": {"start": 2000.0, "volatility": 0.05, "every": 20}}
+
+    def test_runs_are_reproducible_across_ledger_backends(self):
+        first = Simulation(self.SCENARIO)
+        first.run()
+        second = Simulation({**self.SCENARIO, "ledger": "columnar"})
+        second.run()
+        
+        self.assertEqual(first.pool.user_positions, second.pool.user_positions)
+        self.assertEqual(first.ledger.state, second.ledger.state)
+
+    def test_report_counts_every_operation(self):
+        report = Simulation(self.SCENARIO).run()
+        ops = report["operations"]
+        self.assertEqual(sum(ops[a]["count"] for a in ("deposit", "add_collateral", "borrow", "repay")), 2000)
+        self.assertEqual(ops["accrue"]["count"], 40)
+        self.assertEqual(ops["liquidate"]["count"], 100)
+        self.assertGreater(report["ops_per_sec"], 0)
+        self.assertLessEqual(ops["borrow"]["p50_us"], ops["borrow"]["p99_us"])
+
+class TestSweep(unittest.TestCase):
+    SWEEP = {
+        "runs_per_point": 3,
+        "grid": {"ltv": [0.6, 0.85]},
+        "volatility": [0.01, 0.1],
+        "scenario": {"agents": 10, "steps": 300, "accrue_every": 50, "price_path": {"start": 2000.0, "volatility": 0.0, "every": 25}},
+    }
+
+    def test_results_are_deterministic_across_worker_counts(self):
+        outputs = []
+        for workers in (1, 2):
+            with tempfile.TemporaryDirectory() as out:
+                summary = run_sweep(self.SWEEP, out, workers=workers)
+                with open(os.path.join(out, "runs.jsonl")) as f:
+                    outputs.append((f.read(), summary))
+        
+        (runs_1, summary_1), (runs_2, summary_2) = outputs
+        self.assertEqual(runs_1, runs_2)
+        self.assertEqual(summary_1, summary_2)
+        self.assertEqual(len(runs_1.splitlines()), 6)
+        self.assertEqual([p["params"] for p in summary_1["points"]], [{"ltv": 0.6}, {"ltv": 0.85}])
+        self.assertTrue(all(p["runs"] == 3 for p in summary_1["points"]))
+
+class TestTransactionHistory(unittest.TestCase):
+    def setUp(self):
+        self.ledger = Ledger()
+        self.alice = Wallet()
+        self.ledger.update_balance(self.alice.address, 100)
+        for amount in range(1, 8):
+            tx = Transaction(self.alice.address, "bob" if amount % 2 else "carol", amount, nonce=amount - 1)
+            tx.sign(self.alice)
+            self.ledger.process_transaction(tx)
+        self.history = self.ledger.history
+
+    def test_pages_newest_first(self):
+        self.assertEqual(len(self.history), 7)
+        self.assertEqual([r["amount"] for r in self.history.page(0, 3)], [7, 6, 5])
+        self.assertEqual([r["amount"] for r in self.history.page(2, 3)], [1])
+        self.assertEqual(self.history.page(3, 3), [])
+        self.assertEqual(self.history.page(0, 1)[0]["receiver"], "bob")
+
+    def test_filters_by_address_and_action(self):
+        self.assertEqual([r["amount"] for r in self.history.page(0, 10, address="carol")], [6, 4, 2])
+        self.assertEqual(self.history.count(address=self.alice.address), 7)
+        self.assertEqual(self.history.count(address="bob", action="transfer"), 4)
+        self.assertEqual(self.history.count(address="nobody"), 0)
+        self.assertEqual(self.history.page(0, 10, action="deposit"), [])
+
+    def test_aggregates_are_incremental(self):
+        self.assertEqual(self.history.aggregates(), {("transfer", "ETH"): {"count": 7, "amount": 28}})
+
+    def test_aggregates_keep_tokens_apart(self):
+        self.ledger.mint("bob", 5, "USDC")
+        self.ledger.mint_many(["bob", "carol", "dave"], 2, "USDC")
+        self.ledger.mint("bob", 3)
+        aggregates = self.history.aggregates()
+        self.assertEqual(aggregates[("mint", "USDC")], {"count": 2, "amount": 11})
+        self.assertEqual(aggregates[("mint", "ETH")], {"count": 1, "amount": 3})
+        self.assertEqual(aggregates[("transfer", "ETH")], {"count": 7, "amount": 28})
+
+class TestProtocolService(unittest.TestCase):
+    def setUp(self):
+        self.service = ProtocolService()
+        self.alice = self.service.add_wallet("Alice", balances={"USDC": 10000})
+        self.bob = self.service.add_wallet("Bob", balances={"ETH": 10})
+
+    def test_snapshot_is_reused_until_a_mutation(self):
+        first = self.service.snapshot()
+        self.assertIs(self.service.snapshot(), first)
+        
+        self.service.deposit(self.alice.address, 1000)
+        second = self.service.snapshot()
+        self.assertIsNot(second, first)
+        self.assertEqual(second["total_liquidity"], 1000)
+        self.assertEqual(second["accounts"]["Alice"]["balances"]["USDC"], 9000)
+        self.assertIsNone(second["accounts"]["Bob"]["position"])
+
+    def test_pool_actions_reach_the_chain_and_history(self):
+        carol = self.service.add_wallet("Carol", balances={"ETH": eth(1)})
+        self.service.deposit(self.alice.address, 1000)
+        self.service.add_collateral(carol.address, eth(1))
+        self.service.borrow(carol.address, 500)
+        self.assertEqual([tx.action for tx in self.service.ledger.chain], ["mint", "mint", "mint", "deposit", "add_collateral", "borrow"])
+        self.assertEqual(self.service.ledger.history.count(address=carol.address), 3)
+        self.assertEqual(self.service.snapshot()["history_height"], 6)
+        with self.assertRaises(ValueError):
+            self.service.deposit("nobody", 1)
+
+    def test_failed_mutation_still_invalidates_snapshot(self):
+        first = self.service.snapshot()
+        with self.assertRaises(ValueError):
+            self.service.borrow(self.bob.address, 1)
+        self.assertIsNot(self.service.snapshot(), first)
+
+    def test_concurrent_sessions_share_one_pool(self):
+        def session():
+            for _ in range(100):
+                self.service.deposit(self.alice.address, 1)
+                self.service.snapshot()
+        
+        threads = [threading.Thread(target=session) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        snapshot = self.service.snapshot()
+        self.assertEqual(snapshot["total_liquidity"], 800)
+        self.assertEqual(snapshot["accounts"]["Alice"]["balances"]["USDC"], 9200)
+
+class TestMempool(unittest.TestCase):
+    def setUp(self):
+        self.ledger = Ledger()
+        self.pool = LendingPool(self.ledger)
+        self.alice = Wallet()
+        self.bob = Wallet()
+        self.ledger.update_balance(self.alice.address, usdc(10000), "USDC")
+        self.ledger.update_balance(self.alice.address, eth(1))
+        self.ledger.update_balance(self.bob.address, eth(10))
+
+    def _transfer(self, wallet, amount, fee=0, nonce=0):
+        tx = Transaction(wallet.address, "carol", amount, fee=fee, nonce=nonce)
+        tx.sign(wallet)
+        return tx
+
+    def test_drain_orders_by_fee_and_sender_nonce(self):
+        async def scenario():
+            mempool = Mempool()
+            txs = [
+                self._transfer(self.bob, eth(1), fee=eth("0.1"), nonce=1),
+                self._transfer(self.alice, eth("0.1"), fee=eth("0.01"), nonce=0),
+                self._transfer(self.bob, eth(1), fee=eth("0.5"), nonce=2),
+                self._transfer(self.bob, eth(1), fee=eth("0.01"), nonce=0),
+            ]
+            for tx in txs:
+                await mempool.submit(tx)
+            duplicate = await mempool.submit(txs[0])
+            self.assertEqual(len(mempool), 4)
+            self.assertEqual(mempool.duplicates, 1)
+            self.assertFalse(duplicate.done())
+            return txs, [entry["tx"] for entry in mempool.drain(10)]
+        
+        txs, drained = asyncio.run(scenario())
+        # bob's nonce 0 ties alice on fee but arrived later; bob 1 and 2 must follow bob 0
+        self.assertEqual(drained, [txs[1], txs[3], txs[0], txs[2]])
+
+    def test_producer_confirms_signed_pool_actions(self):
+        async def scenario():
+            mempool = Mempool(max_size=2)
+            producer = BlockProducer(self.ledger, mempool, block_size=2, interval=0.001)
+            task = asyncio.create_task(producer.run())
+            deposit = self.pool.transaction(self.alice, "deposit", usdc(400), fee=eth("0.5"), nonce=0)
+            borrow = self.pool.transaction(self.alice, "borrow", usdc(10), nonce=1)
+            futures = [
+                await mempool.submit(deposit),
+                await mempool.submit(borrow),
+                await mempool.submit(self._transfer(self.bob, eth(4), nonce=0)),
+            ]
+            results = await asyncio.gather(*futures)
+            resubmitted = await (await mempool.submit(deposit))
+            # the rejected borrow was not cached, so it runs again once it can succeed
+            self.pool.add_collateral(self.alice.address, eth("0.5"))
+            retried = await (await mempool.submit(borrow))
+            producer.stop()
+            await task
+            return producer, results, resubmitted, retried
+        
+        producer, results, resubmitted, retried = asyncio.run(scenario())
+        self.assertEqual([r["accepted"] for r in results], [True, False, True])
+        self.assertEqual(results[1]["error"], "No collateral deposited")
+        self.assertIs(resubmitted, results[0])
+        self.assertTrue(retried["accepted"])
+        self.assertEqual(self.pool.total_liquidity, usdc(400))
+        self.assertEqual(self.pool.total_borrowed, usdc(10))
+        self.assertEqual(self.ledger.get_balance(self.alice.address, "USDC"), usdc(9610))
+        self.assertEqual(self.ledger.get_balance(self.alice.address), 0)
+        self.assertEqual(self.ledger.get_balance("carol"), eth(4))
+        
+        metrics = producer.metrics()
+        self.assertEqual(metrics["confirmed"], 3)
+        self.assertEqual(metrics["rejected"], 1)
+        self.assertLessEqual(metrics["max_queue_depth"], 2)
+        self.assertEqual(metrics["queue_depth"], 0)
+        self.assertEqual(producer.latencies.count, 4)
+        self.assertGreater(metrics["latency_ms"]["max"], 0)
+        self.assertLessEqual(metrics["latency_ms"]["p50"], metrics["latency_ms"]["max"])
+
+class TestStateCommitment(unittest.TestCase):
+    def _fill(self, ledger):
+        for i in range(50):
+            ledger.update_balance("acct-%d" % i, i + 1, "ETH")
+            ledger.update_balance("acct-%d" % (i * 7 % 50), usdc("2.5"), "USDC")
+
+    def test_incremental_root_matches_rebuild(self):
+        ledger = Ledger()
+        ledger.state_root()
+        self._fill(ledger)
+        ledger.update_balance("acct-3", -4, "ETH")
+        ledger.update_balance("acct-9", -10, "ETH")
+        
+        rebuilt = SparseMerkleTree.from_state(ledger.state)
+        self.assertEqual(ledger.state_root(), rebuilt.root().hex())
+        self.assertEqual(ledger.merkle.size, 98)
+        
+        columnar = ColumnarLedger()
+        self._fill(columnar)
+        columnar.update_balance("acct-9", -10, "ETH")
+        self.assertNotEqual(columnar.state_root(), ledger.state_root())
+        columnar.bulk_debit(["acct-3"], [4], "ETH")
+        self.assertEqual(columnar.state_root(), ledger.state_root())
+
+    def test_inclusion_and_absence_proofs(self):
+        ledger = Ledger()
+        self._fill(ledger)
+        root = bytes.fromhex(ledger.state_root())
+        
+        proof = ledger.prove_balance("acct-4", "ETH")
+        self.assertTrue(verify_proof(root, "acct-4", "ETH", 5, proof))
+        self.assertFalse(verify_proof(root, "acct-4", "ETH", 6, proof))
+        self.assertFalse(verify_proof(root, "acct-5", "ETH", 5, proof))
+        
+        absent = ledger.prove_balance("nobody", "ETH")
+        self.assertTrue(verify_proof(root, "nobody", "ETH", 0, absent))
+        self.assertFalse(verify_proof(root, "nobody", "ETH", 1, absent))
+
+class TestMarketRegistry(unittest.TestCase):
+    def _build(self):
+        ledger = Ledger()
+        registry = MarketRegistry(ledger, StaticPriceFeed({"USDC": 1.0, "ETH": 2000.0, "WBTC": 60000.0}))
+        registry.add_market("USDC", base_rate=0.02, utilization_slope=0.2, reserve_factor=0.1)
+        registry.add_market("ETH", ltv=0.8, liquidation_threshold=0.85)
+        registry.add_market("WBTC", ltv=0.7, liquidation_threshold=0.75, base_rate=0.01)
+        return ledger, [registry]
+
+    def setUp(self):
+        self.ledger, (self.registry,) = self._build()
+        self.ledger.update_balance("lender", usdc(1_000_000), "USDC")
+        self.registry.deposit("lender", "USDC", usdc(1_000_000))
+        self.ledger.update_balance("alice", eth(1), "ETH")
+        self.ledger.update_balance("alice", to_units("0.1", "WBTC"), "WBTC")
+        self.registry.add_collateral("alice", "ETH", eth(1))
+        self.registry.add_collateral("alice", "WBTC", to_units("0.1", "WBTC"))
+
+    def test_borrow_limit_spans_collateral_assets(self):
+        # 2000 * 0.8 + 6000 * 0.7 = 5800 USDC
+        with self.assertRaises(ValueError):
+            self.registry.borrow("alice", "USDC", usdc(5801))
+        self.registry.borrow("alice", "USDC", usdc(5800))
+        
+        self.assertEqual(self.registry.markets_of("alice"), ["ETH", "WBTC", "USDC"])
+        health = self.registry.account_health("alice")
+        self.assertEqual(health["borrow_limit"], health["debt_value"])
+        self.assertAlmostEqual(health["health_factor"], (2000 * 0.85 + 6000 * 0.75) / 5800)
+        self.assertEqual(self.ledger.get_balance("alice", "USDC"), usdc(5800))
+
+    def test_markets_accrue_on_the_shared_clock_with_their_own_rate_model(self):
+        self.registry.borrow("alice", "USDC", usdc(5000))
+        usdc_market = self.registry.markets["USDC"]
+        rate = usdc_market.get_borrow_rate()
+        self.registry.clock.advance(86400)
+        self.registry.accrue_interest()
+        
+        interest = ray_mul(usdc(5000), ray_pow(RAY + rate // SECONDS_PER_YEAR, 86400)) - usdc(5000)
+        self.assertEqual(usdc_market.total_borrowed, usdc(5000) + interest)
+        self.assertEqual(usdc_market.reserves, ray_mul(interest, to_ray(0.1)))
+        self.assertEqual(usdc_market.total_liquidity, usdc(1_000_000) + interest - usdc_market.reserves)
+        self.assertEqual(self.registry.markets["WBTC"].borrow_index, ray_pow(RAY + to_ray(0.01) // SECONDS_PER_YEAR, 86400))
+        self.assertEqual(usdc_market.get_debt("alice"), usdc_market.total_borrowed)
+        # the lender's shares carry the interest net of reserves
+        self.assertAlmostEqual(self.registry.supplied_balance("lender", "USDC"), usdc_market.total_liquidity, delta=1)
+
+    def test_withdraw_and_input_checks_come_from_the_market_pool(self):
+        with self.assertRaisesRegex(ValueError, "Deposit amount must be positive"):
+            self.registry.deposit("lender", "USDC", 0)
+        with self.assertRaisesRegex(ValueError, "Borrow amount must be positive"):
+            self.registry.borrow("alice", "USDC", -1)
+        with self.assertRaisesRegex(ValueError, "Unknown market"):
+            self.registry.deposit("lender", "DAI", 1)
+        
+        self.registry.borrow("alice", "USDC", usdc(5800))
+        with self.assertRaisesRegex(ValueError, "Not enough liquidity in pool"):
+            self.registry.withdraw("lender", "USDC", usdc(1_000_000))
+        self.registry.withdraw("lender", "USDC", usdc(994_200))
+        self.assertEqual(self.ledger.get_balance("lender", "USDC"), usdc(994_200))
+        self.assertEqual(self.registry.supplied_balance("lender", "USDC"), usdc(5800))
+
+    def test_liquidation_seizes_chosen_collateral(self):
+        self.registry.borrow("alice", "USDC", usdc(5000))
+        with self.assertRaises(ValueError):
+            self.registry.liquidate("bot", "alice", "USDC", "WBTC", usdc(1000))
+        
+        self.registry.price_feed.set_price("WBTC", 40000.0)
+        self.ledger.update_balance("bot", usdc(10_000), "USDC")
+        repaid, seized = self.registry.liquidate("bot", "alice", "USDC", "WBTC", usdc(10_000))
+        self.assertEqual(repaid, usdc(2500))
+        # 2500 * 1.05 / 40000 WBTC
+        self.assertEqual(seized, to_units("0.065625", "WBTC"))
+        self.assertEqual(self.ledger.get_balance("bot", "WBTC"), seized)
+        self.assertEqual(self.registry.markets["ETH"].user_positions["alice"]["collateral"], eth(1))
+        self.assertGreater(self.registry.health_factor("alice"), 1)
+
+    def test_log_replays_to_the_same_markets(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        ledger, (registry,) = self._build()
+        store = Store(os.path.join(tmp.name, "store"))
+        store.open(ledger, [registry])
+        self.addCleanup(store.log.close)
+        bob = Wallet()
+        ledger.mint("lender", usdc(100_000), "USDC")
+        ledger.mint(bob.address, eth(2), "ETH")
+        ledger.mint("bot", usdc(5000), "USDC")
+        registry.deposit("lender", "USDC", usdc(100_000))
+        ledger.process_transaction(registry.transaction(bob, "add_collateral", "ETH", eth(2)))
+        ledger.process_transaction(registry.transaction(bob, "borrow", "USDC", usdc(3000), nonce=1))
+        registry.clock.advance(30 * 86400)
+        registry.price_feed.set_price("ETH", 1700.0)
+        registry.liquidate("bot", bob.address, "USDC", "ETH", usdc(5000))
+        registry.withdraw("lender", "USDC", usdc(1000))
+        
+        replayer = ChainReplayer(store.log, os.path.join(tmp.name, "checkpoints"), self._build)
+        replayed, (replayed_registry,) = replayer.state_at()
+        self.assertEqual(replayed.state, ledger.state)
+        self.assertEqual(replayed_registry.export_state(), json.loads(json.dumps(registry.export_state())))
+
+class TestTelemetry(unittest.TestCase):
+    def setUp(self):
+        self.ledger = Ledger()
+        self.pool = LendingPool(self.ledger)
+        self.alice = Wallet()
+        self.ledger.update_balance(self.alice.address, usdc(1000), "USDC")
+        self.ledger.update_balance(self.alice.address, eth(1))
+
+    def _subscribe(self, sink):
+        telemetry.bus.subscribe(sink)
+        self.addCleanup(telemetry.bus.unsubscribe, sink)
+        return sink
+
+    def test_sinks_receive_typed_events(self):
+        ring = self._subscribe(RingBufferSink(capacity=3))
+        metrics = self._subscribe(MetricsSink())
+        with tempfile.TemporaryDirectory() as tmp:
+            ndjson = self._subscribe(NDJSONSink(os.path.join(tmp, "events.ndjson")))
+            self.pool.deposit(self.alice.address, usdc(400))
+            tx = Transaction(self.alice.address, "bob", eth("0.5"))
+            tx.sign(self.alice)
+            self.ledger.process_transaction(tx)
+            self.pool.clock.advance(3600)
+            self.pool.accrue_interest()
+            ndjson.close()
+            with open(ndjson.file.name) as f:
+                lines = [json.loads(line) for line in f]
+        
+        self.assertEqual([line["type"] for line in lines], [
+            "BalanceUpdated", "BalanceUpdated", "PoolAction",
+            "BalanceUpdated", "BalanceUpdated", "TransactionApplied", "InterestAccrued",
+        ])
+        self.assertEqual(lines[2]["amount"], usdc(400))
+        self.assertEqual([type(e).__name__ for e in ring.events], ["BalanceUpdated", "TransactionApplied", "InterestAccrued"])
+        self.assertEqual(metrics.counts["BalanceUpdated"], 4)
+        self.assertEqual(metrics.volumes[("PoolAction", "USDC")], usdc(400))
+        self.assertEqual(metrics.volumes[("BalanceUpdated", "ETH")], eth("0.5"))
+        self.assertEqual(metrics.volumes[("BalanceUpdated", "USDC")], usdc(400))
+
+    def test_profiler_times_hot_paths_and_unpatches(self):
+        original = LendingPool.deposit
+        with Profiler() as profiler:
+            self.assertIsNot(LendingPool.deposit, original)
+            self.pool.deposit(self.alice.address, usdc(10))
+            with self.assertRaises(ValueError):
+                self.pool.deposit(self.alice.address, usdc(10_000))
+            tx = Transaction(self.alice.address, "bob", 1)
+            tx.sign(self.alice)
+            self.ledger.process_transaction(tx)
+        self.assertIs(LendingPool.deposit, original)
+        
+        report = profiler.report()
+        self.assertEqual(report["LendingPool.deposit"]["count"], 2)
+        self.assertEqual(report["LendingPool.deposit"]["errors"], 1)
+        self.assertEqual(report["Ledger.process_transaction"]["count"], 1)
+        self.assertEqual(report["Wallet.verify"]["count"], 1)
+        self.assertLessEqual(report["Wallet.verify"]["p50_us"], report["Wallet.verify"]["max_us"])
+
+class TestWalletDerivation(unittest.TestCase):
+    def test_matches_bip32_hardened_test_vector(self):
+        master = master_key(bytes.fromhex("000102030405060708090a0b0c0d0e0f"))
+        self.assertEqual(master[0], 0xe8f32e723decf4051aefac8e2c93c9c5b214313817cdb01a1494b917c8436b35)
+        self.assertEqual(derive_secret(master, 0), 0xedb2e14f9ee77d26dd93b4ecede8d16ed408ce149b6cd80b0715a2d911a0afea)
+
+    def test_derivation_is_deterministic(self):
+        wallets = Wallet.generate_many(4, seed="sim")
+        self.assertEqual(wallets[2].address, Wallet.derive("sim", 2).address)
+        self.assertEqual(len({w.address for w in wallets}), 4)
+        self.assertNotEqual(Wallet.derive("other", 2).address, wallets[2].address)
+        
+        tx = Transaction(wallets[1].address, "bob", 5)
+        tx.sign(wallets[1])
+        self.assertTrue(tx.is_valid())
+
+    def test_generate_many_in_worker_processes(self):
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            wallets = Wallet.generate_many(6, seed="sim", start=3, executor=executor, workers=2)
+        self.assertEqual([w.address for w in wallets], [Wallet.derive("sim", i).address for i in range(3, 9)])
+
+    def test_key_cache_loads_without_deriving(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = KeyCache(directory)
+            first = Wallet.generate_many(3, seed="sim", cache=cache)
+            with patch("crypto.derive_secret", side_effect=AssertionError("derived")):
+                again = Wallet.generate_many(2, seed="sim", start=1, cache=cache)
+            self.assertEqual([w.address for w in again], [w.address for w in first[1:]])
+            # extending past the cached range derives only the new keys
+            more = Wallet.generate_many(3, seed="sim", start=2, cache=cache)
+            self.assertEqual(more[0].address, first[2].address)
+            self.assertEqual(os.path.getsize(cache.path("sim")), 5 * 96)
+            
+            signature = again[0].sign("msg")
+            self.assertTrue(Wallet.verify("msg", signature, again[0].get_public_key_hex()))
+            with self.assertRaises(ValueError):
+                Wallet.generate_many(1, cache=cache)
+
+    def test_corrupt_cache_entry_is_rejected_on_signing(self):
+        wallet = Wallet.derive("sim", 0)
+        other = Wallet.derive("sim", 1)
+        mismatched = Wallet(wallet.private_key.privkey.secret_multiplier, other.public_key.to_string())
+        with self.assertRaises(ValueError):
+            mismatched.sign("msg")
+
+class TestChainReplay(unittest.TestCase):
+    SCENARIO = {"agents": 10, "steps": 600, "seed": 3, "accrue_every": 50, "price_path": {"start": 2000.0, "volatility": 0.05, "every": 20}}
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def _build(self):
+        ledger = Ledger()
+        return ledger, [LendingPool(ledger)]
+
+    def _path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def test_replay_rebuilds_simulated_history(self):
+        sim = Simulation({**self.SCENARIO, "store": self._path("store")})
+        self.addCleanup(sim.store.log.close)
+        sim.run()
+        replayer = ChainReplayer(sim.store.log, self._path("checkpoints"), self._build, interval=500)
+        stats = replayer.build_checkpoints()
+        self.assertEqual(stats["transactions"], sim.store.log.height)
+        self.assertEqual(stats["checkpoints"], sim.store.log.height // 500)
+        
+        ledger, (pool,) = replayer.state_at()
+        self.assertEqual(ledger.state, sim.ledger.state)
+        self.assertEqual(pool.export_state(), json.loads(json.dumps(sim.pool.export_state())))
+
+    def test_historical_state_replays_from_nearest_checkpoint(self):
+        ledger, (pool,) = self._build()
+        store = Store(self._path("store"))
+        store.open(ledger, [pool])
+        self.addCleanup(store.log.close)
+        alice, bob = Wallet(), Wallet()
+        ledger.mint(alice.address, usdc(10000), "USDC")
+        ledger.mint(bob.address, eth(10), "ETH")
+        history = []
+        pool.deposit(alice.address, usdc(5000))
+        pool.add_collateral(bob.address, eth(2))
+        ledger.process_transaction(pool.transaction(bob, "borrow", usdc(2800), nonce=0))
+        for day in range(1, 6):
+            pool.clock.advance(86400)
+            pool.repay(bob.address, usdc(10))
+            history.append((store.log.height, json.loads(json.dumps([ledger.state, pool.export_state()]))))
+        pool.price_feed.set_price("ETH", 1500.0)
+        pool.liquidate(alice.address, bob.address, usdc(1000))
+        tx = Transaction(bob.address, alice.address, eth("0.5"), nonce=1)
+        tx.sign(bob)
+        ledger.process_transaction(tx)
+        history.append((store.log.height, json.loads(json.dumps([ledger.state, pool.export_state()]))))
+        
+        replayer = ChainReplayer(store.log, self._path("checkpoints"), self._build, interval=4)
+        replayer.build_checkpoints()
+        for height, (state, pool_state) in history:
+            starts = []
+            original = replayer._iter_from
+            with patch.object(replayer, "_iter_from", side_effect=lambda h: starts.append(h) or original(h)):
+                replayed, (replayed_pool,) = replayer.state_at(height)
+            self.assertEqual(starts, [height - height % 4])
+            self.assertEqual(replayed.state, state)
+            self.assertEqual(replayed_pool.export_state(), pool_state)
+        with self.assertRaises(ValueError):
+            replayer.state_at(store.log.height + 1)
+
+    def test_in_memory_chain_holds_ledger_transactions_only(self):
+        ledger, (pool,) = self._build()
+        store = Store(self._path("store"))
+        store.open(ledger, [pool])
+        self.addCleanup(store.log.close)
+        alice = Wallet()
+        ledger.mint(alice.address, usdc(1000), "USDC")
+        ledger.mint(alice.address, eth(1), "ETH")
+        ledger.process_transaction(pool.transaction(alice, "deposit", usdc(1000)))
+        ledger.process_transaction(pool.transaction(alice, "add_collateral", eth(1), nonce=1))
+        ledger.process_transaction(pool.transaction(alice, "borrow", usdc(500), nonce=2))
+        pool.clock.advance(SECONDS_PER_YEAR)
+        pool.accrue_interest()
+        # the accrual input and the direct call go to the log only
+        pool.deposit(alice.address, usdc(10))
+        self.assertEqual([tx.action for tx in ledger.chain], ["mint", "mint", "deposit", "add_collateral", "borrow"])
+        with self.assertRaises(ValueError):
+            ChainReplayer(ledger.chain, self._path("checkpoints"), self._build)
+        
+        replayed, (replayed_pool,) = ChainReplayer(store.log, self._path("checkpoints"), self._build).state_at()
+        self.assertGreater(pool.borrow_index, RAY)
+        self.assertEqual(replayed_pool.export_state(), json.loads(json.dumps(pool.export_state())))
+        self.assertEqual(replayed.state, ledger.state)
+
+    def test_replay_reads_logged_prices_without_touching_the_feed(self):
+        class ReadOnlyFeed:
+            def __init__(self, prices):
+                self.prices = prices
+            def get_price(self, token):
+                return self.prices[token]
+
+        ledger, (pool,) = self._build()
+        store = Store(self._path("store"))
+        store.open(ledger, [pool])
+        ledger.mint("alice", usdc(6000), "USDC")
+        ledger.mint("bob", eth(1), "ETH")
+        pool.deposit("alice", usdc(5000))
+        pool.add_collateral("bob", eth(1))
+        pool.borrow("bob", usdc(1400))
+        pool.price_feed.set_price("ETH", 1600.0)
+        pool.liquidate("alice", "bob", usdc(700))
+        store.log.close()
+        
+        feed = ReadOnlyFeed({"ETH": 2500.0, "USDC": 1.0})
+        def build():
+            replay_ledger = Ledger()
+            return replay_ledger, [LendingPool(replay_ledger, price_feed=feed)]
+        replayed, (replayed_pool,) = ChainReplayer(BlockLog(self._path("store/log")), self._path("checkpoints"), build).state_at()
+        self.assertEqual(replayed_pool.export_state(), json.loads(json.dumps(pool.export_state())))
+        self.assertEqual(feed.prices["ETH"], 2500.0)
+        
+        # a restart replays the tail at the logged price and keeps the live oracle
+        restarted = Ledger()
+        live = LendingPool(restarted, price_feed=StaticPriceFeed({"ETH": 2500.0, "USDC": 1.0}))
+        reopened = Store(self._path("store"))
+        self.addCleanup(reopened.log.close)
+        reopened.open(restarted, [live])
+        self.assertEqual(restarted.state, ledger.state)
+        self.assertEqual(live.get_collateral_price(), 2500.0)
+
+    def test_only_the_mint_authority_can_mint(self):
+        wallet = Wallet()
+        tx = Transaction(wallet.address, wallet.address, eth(1), action="mint", data={"token": "ETH"})
+        tx.sign(wallet)
+        with self.assertRaises(ValueError):
+            Ledger().process_transaction(tx)
+
+class TestSupplyShares(unittest.TestCase):
+    def setUp(self):
+        self.ledger = Ledger()
+        self.pool = LendingPool(self.ledger)
+        for name, amount in (("alice", 3000), ("carol", 1000), ("dave", 1000)):
+            self.ledger.update_balance(name, usdc(amount), "USDC")
+        self.pool.deposit("alice", usdc(3000))
+        self.pool.deposit("carol", usdc(1000))
+        self.ledger.update_balance("bob", eth(2), "ETH")
+        self.pool.add_collateral("bob", eth(2))
+        self.pool.borrow("bob", usdc(2000))
+
+    def test_interest_raises_every_suppliers_balance(self):
+        self.assertEqual(self.pool.supplied_balance("alice"), usdc(3000))
+        self.pool.clock.advance(SECONDS_PER_YEAR)
+        interest = self.pool.get_debt("bob") - usdc(2000)
+        self.assertGreater(interest, 0)
+        
+        alice = self.pool.supplied_balance("alice")
+        carol = self.pool.supplied_balance("carol")
+        self.assertAlmostEqual(alice - usdc(3000), interest * 3 // 4, delta=2)
+        self.assertAlmostEqual(carol - usdc(1000), interest // 4, delta=2)
+        self.assertLessEqual(alice + carol, self.pool.total_liquidity)
+        self.assertEqual(self.pool.get_supply_rate(), ray_mul(self.pool.get_borrow_rate(), self.pool.get_utilization_rate()))
+        
+        # a later depositor buys shares at the higher rate and earns none of the past yield
+        self.pool.deposit("dave", usdc(1000))
+        self.assertLess(self.pool.supplier_shares["dave"], self.pool.supplier_shares["carol"])
+        self.assertAlmostEqual(self.pool.supplied_balance("dave"), usdc(1000), delta=1)
+
+    def test_withdraw_pays_out_principal_and_interest(self):
+        self.pool.clock.advance(SECONDS_PER_YEAR)
+        self.ledger.update_balance("bob", usdc(500), "USDC")
+        self.pool.repay("bob", self.pool.get_debt("bob"))
+        
+        balance = self.pool.supplied_balance("carol")
+        with self.assertRaises(ValueError):
+            self.pool.withdraw("carol", balance + 1)
+        self.pool.withdraw("carol", balance)
+        self.assertEqual(self.ledger.get_balance("carol", "USDC"), balance)
+        self.assertNotIn("carol", self.pool.supplier_shares)
+        self.assertGreater(balance, usdc(1000))
+        
+        self.pool.withdraw("alice", self.pool.supplied_balance("alice"))
+        self.assertEqual(self.pool.total_shares, 0)
+        # only rounding dust is left behind, and it stays with the pool
+        self.assertLess(self.pool.total_liquidity, 10)
+        self.assertEqual(self.ledger.get_balance(self.pool.pool_address, "USDC"), self.pool.total_liquidity)
+
+    def test_withdraw_is_limited_by_cash(self):
+        with self.assertRaises(ValueError):
+            self.pool.withdraw("alice", usdc(2500))
+        self.pool.withdraw("alice", usdc(2000))
+        self.assertEqual(self.pool.supplied_balance("alice"), usdc(1000))
+
+    def test_non_positive_amounts_are_rejected(self):
+        shares = dict(self.pool.supplier_shares)
+        for action in (self.pool.deposit, self.pool.withdraw):
+            for amount in (0, -usdc(1000)):
+                with self.assertRaises(ValueError):
+                    action("mallory", amount)
+                with self.assertRaises(ValueError):
+                    action("alice", amount)
+        self.assertEqual(self.pool.supplier_shares, shares)
+        self.assertEqual(self.ledger.get_balance("mallory", "USDC"), 0)
         
+        # nor through a signed transaction from a fresh key
+        mallory = Wallet()
         with self.assertRaises(ValueError):
-            self.pool.borrow(self.bob.address, 1000) # Max borrow is 150
+            self.ledger.process_transaction(self.pool.transaction(mallory, "withdraw", -usdc(1000)))
+        self.assertEqual(self.ledger.get_balance(mallory.address, "USDC"), 0)
 
 if __name__ == '__main__':
     unittest.main()